@@ -0,0 +1,263 @@
+from __future__ import annotations
+import asyncio
+import os
+import threading
+from concurrent.futures import Future
+from functools import partial
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.utils.cache import ByteLRUCache
+
+try:
+    import httpx
+    _HAS_HTTPX = True
+except Exception:
+    _HAS_HTTPX = False
+
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+class BackendError(Exception):
+    """Non-2xx answer from the backend; carries its status and body"""
+
+    def __init__(self, status_code: int, text: str):
+        super().__init__(f"{status_code}: {text}")
+        self.status_code = status_code
+        self.text = text
+
+
+def _entry_size(entry) -> int:
+    return entry[1]
+
+
+class _DashboardCache:
+    """Short-TTL per-user dashboard payloads, shared by the sync and async clients"""
+
+    def __init__(self, ttl_s: float, max_bytes: int):
+        self.enabled = ttl_s > 0
+        self.store = ByteLRUCache(max_bytes=max_bytes, ttl_s=ttl_s or None, sizer=_entry_size)
+
+    def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        entry = self.store.get(user_id)
+        return dict(entry[0]) if entry is not None else None
+
+    def put(self, user_id: int, payload: Dict[str, Any], nbytes: int) -> None:
+        if self.enabled:
+            self.store.put(user_id, (payload, nbytes + 64))
+
+
+class BackendClient:
+    """
+    Connection-pooled client for the Spring backend.
+
+    One keep-alive Session is shared by every request thread; idempotent GETs
+    are retried with exponential backoff on connection errors and 429/5xx.
+    `get_dashboard` serves from a short-TTL per-user cache and coalesces
+    concurrent misses for the same user into a single round trip.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        timeout: float = 5.0,
+        pool_size: int = 32,
+        retries: int = 2,
+        backoff: float = 0.2,
+        cache_ttl_s: float = 2.0,
+        cache_max_bytes: int = 4 * 1024 * 1024,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset({"GET"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.cache = _DashboardCache(cache_ttl_s, cache_max_bytes)
+        self._lock = threading.Lock()
+        self._in_flight: Dict[int, Future] = {}
+        self._counters = {"requests": 0, "backend_calls": 0, "coalesced": 0, "cache_hits": 0}
+
+    def get_dashboard(self, user_id: int, use_cache: bool = True) -> Dict[str, Any]:
+        uid = int(user_id)
+        with self._lock:
+            self._counters["requests"] += 1
+        if use_cache:
+            cached = self.cache.get(uid)
+            if cached is not None:
+                with self._lock:
+                    self._counters["cache_hits"] += 1
+                return cached
+        with self._lock:
+            fut = self._in_flight.get(uid)
+            owner = fut is None
+            if owner:
+                fut = self._in_flight[uid] = Future()
+            else:
+                self._counters["coalesced"] += 1
+        if not owner:
+            return dict(fut.result())
+        try:
+            payload = self._fetch(uid)
+            fut.set_result(payload)
+            return dict(payload)
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(uid, None)
+
+    def _fetch(self, uid: int) -> Dict[str, Any]:
+        with self._lock:
+            self._counters["backend_calls"] += 1
+        resp = self.session.get(f"{self.base_url}/dashboard/{uid}", timeout=self.timeout)
+        if resp.status_code not in (200, 201):
+            raise BackendError(resp.status_code, resp.text)
+        payload = resp.json()
+        self.cache.put(uid, payload, len(resp.content))
+        return payload
+
+    def invalidate(self, user_id: int) -> None:
+        self.cache.store.pop(int(user_id))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._counters)
+        out["cache"] = self.cache.store.stats()
+        return out
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class AsyncBackendClient:
+    """
+    asyncio counterpart of BackendClient on a pooled httpx.AsyncClient.
+
+    Pass `cache` (e.g. a BackendClient's) to share dashboard payloads between
+    sync and async endpoints. Must be used from a single event loop.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        timeout: float = 5.0,
+        pool_size: int = 32,
+        retries: int = 2,
+        backoff: float = 0.2,
+        cache_ttl_s: float = 2.0,
+        cache_max_bytes: int = 4 * 1024 * 1024,
+        cache: Optional[_DashboardCache] = None,
+    ):
+        if not _HAS_HTTPX:
+            raise RuntimeError("httpx is required for AsyncBackendClient")
+        self.base_url = base_url.rstrip("/")
+        self.retries = retries
+        self.backoff = backoff
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+        self.cache = cache if cache is not None else _DashboardCache(cache_ttl_s, cache_max_bytes)
+        self._in_flight: Dict[int, asyncio.Task] = {}
+        self._counters = {"requests": 0, "backend_calls": 0, "coalesced": 0, "cache_hits": 0}
+
+    async def get_dashboard(self, user_id: int, use_cache: bool = True) -> Dict[str, Any]:
+        uid = int(user_id)
+        self._counters["requests"] += 1
+        if use_cache:
+            cached = self.cache.get(uid)
+            if cached is not None:
+                self._counters["cache_hits"] += 1
+                return cached
+        task = self._in_flight.get(uid)
+        if task is not None:
+            self._counters["coalesced"] += 1
+        else:
+            # the fetch is its own task, so a caller that is cancelled (e.g. its
+            # client disconnected) stops waiting without aborting the others
+            task = self._in_flight[uid] = asyncio.get_running_loop().create_task(self._fetch(uid))
+            task.add_done_callback(partial(self._fetch_done, uid))
+        return dict(await asyncio.shield(task))
+
+    def _fetch_done(self, uid: int, task: "asyncio.Task") -> None:
+        if self._in_flight.get(uid) is task:
+            del self._in_flight[uid]
+        if not task.cancelled():
+            # every waiter may have gone; don't log "exception never retrieved"
+            task.exception()
+
+    async def _fetch(self, uid: int) -> Dict[str, Any]:
+        url = f"{self.base_url}/dashboard/{uid}"
+        self._counters["backend_calls"] += 1
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                resp = await self.client.get(url)
+            except httpx.TransportError:
+                if last:
+                    raise
+            else:
+                if resp.status_code in (200, 201):
+                    payload = resp.json()
+                    self.cache.put(uid, payload, len(resp.content))
+                    return payload
+                if resp.status_code not in RETRY_STATUSES or last:
+                    raise BackendError(resp.status_code, resp.text)
+            await asyncio.sleep(self.backoff * (2 ** attempt))
+        raise AssertionError("unreachable")
+
+    def invalidate(self, user_id: int) -> None:
+        self.cache.store.pop(int(user_id))
+
+    def stats(self) -> Dict[str, Any]:
+        out = dict(self._counters)
+        out["cache"] = self.cache.store.stats()
+        return out
+
+    async def aclose(self) -> None:
+        for task in list(self._in_flight.values()):
+            task.cancel()
+        await self.client.aclose()
+
+
+def backend_client_from_env(default_url: str) -> BackendClient:
+    return BackendClient(
+        base_url=os.getenv("BACKEND_URL", default_url),
+        timeout=float(os.getenv("BACKEND_TIMEOUT_S", "5")),
+        pool_size=int(os.getenv("BACKEND_POOL_SIZE", "32")),
+        retries=int(os.getenv("BACKEND_RETRIES", "2")),
+        backoff=float(os.getenv("BACKEND_BACKOFF_S", "0.2")),
+        cache_ttl_s=float(os.getenv("BACKEND_CACHE_TTL_S", "2")),
+    )
+
+
+def async_backend_client_from_env(default_url: str, cache: Optional[_DashboardCache] = None) -> Optional[AsyncBackendClient]:
+    """An AsyncBackendClient configured like backend_client_from_env, or None without httpx"""
+    if not _HAS_HTTPX or os.getenv("BACKEND_ASYNC", "1") == "0":
+        return None
+    return AsyncBackendClient(
+        base_url=os.getenv("BACKEND_URL", default_url),
+        timeout=float(os.getenv("BACKEND_TIMEOUT_S", "5")),
+        pool_size=int(os.getenv("BACKEND_POOL_SIZE", "32")),
+        retries=int(os.getenv("BACKEND_RETRIES", "2")),
+        backoff=float(os.getenv("BACKEND_BACKOFF_S", "0.2")),
+        cache_ttl_s=float(os.getenv("BACKEND_CACHE_TTL_S", "2")),
+        cache=cache,
+    )
@@ -0,0 +1,492 @@
+from __future__ import annotations
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+    _HAS_FCNTL = True
+except Exception:
+    _HAS_FCNTL = False
+
+# One fixed-width row per purchase. Strings live in a per-user append-only
+# table and rows reference them by index; ts is kept both as the original
+# string (records round-trip exactly) and as int64 ns for numeric work.
+ROW_DTYPE = np.dtype([
+    ("user_id", "<i8"),
+    ("ts_ns", "<i8"),
+    ("amount", "<f8"),
+    ("ts_id", "<i4"),
+    ("merchant_id", "<i4"),
+    ("category_id", "<i4"),
+    ("description_id", "<i4"),
+    ("is_recurring", "u1"),
+])
+NAT_NS = np.iinfo(np.int64).min
+STRING_FIELDS = ("ts", "merchant", "category", "description")
+RECORD_FIELDS = ("user_id", "ts", "merchant", "category", "amount", "is_recurring", "description")
+
+
+def normalize_purchase(p: Dict[str, Any]) -> Dict[str, Any]:
+    """The one record shape stored and returned for a purchase"""
+    return {
+        "user_id": int(p.get("user_id") or p.get("userId") or 0),
+        "ts": str(p.get("ts") or p.get("purchase_time") or ""),
+        "merchant": str(p.get("merchant") or ""),
+        "category": str(p.get("category") or ""),
+        "amount": float(p.get("amount") or 0.0),
+        "is_recurring": bool(p.get("is_recurring") or False),
+        "description": str(p.get("description") or ""),
+    }
+
+
+def _ts_to_ns(ts: str) -> int:
+    if not ts:
+        return NAT_NS
+    t = pd.to_datetime(ts, errors="coerce")
+    return NAT_NS if t is pd.NaT else int(t.value)
+
+
+def _encode_row(rec: Dict[str, Any], strings: List[str], index: Dict[str, int], new_strings: List[str]) -> np.ndarray:
+    rec = normalize_purchase(rec)
+    row = np.zeros(1, dtype=ROW_DTYPE)
+    for field in STRING_FIELDS:
+        s = rec[field]
+        sid = index.get(s)
+        if sid is None:
+            sid = index[s] = len(strings)
+            strings.append(s)
+            new_strings.append(s)
+        row[f"{field}_id"] = sid
+    row["user_id"] = rec["user_id"]
+    row["ts_ns"] = _ts_to_ns(rec["ts"])
+    row["amount"] = rec["amount"]
+    row["is_recurring"] = 1 if rec["is_recurring"] else 0
+    return row
+
+
+class _RowBuffer:
+    """
+    Growable storage shared by a history and the ones appended from it.
+
+    Capacity doubles as rows arrive, so an append writes one row instead of
+    copying them all. Only the history ending at row n may append in place;
+    appending to an older one forks a buffer of its own.
+    """
+
+    __slots__ = ("data", "n", "strings", "index", "strings_bytes", "lock")
+
+    def __init__(self, rows: np.ndarray, strings: List[str], index: Optional[Dict[str, int]]):
+        n = int(rows.shape[0])
+        self.data = np.zeros(max(16, 2 * n), dtype=ROW_DTYPE)
+        self.data[:n] = rows
+        self.n = n
+        self.strings = list(strings)
+        self.index = dict(index) if index is not None else {s: i for i, s in reversed(list(enumerate(self.strings)))}
+        self.strings_bytes = sum(len(s) + 49 for s in self.strings)
+        self.lock = threading.Lock()
+
+    def push(self, record: Dict[str, Any]) -> None:
+        new_strings: List[str] = []
+        row = _encode_row(record, self.strings, self.index, new_strings)
+        if self.n == len(self.data):
+            grown = np.zeros(2 * len(self.data), dtype=ROW_DTYPE)
+            grown[: self.n] = self.data[: self.n]
+            self.data = grown
+        self.data[self.n] = row[0]
+        self.n += 1
+        self.strings_bytes += sum(len(s) + 49 for s in new_strings)
+
+
+class PurchaseHistory:
+    """
+    Columnar view of one user's purchases: structured rows plus their string table.
+
+    Behaves like a read-only list of normalized purchase dicts (len, indexing,
+    slicing, iteration) while holding ~45 bytes per purchase instead of a
+    7-key dict.
+    """
+
+    __slots__ = ("rows", "strings", "_index", "_buf")
+
+    def __init__(self, rows: np.ndarray, strings: List[str]):
+        self.rows = rows
+        self.strings = strings
+        self._index: Optional[Dict[str, int]] = None
+        self._buf: Optional[_RowBuffer] = None
+
+    def __reduce__(self):
+        # just the rows this history covers, not the buffer's spare capacity
+        return PurchaseHistory, (np.ascontiguousarray(self.rows), self.strings)
+
+    def __len__(self) -> int:
+        return int(self.rows.shape[0])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.record(j) for j in range(*i.indices(len(self)))]
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("purchase index out of range")
+        return self.record(i)
+
+    def __iter__(self):
+        return (self.record(i) for i in range(len(self)))
+
+    def appended(self, record: Dict[str, Any]) -> "PurchaseHistory":
+        """New history with one more purchase; this one is left unchanged (amortized O(1))"""
+        n = len(self)
+        buf = self._buf
+        if buf is not None:
+            with buf.lock:
+                if buf.n == n:
+                    buf.push(record)
+                    return self._view(buf, n + 1)
+        # a history loaded from the store, or one that is no longer the latest
+        buf = _RowBuffer(self.rows, self.strings, self._index)
+        buf.push(record)
+        return self._view(buf, n + 1)
+
+    @staticmethod
+    def _view(buf: _RowBuffer, n: int) -> "PurchaseHistory":
+        out = PurchaseHistory(buf.data[:n], buf.strings)
+        out._index, out._buf = buf.index, buf
+        return out
+
+    @property
+    def nbytes(self) -> int:
+        if self._buf is not None:
+            return int(self.rows.nbytes) + self._buf.strings_bytes
+        return int(self.rows.nbytes) + sum(len(s) + 49 for s in self.strings)
+
+    def column(self, name: str) -> np.ndarray:
+        """Numeric column, or the decoded strings for ts/merchant/category/description"""
+        if name in STRING_FIELDS:
+            table = np.asarray(self.strings, dtype=object)
+            return table[self.rows[f"{name}_id"]] if len(table) else np.array([], dtype=object)
+        return self.rows[name]
+
+    def record(self, i: int) -> Dict[str, Any]:
+        r = self.rows[i]
+        s = self.strings
+        return {
+            "user_id": int(r["user_id"]),
+            "ts": s[r["ts_id"]],
+            "merchant": s[r["merchant_id"]],
+            "category": s[r["category_id"]],
+            "amount": float(r["amount"]),
+            "is_recurring": bool(r["is_recurring"]),
+            "description": s[r["description_id"]],
+        }
+
+    def records(self) -> List[Dict[str, Any]]:
+        return [self.record(i) for i in range(len(self))]
+
+    def last(self) -> Optional[Dict[str, Any]]:
+        return self.record(len(self) - 1) if len(self) else None
+
+    def to_frame(self) -> pd.DataFrame:
+        if not len(self):
+            return pd.DataFrame(columns=list(RECORD_FIELDS))
+        return pd.DataFrame({
+            "user_id": self.rows["user_id"].astype(np.int64),
+            "ts": self.column("ts"),
+            "merchant": self.column("merchant"),
+            "category": self.column("category"),
+            "amount": self.rows["amount"].astype(np.float64),
+            "is_recurring": self.rows["is_recurring"].astype(bool),
+            "description": self.column("description"),
+        })
+
+
+class StaleHistory(Exception):
+    """The user's log has rows the caller has not seen (another process appended); reload and retry"""
+
+
+@contextmanager
+def _dir_lock(path: str):
+    """Exclusive cross-process lock on path/LOCK (a no-op without fcntl)"""
+    if not _HAS_FCNTL:
+        yield
+        return
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "LOCK"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class _UserLog:
+    """Open append state for one user: current generation, string index, committed row count"""
+
+    def __init__(self, user_dir: str, repair: bool = True):
+        self.dir = user_dir
+        self.gen = 0
+        self.strings: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.strings_bytes = 0
+        self.n_rows = 0
+        self.refresh(repair)
+
+    @property
+    def rows_path(self) -> str:
+        return os.path.join(self.dir, f"rows.{self.gen}.bin")
+
+    @property
+    def strings_path(self) -> str:
+        return os.path.join(self.dir, f"strings.{self.gen}.jsonl")
+
+    def refresh(self, repair: bool = False) -> None:
+        """
+        Catch up with the files: a new generation, strings and rows appended
+        since the last look. repair=True also truncates torn tails left by a
+        crash mid-append, which only a process holding the write lock may do.
+        """
+        manifest = os.path.join(self.dir, "MANIFEST")
+        gen = 0
+        if os.path.exists(manifest):
+            with open(manifest, "r", encoding="utf-8") as f:
+                gen = int(json.load(f)["gen"])
+        if gen != self.gen:
+            self.gen, self.strings, self.index, self.strings_bytes = gen, [], {}, 0
+        self._load_strings(repair)
+        size = os.path.getsize(self.rows_path) if os.path.exists(self.rows_path) else 0
+        self.n_rows = size // ROW_DTYPE.itemsize
+        if repair and size != self.n_rows * ROW_DTYPE.itemsize:
+            # torn write from a crash mid-append: drop the partial row
+            with open(self.rows_path, "r+b") as f:
+                f.truncate(self.n_rows * ROW_DTYPE.itemsize)
+
+    def _load_strings(self, repair: bool) -> None:
+        if not os.path.exists(self.strings_path):
+            return
+        with open(self.strings_path, "rb") as f:
+            f.seek(self.strings_bytes)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        if repair and end != len(data):
+            with open(self.strings_path, "r+b") as f:
+                f.truncate(self.strings_bytes + end)
+        for line in data[:end].decode("utf-8").splitlines():
+            s = json.loads(line)
+            self.index.setdefault(s, len(self.strings))
+            self.strings.append(s)
+        self.strings_bytes += end
+
+    def append(self, records: Iterable[Dict[str, Any]]) -> int:
+        new_strings: List[str] = []
+        rows = [_encode_row(r, self.strings, self.index, new_strings) for r in records]
+        if not rows:
+            return self.n_rows
+        os.makedirs(self.dir, exist_ok=True)
+        # strings first: a crash after this leaves unreferenced strings, never dangling ids
+        if new_strings:
+            data = "".join(json.dumps(s) + "\n" for s in new_strings).encode("utf-8")
+            with open(self.strings_path, "ab") as f:
+                f.write(data)
+            self.strings_bytes += len(data)
+        with open(self.rows_path, "ab") as f:
+            f.write(np.concatenate(rows).tobytes())
+        self.n_rows += len(rows)
+        return self.n_rows
+
+
+class PurchaseStore:
+    """
+    Append-only columnar purchase history, one directory per user.
+
+    Appends write one fixed-width row (plus any new strings) and never
+    rewrite the file. Reads memory-map the row file straight into a
+    structured NumPy array. `compact` rewrites a user's files into a new
+    generation and switches to it with an atomic MANIFEST replace.
+
+    With shared=True several processes may use the same root: writes take a
+    per-user file lock and first pick up what other processes appended, and
+    reads re-check the files so a process never serves a stale row count.
+    """
+
+    def __init__(self, root: str, max_open: int = 256, shared: bool = False):
+        self.root = root
+        self.max_open = int(max_open)
+        self.shared = bool(shared)
+        self._lock = threading.Lock()
+        self._open: "OrderedDict[int, _UserLog]" = OrderedDict()
+        os.makedirs(root, exist_ok=True)
+
+    def user_dir(self, user_id: int) -> str:
+        return os.path.join(self.root, f"purchases_{int(user_id)}")
+
+    def exists(self, user_id: int) -> bool:
+        return os.path.isdir(self.user_dir(user_id))
+
+    def user_ids(self) -> List[int]:
+        return sorted(
+            int(d.split("_", 1)[1]) for d in os.listdir(self.root)
+            if d.startswith("purchases_") and d.split("_", 1)[1].isdigit() and os.path.isdir(os.path.join(self.root, d))
+        )
+
+    def _log(self, user_id: int) -> _UserLog:
+        uid = int(user_id)
+        log = self._open.get(uid)
+        if log is None:
+            log = self._open[uid] = _UserLog(self.user_dir(uid), repair=not self.shared)
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        elif self.shared:
+            log.refresh()
+        self._open.move_to_end(uid)
+        return log
+
+    @contextmanager
+    def _writing(self, user_id: int):
+        """The user's log, locked against other processes when shared and caught up with their writes"""
+        if not self.shared:
+            yield self._log(user_id)
+            return
+        with _dir_lock(self.user_dir(user_id)):
+            log = self._log(user_id)
+            log.refresh(repair=True)
+            yield log
+
+    def count(self, user_id: int) -> int:
+        """Committed rows for the user (cheap: stats the files, reads no rows)"""
+        with self._lock:
+            return self._log(user_id).n_rows if self.exists(user_id) else 0
+
+    def load(self, user_id: int, mmap: bool = True) -> PurchaseHistory:
+        with self._lock:
+            if not self.exists(user_id):
+                return PurchaseHistory(np.zeros(0, dtype=ROW_DTYPE), [])
+            log = self._log(user_id)
+            n, strings = log.n_rows, list(log.strings)
+            if n == 0:
+                rows = np.zeros(0, dtype=ROW_DTYPE)
+            elif mmap:
+                rows = np.memmap(log.rows_path, dtype=ROW_DTYPE, mode="r", shape=(n,))
+            else:
+                rows = np.fromfile(log.rows_path, dtype=ROW_DTYPE, count=n)
+            return PurchaseHistory(rows, strings)
+
+    def append(self, user_id: int, record: Dict[str, Any], expect_rows: Optional[int] = None) -> int:
+        return self.append_many(user_id, [record], expect_rows)
+
+    def append_many(self, user_id: int, records: Iterable[Dict[str, Any]], expect_rows: Optional[int] = None) -> int:
+        """Append and return the new row count; with expect_rows, raise StaleHistory if the log no longer has that many"""
+        with self._lock, self._writing(user_id) as log:
+            if expect_rows is not None and log.n_rows != int(expect_rows):
+                raise StaleHistory(f"user {int(user_id)} has {log.n_rows} purchases, expected {int(expect_rows)}")
+            return log.append(records)
+
+    def write(self, user_id: int, records: Iterable[Dict[str, Any]]) -> int:
+        """Replace a user's history wholesale (used by migration and compaction)"""
+        with self._lock, self._writing(user_id):
+            return self._write_generation(int(user_id), records)
+
+    def compact(self, user_id: int) -> Dict[str, int]:
+        """Rewrite into a fresh generation: drops unreferenced strings and torn tails"""
+        with self._lock:
+            if not self.exists(user_id):
+                return {"rows": 0, "strings_before": 0, "strings_after": 0}
+            with self._writing(user_id) as log:
+                before = len(log.strings)
+                n = log.n_rows
+                rows = np.fromfile(log.rows_path, dtype=ROW_DTYPE, count=n) if n else np.zeros(0, dtype=ROW_DTYPE)
+                hist = PurchaseHistory(rows, list(log.strings))
+                self._write_generation(int(user_id), hist.records())
+                return {"rows": n, "strings_before": before, "strings_after": len(self._log(user_id).strings)}
+
+    def delete(self, user_id: int) -> None:
+        with self._lock:
+            self._open.pop(int(user_id), None)
+            shutil.rmtree(self.user_dir(user_id), ignore_errors=True)
+
+    def import_jsonl(self, user_id: int, path: str) -> PurchaseHistory:
+        records = []
+        for raw in _read_jsonl(path):
+            try:
+                records.append(normalize_purchase(raw))
+            except Exception:
+                continue
+        self.write(user_id, records)
+        return self.load(user_id)
+
+    def _write_generation(self, uid: int, records: Iterable[Dict[str, Any]]) -> int:
+        user_dir = self.user_dir(uid)
+        os.makedirs(user_dir, exist_ok=True)
+        old = self._open.pop(uid, None) or _UserLog(user_dir)
+        new = _UserLog.__new__(_UserLog)
+        new.dir, new.gen, new.strings, new.index, new.strings_bytes, new.n_rows = user_dir, old.gen + 1, [], {}, 0, 0
+        for p in (new.rows_path, new.strings_path):
+            if os.path.exists(p):
+                os.remove(p)
+        open(new.rows_path, "wb").close()
+        new.append(records)
+        tmp = os.path.join(user_dir, "MANIFEST.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"gen": new.gen}, f)
+        os.replace(tmp, os.path.join(user_dir, "MANIFEST"))
+        for p in (old.rows_path, old.strings_path):
+            if os.path.exists(p):
+                os.remove(p)
+        self._open[uid] = new
+        return new.n_rows
+
+
+def _read_jsonl(path: str) -> Iterable[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line.strip())
+            except Exception:
+                continue
+
+
+def migrate_jsonl_dir(src_dir: str, store: PurchaseStore, remove: bool = False) -> Dict[int, int]:
+    """Import every purchases_{id}.jsonl under src_dir; returns rows written per user"""
+    out: Dict[int, int] = {}
+    for path in sorted(glob.glob(os.path.join(src_dir, "purchases_*.jsonl"))):
+        m = re.match(r"purchases_(\d+)\.jsonl$", os.path.basename(path))
+        if not m:
+            continue
+        uid = int(m.group(1))
+        out[uid] = len(store.import_jsonl(uid, path))
+        if remove:
+            os.remove(path)
+    return out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Purchase store maintenance")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    mig = sub.add_parser("migrate", help="convert purchases_*.jsonl files into the columnar store")
+    mig.add_argument("--src", default=os.getenv("PURCHASE_CACHE_DIR", os.getenv("MODEL_DIR", "./model_artifacts")))
+    mig.add_argument("--dst", default=None)
+    mig.add_argument("--remove", action="store_true", help="delete the JSONL files after import")
+    comp = sub.add_parser("compact", help="compact one user's (or every user's) files")
+    comp.add_argument("--root", default=os.getenv("PURCHASE_CACHE_DIR", os.getenv("MODEL_DIR", "./model_artifacts")))
+    comp.add_argument("--user", type=int, default=None)
+    args = ap.parse_args()
+
+    if args.cmd == "migrate":
+        store = PurchaseStore(args.dst or args.src)
+        for uid, n in migrate_jsonl_dir(args.src, store, remove=args.remove).items():
+            print(f"user={uid} rows={n}")
+    else:
+        store = PurchaseStore(args.root)
+        users = [args.user] if args.user is not None else store.user_ids()
+        for uid in users:
+            print(f"user={uid} {store.compact(uid)}")
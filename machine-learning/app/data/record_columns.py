@@ -0,0 +1,84 @@
+from __future__ import annotations
+import json
+import os
+from typing import Any, Dict, List
+
+import numpy as np
+
+# Lists of flat dicts (e.g. the retrainer's training history) stored column
+# by column in one uncompressed .npz. Each key becomes a typed array; string
+# columns are dictionary-encoded like the purchase store's string table, and
+# anything that is not a plain scalar is kept as its JSON text. Keys missing
+# from a record and None values round-trip through per-column masks.
+FORMAT = 1
+
+
+def _kind(values: List[Any]) -> str:
+    if all(isinstance(v, bool) for v in values):
+        return "bool"
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        return "int"
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        return "float"
+    if all(isinstance(v, str) for v in values):
+        return "str"
+    return "json"
+
+
+def _encode_strings(values: List[str]):
+    index: Dict[str, int] = {}
+    codes = np.fromiter((index.setdefault(v, len(index)) for v in values), dtype=np.int32, count=len(values))
+    return codes, np.array(list(index), dtype=str)
+
+
+def save_records(path: str, records: List[Dict[str, Any]]) -> None:
+    """Write records to path (.npz) via a temp file and os.replace"""
+    names: Dict[str, None] = {}
+    for rec in records:
+        names.update(dict.fromkeys(rec))
+    arrays: Dict[str, np.ndarray] = {}
+    columns = []
+    for i, name in enumerate(names):
+        present = np.fromiter((name in rec for rec in records), dtype=bool, count=len(records))
+        raw = [rec.get(name) for rec in records]
+        null = np.fromiter((v is None for v in raw), dtype=bool, count=len(raw)) & present
+        values = [v for v in raw if v is not None]
+        kind = _kind(values)
+        if kind == "json":
+            values = [json.dumps(v, default=str) for v in values]
+        if kind in ("str", "json"):
+            arrays[f"c{i}"], arrays[f"c{i}_strings"] = _encode_strings(values)
+        else:
+            arrays[f"c{i}"] = np.array(values, dtype={"bool": bool, "int": np.int64, "float": np.float64}[kind])
+        if not present.all():
+            arrays[f"c{i}_present"] = present
+        if null.any():
+            arrays[f"c{i}_null"] = null
+        columns.append({"name": name, "kind": kind})
+
+    header = {"format": FORMAT, "n": len(records), "columns": columns}
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, header=np.array(json.dumps(header)), **arrays)
+    os.replace(tmp, path)
+
+
+def load_records(path: str) -> List[Dict[str, Any]]:
+    with np.load(path, allow_pickle=False) as z:
+        header = json.loads(str(z["header"]))
+        n = int(header["n"])
+        records: List[Dict[str, Any]] = [{} for _ in range(n)]
+        for i, col in enumerate(header["columns"]):
+            name, kind = col["name"], col["kind"]
+            if kind in ("str", "json"):
+                values = z[f"c{i}_strings"][z[f"c{i}"]].tolist()
+                if kind == "json":
+                    values = [json.loads(v) for v in values]
+            else:
+                values = z[f"c{i}"].tolist()
+            present = z[f"c{i}_present"] if f"c{i}_present" in z.files else np.ones(n, dtype=bool)
+            null = z[f"c{i}_null"] if f"c{i}_null" in z.files else np.zeros(n, dtype=bool)
+            it = iter(values)
+            for rec, p, is_null in zip(records, present.tolist(), null.tolist()):
+                if p:
+                    rec[name] = None if is_null else next(it)
+    return records
@@ -0,0 +1,123 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Optional
+import numpy as np
+
+from app.data.purchase_store import NAT_NS, PurchaseHistory, _ts_to_ns
+from app.utils.cache import ByteLRUCache
+
+DAY_NS = 86_400 * 10**9
+HISTORY_DAYS = 60
+
+
+class DailySpend:
+    """
+    Daily spend totals for the `days` days ending on the latest purchase's day.
+
+    Days are bucketed on the stored timestamp (tz-aware values by UTC day).
+    `values` is empty when no purchase has a parseable timestamp.
+    """
+
+    __slots__ = ("values", "last_day", "n_purchases")
+
+    def __init__(self, values: np.ndarray, last_day: Optional[int], n_purchases: int):
+        self.values = values
+        self.last_day = last_day
+        self.n_purchases = n_purchases
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.values.nbytes) + 64
+
+    def history(self, fill_empty: bool = False, days: int = HISTORY_DAYS) -> List[float]:
+        """The series as a list; with fill_empty, `days` zeros when there is no data"""
+        if not len(self.values) and fill_empty:
+            return [0.0] * days
+        return self.values.tolist()
+
+    def advanced(self, ts_ns: int, amount: float) -> "DailySpend":
+        """Series after one more purchase, without rescanning the history"""
+        n = self.n_purchases + 1
+        if ts_ns == NAT_NS:
+            return DailySpend(self.values, self.last_day, n)
+        amount = 0.0 if amount != amount else float(amount)
+        day = int(ts_ns // DAY_NS)
+        if self.last_day is None:
+            values = np.zeros(HISTORY_DAYS, dtype=np.float64)
+            values[-1] = amount
+            return DailySpend(values, day, n)
+        days = len(self.values)
+        shift = day - self.last_day
+        if shift > 0:
+            values = np.zeros(days, dtype=np.float64)
+            if shift < days:
+                values[: days - shift] = self.values[shift:]
+            values[-1] += amount
+            return DailySpend(values, day, n)
+        pos = days - 1 + shift
+        values = self.values.copy()
+        if pos >= 0:
+            values[pos] += amount
+        return DailySpend(values, self.last_day, n)
+
+
+def daily_spend_from_arrays(ts_ns: np.ndarray, amount: np.ndarray, days: int = HISTORY_DAYS) -> DailySpend:
+    n = int(len(ts_ns))
+    valid = ts_ns != NAT_NS
+    if not valid.any():
+        return DailySpend(np.zeros(0, dtype=np.float64), None, n)
+    ts = ts_ns[valid]
+    amt = np.asarray(amount, dtype=np.float64)[valid]
+    amt = np.where(np.isnan(amt), 0.0, amt)
+    # sum each day in time order, as resample("D").sum() over a ts-sorted frame does
+    order = np.argsort(ts, kind="stable")
+    day = ts[order] // DAY_NS
+    last_day = int(day[-1])
+    pos = days - 1 - (last_day - day)
+    keep = pos >= 0
+    values = np.bincount(pos[keep], weights=amt[order][keep], minlength=days).astype(np.float64)
+    return DailySpend(values, last_day, n)
+
+
+def daily_spend_from_history(hist: PurchaseHistory, days: int = HISTORY_DAYS) -> DailySpend:
+    return daily_spend_from_arrays(np.asarray(hist.rows["ts_ns"]), np.asarray(hist.rows["amount"]), days)
+
+
+def daily_spend_from_records(records: Iterable[Dict[str, Any]], days: int = HISTORY_DAYS) -> DailySpend:
+    records = list(records)
+    ts_ns = np.array([_ts_to_ns(str(r.get("ts") or r.get("purchase_time") or "")) for r in records], dtype=np.int64)
+    amount = np.array([float(r.get("amount") or 0.0) for r in records], dtype=np.float64)
+    return daily_spend_from_arrays(ts_ns, amount, days)
+
+
+class DailySpendCache:
+    """
+    Per-user DailySpend memo.
+
+    A lookup for a history that grew by exactly one purchase since the cached
+    series is answered by `advanced`; anything else recomputes in one pass.
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, ttl_s: Optional[float] = None):
+        self.cache = ByteLRUCache(max_bytes=max_bytes, ttl_s=ttl_s, sizer=lambda d: d.nbytes)
+        self.counters = {"full": 0, "incremental": 0}
+
+    def get(self, user_id: int, hist: PurchaseHistory) -> DailySpend:
+        n = len(hist)
+        cached = self.cache.get(int(user_id))
+        if cached is not None and cached.n_purchases == n:
+            return cached
+        if cached is not None and cached.n_purchases == n - 1:
+            row = hist.rows[n - 1]
+            out = cached.advanced(int(row["ts_ns"]), float(row["amount"]))
+            self.counters["incremental"] += 1
+        else:
+            out = daily_spend_from_history(hist)
+            self.counters["full"] += 1
+        self.cache.put(int(user_id), out)
+        return out
+
+    def pop(self, user_id: int) -> None:
+        self.cache.pop(int(user_id))
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.cache.stats(), **self.counters}
@@ -1,5 +1,9 @@
 from __future__ import annotations
-from typing import List, Dict
+import re
+import threading
+from functools import lru_cache
+from typing import List, Dict, Optional
+import numpy as np
 import pandas as pd
 
 
@@ -34,47 +38,96 @@ _ALIASES: Dict[str, str] = {
 }
 
 
+# Substring rules in the order _to_canon_category has always applied them:
+# every alias key (dict order), then the keyword fallbacks. The first needle
+# found anywhere in the string wins, regardless of where it occurs.
+_KEYWORD_RULES: List[tuple] = (
+    [(k, v) for k, v in _ALIASES.items()]
+    + [(t, "rent") for t in ["rent", "mortgage"]]
+    + [(t, "utilities") for t in ["power", "gas", "water", "internet", "wifi", "electric", "utility"]]
+    + [(t, "restaurants") for t in [
+        "restaurant", "resturant", "cafe", "coffee", "eat", "food", "deli", "pizza", "bar", "grill", "dash", "eats"
+    ]]
+    + [(t, "entertainment") for t in ["movie", "netflix", "spotify", "concert", "amc", "theatre"]]
+    + [(t, "groceries") for t in ["grocery", "mart", "market", "costco", "target", "walmart", "trader joe", "whole foods"]]
+)
+
+
+def _compile_rules(rules: List[tuple]):
+    seen, needles, labels = set(), [], []
+    for needle, label in rules:
+        if needle not in seen:  # a repeated needle can never win after its first occurrence
+            seen.add(needle)
+            needles.append(needle)
+            labels.append(label)
+    # one lookahead per needle, tried in priority order at the start of the string
+    pattern = "^(?:" + "|".join(f"(?=.*?({re.escape(n)}))" for n in needles) + ")"
+    return re.compile(pattern, re.DOTALL), labels
+
+
+_RULE_RE, _RULE_LABELS = _compile_rules(_KEYWORD_RULES)
+
+
+@lru_cache(maxsize=65536)
+def _canon_normalized(s: str) -> str:
+    """Canonical category of an already stripped + lowercased string"""
+    if s in _ALIASES:
+        return _ALIASES[s]
+    m = _RULE_RE.match(s)
+    return _RULE_LABELS[m.lastindex - 1] if m else "other"
+
+
 def _to_canon_category(raw: str) -> str:
     if not raw:
         return "other"
-    s = raw.strip().lower()
-    if s in _ALIASES:
-        return _ALIASES[s]
-    for k, v in _ALIASES.items():
-        if k in s:
-            return v
-    if "rent" in s or "mortgage" in s:
-        return "rent"
-    if any(t in s for t in ["power", "gas", "water", "internet", "wifi", "electric", "utility"]):
-        return "utilities"
-    if any(t in s for t in [
-        "restaurant", "resturant", "cafe", "coffee", "eat", "food", "deli", "pizza", "bar", "grill", "dash", "eats"
-    ]):
-        return "restaurants"
-    if any(t in s for t in ["movie", "netflix", "spotify", "concert", "amc", "theatre"]):
-        return "entertainment"
-    if any(t in s for t in ["grocery", "mart", "market", "costco", "target", "walmart", "trader joe", "whole foods"]):
-        return "groceries"
-    return "other"
+    return _canon_normalized(raw.strip().lower())
 
 
 def canonicalize_categories(df: pd.DataFrame) -> pd.DataFrame:
     df = df.copy()
-    src = df["category"].fillna("") + " " + df["merchant"].fillna("")
-    df["canon_category"] = src.apply(_to_canon_category)
+    # classify each distinct (category, merchant) pair once, then broadcast
+    cat_codes, cats = pd.factorize(df["category"].fillna(""))
+    mer_codes, mers = pd.factorize(df["merchant"].fillna(""))
+    pair_codes, pairs = pd.factorize(cat_codes.astype(np.int64) * (len(mers) + 1) + mer_codes)
+    src = [f"{cats[p // (len(mers) + 1)]} {mers[p % (len(mers) + 1)]}".strip().lower() for p in pairs]
+    labels = np.array([_canon_normalized(s) for s in src], dtype=object)
+    df["canon_category"] = labels[pair_codes]
     return df
 
 
+def parse_timestamps(ts: pd.Series) -> pd.Series:
+    """
+    Parse a column of timestamps the way pd.to_datetime parses a single value.
+
+    pd.to_datetime on a whole column infers one format from the first value and
+    coerces rows in any other format to NaT; stored histories mix "T" and " "
+    separators, so parse element-wise instead.
+    """
+    if pd.api.types.is_datetime64_any_dtype(ts):
+        return ts
+    try:
+        out = pd.to_datetime(ts, errors="coerce", format="mixed")
+        if pd.api.types.is_datetime64_any_dtype(out):
+            return out
+    except (ValueError, TypeError):
+        pass
+    # mixed timezone offsets: keep each value's local wall time, as a 1-row parse would
+    uniq = {v: pd.to_datetime(v, errors="coerce") for v in pd.unique(ts)}
+    local = {v: (t.tz_localize(None) if t is not pd.NaT and t.tzinfo is not None else t) for v, t in uniq.items()}
+    return pd.to_datetime(ts.map(local), errors="coerce")
+
+
 def get_feature_columns() -> List[str]:
     onehots = [f"cat_{c}" for c in CANON_CATS]
     base = ["dow", "hour", "month", "amount", "is_recurring", "income", "is_discretionary", "delta_vs_cat"]
     return base + onehots
 
 
-def make_purchase_features(purchases: pd.DataFrame, income: float) -> pd.DataFrame:
+def _featurize(purchases: pd.DataFrame, income, roll_window: int, by: Optional[str] = None) -> pd.DataFrame:
+    """Working frame holding every feature column (plus the inputs), or an empty frame"""
     df = purchases.copy()
     if df.empty:
-        return pd.DataFrame(columns=get_feature_columns())
+        return df
 
     df["ts"] = pd.to_datetime(df["ts"], errors="coerce")
     df["dow"] = df["ts"].dt.dayofweek.fillna(0).astype(int)
@@ -89,17 +142,91 @@ def make_purchase_features(purchases: pd.DataFrame, income: float) -> pd.DataFra
     essentials = {"rent", "utilities", "groceries"}
     df["is_discretionary"] = (~df["canon_category"].isin(essentials)).astype(int)
 
-    df["cat_roll_avg"] = df.groupby("canon_category")["amount"].transform(
-        lambda s: s.rolling(20, min_periods=1).mean()
-    )
+    if roll_window <= 1:
+        df["cat_roll_avg"] = df["amount"]
+    elif by is None:
+        df["cat_roll_avg"] = df.groupby("canon_category")["amount"].transform(
+            lambda s: s.rolling(roll_window, min_periods=1).mean()
+        )
+    else:
+        # many small groups: one grouped rolling pass instead of a lambda per group
+        keys = [df[by].reset_index(drop=True), df["canon_category"].reset_index(drop=True)]
+        grouped = df["amount"].reset_index(drop=True).groupby(keys, sort=False, dropna=False)
+        rolled = grouped.rolling(roll_window, min_periods=1).mean()
+        df["cat_roll_avg"] = rolled.droplevel([0, 1]).sort_index().to_numpy()
     df["delta_vs_cat"] = (df["amount"] - df["cat_roll_avg"]).fillna(0.0)
 
-    df["income"] = float(income)
+    df["income"] = np.asarray(income, dtype=float) if np.ndim(income) else float(income)
 
     for c in CANON_CATS:
         df[f"cat_{c}"] = (df["canon_category"] == c).astype(int)
+    return df
+
 
+def make_purchase_features(
+    purchases: pd.DataFrame, income, roll_window: int = 20, by: Optional[str] = None
+) -> pd.DataFrame:
+    """
+    income is a scalar or one value per row. roll_window sets the per-category
+    rolling mean behind delta_vs_cat; 1 scores each row on its own. With
+    by="user_id" the rolling mean runs per user (and category), so a frame of
+    many users' purchases featurizes as each user's rows would on their own.
+    """
+    df = _featurize(purchases, income, roll_window, by)
+    if df.empty:
+        return pd.DataFrame(columns=get_feature_columns())
     feats = df[get_feature_columns()].copy()
     return feats
 
 
+class FeatureBuffer:
+    """
+    Reusable C-contiguous float32 matrix with one column per feature.
+
+    `take(n)` returns an (n, n_features) view that stays valid until the next
+    take; the backing array only grows. Not thread-safe: use one per thread
+    (see thread_feature_buffer).
+    """
+
+    def __init__(self, n_features: Optional[int] = None, rows: int = 0):
+        self.n_features = int(n_features or len(get_feature_columns()))
+        self.array = np.empty((int(rows), self.n_features), dtype=np.float32)
+
+    def take(self, n: int) -> np.ndarray:
+        n = int(n)
+        if n > self.array.shape[0]:
+            self.array = np.empty((max(n, 2 * self.array.shape[0], 64), self.n_features), dtype=np.float32)
+        return self.array[:n]
+
+
+_buffers = threading.local()
+
+
+def thread_feature_buffer() -> FeatureBuffer:
+    """This thread's shared FeatureBuffer"""
+    buf = getattr(_buffers, "buf", None)
+    if buf is None:
+        buf = _buffers.buf = FeatureBuffer()
+    return buf
+
+
+def make_feature_matrix(
+    purchases: pd.DataFrame,
+    income,
+    roll_window: int = 20,
+    out: Optional[FeatureBuffer] = None,
+    by: Optional[str] = None,
+) -> np.ndarray:
+    """
+    make_purchase_features as a float32 (rows, features) matrix in
+    get_feature_columns() order, written column by column into `out` (or a
+    fresh array) without building the feature DataFrame.
+    """
+    cols = get_feature_columns()
+    df = _featurize(purchases, income, roll_window, by)
+    X = out.take(len(df)) if out is not None else np.empty((len(df), len(cols)), dtype=np.float32)
+    if not len(df):
+        return X
+    for j, c in enumerate(cols):
+        X[:, j] = df[c].to_numpy()
+    return X
@@ -0,0 +1,335 @@
+from __future__ import annotations
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+import numpy as np
+import pandas as pd
+
+from app.data.purchase_store import PurchaseHistory
+from app.features.featureizer import (
+    CANON_CATS,
+    FeatureBuffer,
+    _to_canon_category,
+    get_feature_columns,
+    make_purchase_features,
+    parse_timestamps,
+)
+from app.utils.cache import ByteLRUCache
+from app.utils.telemetry import get_logger
+
+log = get_logger("features")
+
+FEATURE_COLUMNS = get_feature_columns()
+_COL = {c: i for i, c in enumerate(FEATURE_COLUMNS)}
+_INT_COLUMNS = {c for c in FEATURE_COLUMNS if c not in ("amount", "income", "delta_vs_cat")}
+_CAT_INDEX = {c: i for i, c in enumerate(CANON_CATS)}
+_ESSENTIALS = {"rent", "utilities", "groceries"}
+
+
+def batch_features(hist: PurchaseHistory, income=0.0, roll_window: int = 20) -> pd.DataFrame:
+    """make_purchase_features over a whole history, timestamps parsed per value"""
+    df = hist.to_frame()
+    if df.empty:
+        return pd.DataFrame(columns=FEATURE_COLUMNS)
+    df["ts"] = parse_timestamps(df["ts"])
+    return make_purchase_features(df, income=income, roll_window=roll_window)
+
+
+class IncrementalFeatures:
+    """
+    Purchase features for one user's history, extended one purchase at a time.
+
+    Keeps the last `window` amounts of each canonical category in a ring
+    buffer, so delta_vs_cat for a new purchase costs O(window) regardless of
+    history length. Rows match make_purchase_features on the same history;
+    income is filled in by `frame`.
+    """
+
+    def __init__(self, window: int = 20):
+        self.window = int(window)
+        self.ring = np.zeros((len(CANON_CATS), self.window), dtype=np.float64)
+        self.seen = np.zeros(len(CANON_CATS), dtype=np.int64)
+        self.rows = np.zeros((0, len(FEATURE_COLUMNS)), dtype=np.float64)
+        self.n_rows = 0
+        self.last_key: Optional[tuple] = None
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.ring.nbytes + self.seen.nbytes + self.rows.nbytes) + 256
+
+    @classmethod
+    def from_history(cls, hist: PurchaseHistory, window: int = 20) -> "IncrementalFeatures":
+        """Cold start: one batch featurizer pass, then seed the ring buffers from its rows"""
+        state = cls(window)
+        feats = batch_features(hist, roll_window=window)
+        n = len(feats)
+        if not n:
+            return state
+        state._reserve(n)
+        state.rows[:n] = feats.to_numpy(dtype=np.float64)
+        state.n_rows = n
+        cats = np.argmax(state.rows[:n, [_COL[f"cat_{c}"] for c in CANON_CATS]], axis=1)
+        amounts = state.rows[:n, _COL["amount"]]
+        for k in range(len(CANON_CATS)):
+            mine = amounts[cats == k]
+            state.seen[k] = len(mine)
+            tail = mine[-state.window:]
+            slots = (np.arange(len(mine) - len(tail), len(mine))) % state.window
+            state.ring[k, slots] = tail
+        state.last_key = _row_key(hist, n - 1)
+        return state
+
+    def _reserve(self, n: int) -> None:
+        if n > len(self.rows):
+            grown = np.zeros((max(n, 2 * len(self.rows), 16), len(FEATURE_COLUMNS)), dtype=np.float64)
+            grown[: self.n_rows] = self.rows[: self.n_rows]
+            self.rows = grown
+
+    def push(self, record: Dict[str, Any]) -> np.ndarray:
+        """Append one normalized purchase record and return its feature row"""
+        row = np.zeros(len(FEATURE_COLUMNS), dtype=np.float64)
+        ts = pd.to_datetime(record.get("ts") or None, errors="coerce")
+        if ts is not pd.NaT and ts is not None:
+            row[_COL["dow"]], row[_COL["hour"]], row[_COL["month"]] = ts.dayofweek, ts.hour, ts.month
+        else:
+            row[_COL["month"]] = 1
+        canon = _to_canon_category(f"{record.get('category') or ''} {record.get('merchant') or ''}")
+        amount = float(record.get("amount") or 0.0)
+        amount = 0.0 if amount != amount else amount
+        k = _CAT_INDEX[canon]
+        self.ring[k, self.seen[k] % self.window] = amount
+        self.seen[k] += 1
+        filled = min(int(self.seen[k]), self.window)
+        roll_avg = float(np.mean(self.ring[k, :filled]))
+
+        row[_COL["amount"]] = amount
+        row[_COL["is_recurring"]] = 1.0 if record.get("is_recurring") else 0.0
+        row[_COL["is_discretionary"]] = 0.0 if canon in _ESSENTIALS else 1.0
+        row[_COL["delta_vs_cat"]] = amount - roll_avg
+        row[_COL[f"cat_{canon}"]] = 1.0
+
+        self._reserve(self.n_rows + 1)
+        self.rows[self.n_rows] = row
+        self.n_rows += 1
+        return row
+
+    def extend(self, hist: PurchaseHistory) -> int:
+        """Consume rows of `hist` past the ones already seen; returns how many"""
+        start = self.n_rows
+        for i in range(start, len(hist)):
+            self.push(hist.record(i))
+        if len(hist) > start:
+            self.last_key = _row_key(hist, len(hist) - 1)
+        return len(hist) - start
+
+    def matches(self, hist: PurchaseHistory) -> bool:
+        """Whether hist still starts with the purchases this state has consumed"""
+        if self.n_rows > len(hist):
+            return False
+        return self.n_rows == 0 or self.last_key == _row_key(hist, self.n_rows - 1)
+
+    def frame(self, income=0.0) -> pd.DataFrame:
+        if not self.n_rows:
+            return pd.DataFrame(columns=FEATURE_COLUMNS)
+        rows = self.rows[: self.n_rows]
+        cols = {c: rows[:, i].astype(int) if c in _INT_COLUMNS else rows[:, i].copy() for c, i in _COL.items()}
+        cols["income"] = np.broadcast_to(np.asarray(income, dtype=float), (self.n_rows,)).copy()
+        return pd.DataFrame(cols, columns=FEATURE_COLUMNS)
+
+    def matrix(self, income=0.0, out: Optional[FeatureBuffer] = None) -> np.ndarray:
+        """The rows as a float32 matrix (see make_feature_matrix), written into `out` if given"""
+        X = out.take(self.n_rows) if out is not None else np.empty((self.n_rows, len(FEATURE_COLUMNS)), dtype=np.float32)
+        X[:] = self.rows[: self.n_rows]
+        X[:, _COL["income"]] = income
+        return X
+
+    # Snapshot layout: feature rows are appended to rows.bin, and state.npz
+    # (ring buffers, counts, row count) is replaced atomically after them, so
+    # a crash between the two leaves trailing rows that the next load ignores.
+
+    def save(self, path: str, appended: Optional[int] = None) -> None:
+        """Persist to directory `path`; `appended` rows are added to rows.bin, otherwise it is rewritten"""
+        os.makedirs(path, exist_ok=True)
+        rows_path = os.path.join(path, "rows.bin")
+        kept = (self.n_rows - (appended or 0)) * self.rows.shape[1] * self.rows.itemsize
+        if appended is None or not os.path.exists(rows_path) or os.path.getsize(rows_path) != kept:
+            with open(rows_path, "wb") as f:
+                f.write(self.rows[: self.n_rows].tobytes())
+        elif appended:
+            with open(rows_path, "ab") as f:
+                f.write(self.rows[self.n_rows - appended: self.n_rows].tobytes())
+        tmp = os.path.join(path, "state.tmp.npz")
+        np.savez(
+            tmp,
+            window=np.array(self.window),
+            ring=self.ring,
+            seen=self.seen,
+            n_rows=np.array(self.n_rows),
+            last_ts_ns=np.array(self.last_key[0] if self.last_key else 0, dtype=np.int64),
+            last_amount=np.array(self.last_key[1] if self.last_key else 0.0, dtype=np.float64),
+        )
+        os.replace(tmp, os.path.join(path, "state.npz"))
+
+    @classmethod
+    def load(cls, path: str) -> Optional["IncrementalFeatures"]:
+        state_path = os.path.join(path, "state.npz")
+        rows_path = os.path.join(path, "rows.bin")
+        if not (os.path.exists(state_path) and os.path.exists(rows_path)):
+            return None
+        try:
+            with np.load(state_path, allow_pickle=False) as z:
+                state = cls(int(z["window"]))
+                state.ring, state.seen, n = z["ring"], z["seen"], int(z["n_rows"])
+                key = (int(z["last_ts_ns"]), float(z["last_amount"]))
+            if state.ring.shape != (len(CANON_CATS), state.window):
+                return None
+            rows = np.fromfile(rows_path, dtype=np.float64, count=n * len(FEATURE_COLUMNS))
+            if rows.size != n * len(FEATURE_COLUMNS):
+                return None
+            state.rows = rows.reshape(n, len(FEATURE_COLUMNS))
+            state.n_rows = n
+            state.last_key = key if n else None
+            return state
+        except Exception as e:
+            log.warning(f"Error loading feature snapshot {path}: {e}")
+            return None
+
+
+def _row_key(hist: PurchaseHistory, i: int) -> tuple:
+    r = hist.rows[i]
+    return int(r["ts_ns"]), float(r["amount"])
+
+
+def consistency_check(hist: PurchaseHistory, state: IncrementalFeatures, atol: float = 1e-9) -> Dict[str, Any]:
+    """Compare incremental rows with a fresh batch featurizer pass over the same history"""
+    ref = batch_features(hist, roll_window=state.window)
+    got = state.frame()
+    if len(ref) != len(got):
+        return {"ok": False, "rows": len(got), "batch_rows": len(ref), "max_abs_diff": None, "columns": []}
+    if not len(ref):
+        return {"ok": True, "rows": 0, "batch_rows": 0, "max_abs_diff": 0.0, "columns": []}
+    diff = np.abs(ref.to_numpy(dtype=np.float64) - got.to_numpy(dtype=np.float64))
+    bad = [c for c, d in zip(FEATURE_COLUMNS, diff.max(axis=0)) if d > atol]
+    return {"ok": not bad, "rows": len(got), "batch_rows": len(ref), "max_abs_diff": float(diff.max()), "columns": bad}
+
+
+class IncrementalFeatureCache:
+    """
+    Per-user IncrementalFeatures, in memory and (optionally) snapshotted under snapshot_dir.
+
+    A history that only grew since the cached state is extended row by row;
+    a rewritten or shorter one is rebuilt with the batch featurizer. With
+    check_every=N, every Nth extension is compared with the batch output and
+    the state is rebuilt on mismatch.
+    """
+
+    def __init__(
+        self,
+        snapshot_dir: Optional[str] = None,
+        max_bytes: int = 32 * 1024 * 1024,
+        ttl_s: Optional[float] = None,
+        window: int = 20,
+        check_every: int = 0,
+    ):
+        self.snapshot_dir = snapshot_dir
+        self.window = int(window)
+        self.check_every = int(check_every)
+        self.cache = ByteLRUCache(max_bytes=max_bytes, ttl_s=ttl_s, sizer=lambda s: s.nbytes)
+        self.counters = {"full": 0, "incremental": 0, "snapshot_loads": 0, "checks": 0, "check_failures": 0}
+        # _lock guards the counters and the per-user lock table only; each
+        # user's state is read, extended or rebuilt under that user's lock, so
+        # one user's cold rebuild does not stall every other user's request
+        self._lock = threading.Lock()
+        self._user_locks: Dict[int, list] = {}
+
+    def _path(self, user_id: int) -> Optional[str]:
+        return os.path.join(self.snapshot_dir, f"features_{int(user_id)}") if self.snapshot_dir else None
+
+    @contextmanager
+    def _user_lock(self, uid: int) -> Iterator[None]:
+        with self._lock:
+            entry = self._user_locks.get(uid)
+            if entry is None:
+                entry = self._user_locks[uid] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    self._user_locks.pop(uid, None)
+
+    def _count(self, key: str) -> int:
+        with self._lock:
+            self.counters[key] += 1
+            return self.counters[key]
+
+    def get(self, user_id: int, hist: PurchaseHistory) -> IncrementalFeatures:
+        """
+        The user's state, caught up with hist. It is shared: another request
+        for the same user may extend it once this returns, so use `matrix`
+        to read the rows for this hist.
+        """
+        uid = int(user_id)
+        with self._user_lock(uid):
+            return self._current(uid, hist)
+
+    def matrix(self, user_id: int, hist: PurchaseHistory, income=0.0, out: Optional[FeatureBuffer] = None) -> np.ndarray:
+        """hist's feature matrix (see IncrementalFeatures.matrix), copied out under the user's lock"""
+        uid = int(user_id)
+        with self._user_lock(uid):
+            return self._current(uid, hist).matrix(income, out)
+
+    def _current(self, uid: int, hist: PurchaseHistory) -> IncrementalFeatures:
+        path = self._path(uid)
+        state = self.cache.get(uid)
+        if state is None and path:
+            state = IncrementalFeatures.load(path)
+            if state is not None:
+                self._count("snapshot_loads")
+        if state is not None and state.window == self.window and state.matches(hist):
+            added = state.extend(hist)
+            if added:
+                n = self._count("incremental")
+                if path:
+                    state.save(path, appended=added)
+                if self.check_every and n % self.check_every == 0:
+                    state = self._checked(uid, hist, state)
+        else:
+            state = self._rebuild(uid, hist)
+        self.cache.put(uid, state)
+        return state
+
+    def _rebuild(self, uid: int, hist: PurchaseHistory) -> IncrementalFeatures:
+        state = IncrementalFeatures.from_history(hist, self.window)
+        self._count("full")
+        path = self._path(uid)
+        if path:
+            state.save(path)
+        return state
+
+    def _checked(self, uid: int, hist: PurchaseHistory, state: IncrementalFeatures) -> IncrementalFeatures:
+        self._count("checks")
+        report = consistency_check(hist, state)
+        if report["ok"]:
+            return state
+        self._count("check_failures")
+        log.warning(f"incremental features diverged for user {uid}: {report}")
+        return self._rebuild(uid, hist)
+
+    def pop(self, user_id: int) -> None:
+        uid = int(user_id)
+        with self._user_lock(uid):
+            self.cache.pop(uid)
+            path = self._path(uid)
+            if path:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+        return {**self.cache.stats(), **counters}
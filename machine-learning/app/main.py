@@ -1,27 +1,70 @@
 from __future__ import annotations
-import os,json,joblib,pandas as pd,numpy as np
+import os,json,time,joblib,pandas as pd,numpy as np
 from typing import List,Dict,Any,Optional,Literal
 from datetime import datetime,date
 from decimal import Decimal
-import requests
-from fastapi import FastAPI,HTTPException,Header
+from fastapi import FastAPI,HTTPException,Header,Request
+from fastapi.responses import StreamingResponse,JSONResponse,Response
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from app.models.lstm_forecaster import forecast_daily_spend,get_forecaster
+from app.models.lstm_forecaster import forecast_daily_spend,get_forecaster,forecaster_pool,serving_forecaster
+from app.models.global_forecaster import load_global_forecaster,history_category_mix
 from app.models.planner import project_savings_money,build_money_trajectory
-from app.models.model_retrainer import model_retrainer
-from app.features.featureizer import make_purchase_features,get_feature_columns
+from app.models.model_retrainer import model_retrainer,ModelRetrainer
+from app.models.registry import ModelRegistry
+from app.models.artifact_store import ArtifactStore,ArtifactWatcher
+from app.models.graph_jobs import graph_models
+from app.models.batch_scorer import parse_json_body,parse_ndjson_stream,purchases_frame,score_frame
+from app.features.featureizer import get_feature_columns
 from app.models.gbm import GBMRegressor
 from app.utils.scoring import money_correlation_score
+from app.models.train_scheduler import scheduler_from_env
+from app.data.purchase_store import PurchaseStore,PurchaseHistory,StaleHistory,normalize_purchase
+from app.utils.cache import ByteLRUCache,fingerprint,etag_matches
+from concurrent.futures.process import BrokenProcessPool
+from app.utils.cpu_pool import PoolSaturated,cpu_pool_from_env
+from app.utils.workers import TrainerCoordinator,TrainerLease,TrainingSpool,worker_count
+from app.utils.telemetry import REGISTRY,StageTimer,TelemetryMiddleware,get_logger,record,span
+from app.features.daily_spend import DailySpendCache
+from app.features.incremental import IncrementalFeatureCache
+from app.data.backend_client import BackendError,backend_client_from_env,async_backend_client_from_env
 app=FastAPI(title="Coach ML Service",version="1.1.0")
 app.add_middleware(CORSMiddleware,allow_origins=["*"],allow_credentials=False,allow_methods=["*"],allow_headers=["*"])
+log=get_logger("main")
+# per-request stage spans -> /metrics histograms; Server-Timing on every response with SERVER_TIMING=1, else on "X-Server-Timing: 1"
+app.add_middleware(TelemetryMiddleware,server_timing=os.getenv("SERVER_TIMING","0")=="1",log=log)
 ARTIFACT_DIR=os.getenv("MODEL_DIR","./model_artifacts")
+# several server processes on one MODEL_DIR: one trains (TRAINER), all serve memory-mapped models
+MULTI_WORKER=worker_count()>1
 MODEL=None
 LSTM_MODEL=None
-CURRENT_USER_ID=None
 PURCHASE_CACHE_DIR=os.getenv("PURCHASE_CACHE_DIR",ARTIFACT_DIR)
-PURCHASE_HISTORY:Dict[int,List[Dict[str,Any]]]={}
+PURCHASE_HISTORY=ByteLRUCache(max_bytes=int(os.getenv("PURCHASE_CACHE_MAX_BYTES",str(64*1024*1024))),ttl_s=float(os.getenv("PURCHASE_CACHE_TTL_S","900")),sizer=lambda h:h.nbytes)
 os.makedirs(PURCHASE_CACHE_DIR,exist_ok=True)
+PURCHASE_STORE=PurchaseStore(PURCHASE_CACHE_DIR,shared=MULTI_WORKER)
+DAILY_SPEND=DailySpendCache(ttl_s=PURCHASE_HISTORY.ttl_s)
+GRAPH_RESPONSES=ByteLRUCache(max_bytes=int(os.getenv("GRAPH_CACHE_MAX_BYTES",str(32*1024*1024))),ttl_s=float(os.getenv("GRAPH_CACHE_TTL_S","300")),sizer=lambda e:len(e[1]))
+# feature snapshots are appended in place, so only a single process may keep them
+PURCHASE_FEATURES=IncrementalFeatureCache(snapshot_dir=None if MULTI_WORKER else os.path.join(PURCHASE_CACHE_DIR,"features"),ttl_s=PURCHASE_HISTORY.ttl_s,check_every=int(os.getenv("FEATURE_CHECK_EVERY","0")))
+def _user_artifact_dir(user_id:int)->str:return os.path.join(ARTIFACT_DIR,"users",str(int(user_id)))
+MODEL_REGISTRY=ModelRegistry(loader=lambda uid:ModelRetrainer(_user_artifact_dir(uid),serve_only=MULTI_WORKER),sizer=lambda r:r.memory_bytes(),max_bytes=int(os.getenv("MODEL_REGISTRY_MAX_BYTES",str(256*1024*1024))))
+def _user_scorer(user_id:int)->ModelRetrainer:
+    r=MODEL_REGISTRY.get(int(user_id))
+    # the trainer process may have published a newer version since this one loaded it
+    if MULTI_WORKER and r.version!=r.store.current():MODEL_REGISTRY.pop(int(user_id));r=MODEL_REGISTRY.get(int(user_id))
+    return r if r.model is not None and r.model.is_fitted else model_retrainer
+def _apply_training_result(user_id:int,result:Dict[str,Any])->None:
+    if result.get("gbm_model") is not None and MULTI_WORKER:MODEL_REGISTRY.pop(int(user_id))
+    elif result.get("gbm_model") is not None:
+        retrainer=ModelRetrainer(result["artifact_dir"],load=False);retrainer.model=result["gbm_model"];retrainer.training_history=result["training_history"];MODEL_REGISTRY.put(int(user_id),retrainer)
+    if result.get("lstm_weights") is not None:get_forecaster(int(user_id)).set_weights(result["lstm_weights"],result["lstm_hash"])
+    log.info(f"[TRAIN] user={user_id} gbm={result.get('gbm_success')} lstm={result.get('lstm_success')} len_hist_days={result.get('len_hist_days')}")
+TRAIN_SCHEDULER=scheduler_from_env(on_result=_apply_training_result)
+TRAINER=TrainerCoordinator(TrainerLease(os.path.join(ARTIFACT_DIR,"trainer.lock")) if MULTI_WORKER else None,TrainingSpool(os.path.join(ARTIFACT_DIR,"train_spool")),on_job=lambda uid,job:_train_spooled(uid,job),interval_s=float(os.getenv("TRAINER_POLL_S","1")))
+CPU_POOL=cpu_pool_from_env()
+ASYNC_BACKEND=None
+GLOBAL_FORECASTER=load_global_forecaster(ARTIFACT_DIR)
 class GraphDataRequest(BaseModel):
     days_horizon:int=120
     projection_mode:Literal["piecewise","logistic","linear"]="piecewise"
@@ -35,12 +78,48 @@ class GraphDataRequest(BaseModel):
 def root():return{"ok":True}
 @app.get("/health")
 def health():return{"status":"ok"}
+# one store for the base model: the watcher, /rollback_model and model_retrainer all read its current version
+ARTIFACT_STORE=model_retrainer.store
+def _load_gbm(path:str)->GBMRegressor:
+    m=GBMRegressor();m.load(path,booster=not MULTI_WORKER);return m
+def _swap_base_model(version:Optional[str],path:str)->None:
+    global MODEL
+    MODEL=_load_gbm(path)
+    # serve-only, the base retrainer would map the same trees again: share MODEL's
+    if model_retrainer.serve_only:model_retrainer.model,model_retrainer.version=MODEL,version
+    else:model_retrainer.load_model()
+    log.info(f"[MODEL] serving base model version {version} from {path}")
+ARTIFACT_WATCHER=ArtifactWatcher(ARTIFACT_STORE,_swap_base_model,interval_s=float(os.getenv("ARTIFACT_WATCH_S","5")))
+@app.on_event("startup")
+def _startup():
+    global ASYNC_BACKEND
+    if ARTIFACT_WATCHER.interval_s>0:ARTIFACT_WATCHER.start()
+    if MULTI_WORKER:TRAINER.start()
+    # created on the serving loop: an httpx.AsyncClient is bound to one event loop
+    ASYNC_BACKEND=async_backend_client_from_env(BACKEND.base_url,cache=BACKEND.cache)
+@app.on_event("shutdown")
+async def _shutdown():
+    global ASYNC_BACKEND
+    TRAINER.stop();TRAIN_SCHEDULER.shutdown();CPU_POOL.shutdown();BACKEND.close();ARTIFACT_WATCHER.stop()
+    if ASYNC_BACKEND is not None:await ASYNC_BACKEND.aclose();ASYNC_BACKEND=None
+def _store_for(user_id:Optional[int])->ArtifactStore:
+    return ARTIFACT_STORE if user_id is None else MODEL_REGISTRY.get(int(user_id)).store
+@app.get("/model_versions")
+def model_versions(x_user_id:Optional[int]=Header(None,alias="X-User-Id")):
+    store=_store_for(x_user_id);return{"user_id":x_user_id,"current":store.current(),"keep":store.keep,"versions":store.versions()}
+@app.post("/rollback_model")
+def rollback_model(version:Optional[str]=None,x_user_id:Optional[int]=Header(None,alias="X-User-Id")):
+    store=_store_for(x_user_id)
+    try:rolled=store.rollback(version)
+    except KeyError as e:raise HTTPException(status_code=404,detail=str(e.args[0]))
+    if x_user_id is None:_swap_base_model(rolled,store.current_path());ARTIFACT_WATCHER.seen=rolled
+    else:MODEL_REGISTRY.pop(int(x_user_id))
+    return{"ok":True,"user_id":x_user_id,"current":rolled}
 @app.post("/reload_model")
 def reload_model():
-    global MODEL,LSTM_MODEL
+    global MODEL,LSTM_MODEL,GLOBAL_FORECASTER
     try:
-        if MODEL is None:MODEL=GBMRegressor()
-        MODEL.load(ARTIFACT_DIR)
+        MODEL=_load_gbm(ARTIFACT_STORE.current_path());MODEL_REGISTRY.clear();forecaster_pool().clear();GLOBAL_FORECASTER=load_global_forecaster(ARTIFACT_DIR);GRAPH_RESPONSES.clear()
         if LSTM_MODEL is None:
             try:
                 from app.models.lstm_forecaster import forecast_daily_spend
@@ -50,7 +129,8 @@ def reload_model():
         return{"ok":True,"gbm_loaded":True,"lstm_ready":True}
     except Exception as e:
         raise HTTPException(status_code=500,detail=str(e))
-BACKEND_URL="http://143.215.104.239:8080"
+BACKEND=backend_client_from_env("http://143.215.104.239:8080")
+BACKEND_URL=BACKEND.base_url
 class DataResponse(BaseModel):
     income:Decimal
     score:int
@@ -62,153 +142,162 @@ class DataResponse(BaseModel):
     days:Optional[int]=None
     purchase_time:Optional[datetime]=None
     userId:int
+def get_all_data(x_user_id:int)->DataResponse:
+    try:return DataResponse(**BACKEND.get_dashboard(x_user_id))
+    except BackendError as e:raise HTTPException(status_code=e.status_code,detail=f"Backend error: {e.text}")
 @app.get("/all-data",response_model=DataResponse)
-def get_all_data(x_user_id:int=Header(...,alias="X-User-Id")):
-    url=f"{BACKEND_URL}/dashboard/{x_user_id}"
-    resp=requests.get(url,timeout=5)
-    if resp.status_code not in(200,201):raise HTTPException(status_code=resp.status_code,detail=f"Backend error: {resp.text}")
-    return DataResponse(**resp.json())
+async def all_data(x_user_id:int=Header(...,alias="X-User-Id")):return await _dashboard(int(x_user_id))
+async def _income_for(uid:int,default:float=5000.0)->float:
+    try:return float((await _dashboard(uid)).get("income") or default)
+    except Exception:return default
 @app.post("/force_retrain_models")
-def force_retrain_models(x_user_id:int=Header(...,alias="X-User-Id")):
-    global MODEL
+async def force_retrain_models(x_user_id:int=Header(...,alias="X-User-Id")):
+    purchases_records=await run_in_threadpool(_load_user_history,int(x_user_id))
+    if not purchases_records:return{"error":"No purchase history found for user","user_id":x_user_id}
+    income_monthly=await _income_for(int(x_user_id))
+    if not TRAINER.is_trainer:
+        await run_in_threadpool(TRAINER.spool_job,int(x_user_id),{"force":True,"income_monthly":income_monthly})
+        return{"success":True,"queued":True,"purchases_processed":len(purchases_records),"user_id":x_user_id,"income_monthly":income_monthly}
+    return await run_in_threadpool(_force_retrain,int(x_user_id),purchases_records,income_monthly)
+def _force_retrain(x_user_id:int,purchases_records:PurchaseHistory,income_monthly:float)->Dict[str,Any]:
     try:
-        purchases_records=_load_user_history(int(x_user_id))
-        if not purchases_records:return{"error":"No purchase history found for user","user_id":x_user_id}
-        try:
-            payload_obj=get_all_data(x_user_id=int(x_user_id))
-            payload=payload_obj.dict() if hasattr(payload_obj,"dict") else payload_obj
-            income_monthly=float(payload.get("income") or 5000.0)
-        except:income_monthly=5000.0
-        gbm_success=model_retrainer.retrain_model(purchases_records,income_monthly)
-        if gbm_success:MODEL=model_retrainer.model
-        forecaster=get_forecaster()
-        df_hist=pd.DataFrame(purchases_records)
-        if"purchase_time"in df_hist.columns and"ts"not in df_hist.columns:df_hist["ts"]=pd.to_datetime(df_hist["purchase_time"],errors="coerce")
-        else:df_hist["ts"]=pd.to_datetime(df_hist.get("ts",pd.NaT),errors="coerce")
-        df_hist["amount"]=pd.to_numeric(df_hist.get("amount",0.0),errors="coerce")
-        df_hist=df_hist.dropna(subset=["ts"]).sort_values("ts")
-        daily_spend=df_hist.set_index("ts")["amount"].resample("D").sum()
-        last_ts=pd.to_datetime(df_hist["ts"].max()).normalize() if not df_hist.empty else pd.Timestamp.utcnow().normalize()
-        idx=pd.date_range(end=last_ts,periods=60,freq="D")
-        daily_spend=daily_spend.reindex(idx,fill_value=0.0)
-        daily_spend_hist=daily_spend.values.astype(float).tolist()
-        if len(daily_spend_hist)<3:
-            baseline=float(np.mean(daily_spend_hist)) if daily_spend_hist else max(0.0,(income_monthly/30.0)*0.3)
-            daily_spend_hist=[baseline]*(3-len(daily_spend_hist))+daily_spend_hist
+        retrainer=ModelRetrainer(_user_artifact_dir(int(x_user_id)))
+        if not retrainer.model.is_fitted:retrainer.seed_from(ModelRetrainer(model_retrainer.artifact_dir) if model_retrainer.serve_only else model_retrainer)
+        gbm_success=retrainer.retrain_model(purchases_records.records(),income_monthly,incremental=False)
+        if gbm_success and MULTI_WORKER:MODEL_REGISTRY.pop(int(x_user_id))
+        elif gbm_success:MODEL_REGISTRY.put(int(x_user_id),retrainer)
+        forecaster=get_forecaster(int(x_user_id))
+        daily_spend_hist=DAILY_SPEND.get(int(x_user_id),purchases_records).history(fill_empty=True)
         forecaster.last_training_data_hash=None
         lstm_success=forecaster.train_model(daily_spend_hist)
         return{"success":True,"gbm_retrained":gbm_success,"lstm_retrained":lstm_success,"purchases_processed":len(purchases_records),"user_id":x_user_id,"income_monthly":income_monthly}
     except Exception as e:
         import traceback
         return{"success":False,"error":str(e),"traceback":traceback.format_exc(),"user_id":x_user_id}
+@app.get("/metrics")
+def metrics():return Response(content=REGISTRY.render(),media_type="text/plain; version=0.0.4; charset=utf-8")
+@app.get("/cache_stats")
+def cache_stats():
+    return{"purchase_history":PURCHASE_HISTORY.stats(),"daily_spend":DAILY_SPEND.stats(),"purchase_features":PURCHASE_FEATURES.stats(),"graph_responses":GRAPH_RESPONSES.stats(),"model_registry":MODEL_REGISTRY.stats(),"forecaster_pool":forecaster_pool().stats(),"backend":BACKEND.stats(),"cpu_pool":CPU_POOL.stats(),"workers":TRAINER.stats()}
 @app.get("/model_status")
 def get_model_status(x_user_id:int=Header(...,alias="X-User-Id")):
     global MODEL
     try:
         from app.models.lstm_forecaster import get_forecaster,_HAS_TORCH
-        forecaster=get_forecaster()
-        gbm_status={"loaded":MODEL is not None,"fitted":MODEL.is_fitted if MODEL else False,"retrainer_loaded":model_retrainer.model is not None,"retrainer_fitted":(model_retrainer.model.is_fitted if model_retrainer.model else False),"training_samples":len(model_retrainer.training_history)}
-        lstm_status={"loaded":forecaster.model is not None,"trained":forecaster.is_trained,"has_torch":_HAS_TORCH,"model_file_exists":os.path.exists("model_artifacts/lstm_model.pkl")}
+        forecaster=get_forecaster(int(x_user_id))
+        retrainer=MODEL_REGISTRY.get(int(x_user_id))
+        gbm_status={"loaded":MODEL is not None,"fitted":MODEL.is_fitted if MODEL else False,"retrainer_loaded":retrainer.model is not None,"retrainer_fitted":(retrainer.model.is_fitted if retrainer.model else False),"training_samples":len(retrainer.training_history),"user_model_dir":_user_artifact_dir(int(x_user_id)),"registry":MODEL_REGISTRY.stats()}
+        lstm_status={"loaded":forecaster.weights is not None,"trained":forecaster.is_trained,"has_torch":_HAS_TORCH,"model_file_exists":os.path.exists(forecaster.weights_path),"model_dir":forecaster.model_dir,"pool":forecaster_pool().stats(),"global":GLOBAL_FORECASTER.meta if GLOBAL_FORECASTER is not None else None}
         purchases_count=len(_load_user_history(int(x_user_id)))
-        return{"user_id":x_user_id,"gbm_model":gbm_status,"lstm_model":lstm_status,"purchase_history_count":purchases_count,"model_artifacts_dir":ARTIFACT_DIR}
+        return{"user_id":x_user_id,"gbm_model":gbm_status,"lstm_model":lstm_status,"training":TRAIN_SCHEDULER.status(int(x_user_id)),"trainer":TRAINER.stats(),"purchase_history_count":purchases_count,"model_artifacts_dir":ARTIFACT_DIR}
     except Exception as e:
         return{"error":str(e),"user_id":x_user_id}
 @app.post("/test_prediction")
-def test_prediction(x_user_id:int=Header(...,alias="X-User-Id")):
+async def test_prediction(x_user_id:int=Header(...,alias="X-User-Id")):
     try:
-        purchases_records=_load_user_history(int(x_user_id))
+        purchases_records=await run_in_threadpool(_load_user_history,int(x_user_id))
         if not purchases_records:return{"error":"No purchase history"}
         latest_purchase=purchases_records[-1]
-        try:
-            payload_obj=get_all_data(x_user_id=int(x_user_id))
-            payload=payload_obj.dict() if hasattr(payload_obj,"dict") else payload_obj
-            income_monthly=float(payload.get("income") or 5000.0)
-        except:income_monthly=5000.0
-        score=model_retrainer.get_latest_score(latest_purchase,income_monthly)
+        income_monthly=await _income_for(int(x_user_id))
+        score=await run_in_threadpool(lambda:_user_scorer(int(x_user_id)).get_latest_score(latest_purchase,income_monthly))
         return{"user_id":x_user_id,"latest_purchase":latest_purchase,"predicted_score":score,"income_monthly":income_monthly}
     except Exception as e:
         import traceback
         return{"error":str(e),"traceback":traceback.format_exc()}
-@app.get("/get_graph_data")
-def get_graph_data(x_user_id:int=Header(...,alias="X-User-Id")):
-    global CURRENT_USER_ID,MODEL
-    CURRENT_USER_ID=int(x_user_id)
-    print(f"[REQ] /get_graph_data user={CURRENT_USER_ID}")
+SCORE_BATCH_CHUNK_ROWS=int(os.getenv("SCORE_BATCH_CHUNK_ROWS","100000"))
+def _base_gbm()->Optional[GBMRegressor]:
+    try:_ensure_loaded_model()
+    except Exception as e:log.warning(f"base model unavailable: {e}")
+    if MODEL is not None and MODEL.is_fitted:return MODEL
+    m=model_retrainer.model;return m if m is not None and m.is_fitted else None
+@app.post("/score_batch")
+async def score_batch(request:Request,income:float=5000.0,per_user:bool=False):
+    ctype=request.headers.get("content-type","")
     try:
-        payload_obj=get_all_data(x_user_id=CURRENT_USER_ID)
-        payload=payload_obj.dict() if hasattr(payload_obj,"dict") else payload_obj
-    except Exception as e:
-        raise HTTPException(status_code=502,detail=f"Failed to fetch all-data: {e}")
+        if "ndjson" in ctype or "jsonl" in ctype:records,skipped=await parse_ndjson_stream(request.stream(),income)
+        else:records,skipped=parse_json_body(json.loads(await request.body() or b"[]"),income)
+    except ValueError as e:raise HTTPException(status_code=400,detail=f"Bad purchases body: {e}")
+    base=await run_in_threadpool(_base_gbm)
+    if base is None and not per_user:raise HTTPException(status_code=503,detail="No fitted GBM model")
+    df=await run_in_threadpool(purchases_frame,records)
+    def model_for(uid:int):
+        if not per_user:return base
+        scorer=_user_scorer(uid);return scorer.model if scorer is not model_retrainer else base
+    log.info(f"[SCORE] batch rows={len(df)} users={df['user_id'].nunique()} skipped={skipped} per_user={per_user}")
+    return StreamingResponse(score_frame(df,model_for,chunk_rows=SCORE_BATCH_CHUNK_ROWS),media_type="application/x-ndjson",headers={"X-Rows":str(len(df)),"X-Users":str(df["user_id"].nunique()),"X-Skipped":str(skipped)})
+def _graph_fingerprint(uid:int,payload:Dict[str,Any],hist:PurchaseHistory,has_new_purchase:bool)->str:
+    scorer=_user_scorer(uid);gbm=("user" if scorer is not model_retrainer else "base",scorer.version)
+    lstm=GLOBAL_FORECASTER.meta.get("trained_at") if GLOBAL_FORECASTER is not None else get_forecaster(uid).last_training_data_hash
+    return fingerprint(payload,len(hist),_purchase_key(hist[-1]) if len(hist) else None,has_new_purchase,gbm,lstm)
+def _graph_headers(etag:Optional[str],cache:str)->Dict[str,str]:
+    return{"ETag":etag,"Cache-Control":"private, no-cache","X-Cache":cache} if etag else{"X-Cache":cache}
+async def _dashboard(uid:int)->Dict[str,Any]:
+    if ASYNC_BACKEND is None:
+        payload_obj=await run_in_threadpool(get_all_data,x_user_id=uid)
+        return payload_obj.dict() if hasattr(payload_obj,"dict") else payload_obj
+    try:return DataResponse(**await ASYNC_BACKEND.get_dashboard(uid)).dict()
+    except BackendError as e:raise HTTPException(status_code=e.status_code,detail=f"Backend error: {e.text}")
+def _model_ref(gbm,retrainer:ModelRetrainer):
+    """What a CPU_POOL job gets for a model: the object for thread workers, its artifact dir for processes (the base model's is ARTIFACT_STORE's current version, which MODEL serves)"""
+    if CPU_POOL.shares_memory:return gbm
+    return ARTIFACT_STORE.current_path() if retrainer is model_retrainer else retrainer.model_dir
+def _queue_training(uid:int,hist:PurchaseHistory,from_row:int,income_monthly:float,expenditures_monthly:float)->None:
+    """Retrain on the purchases from from_row on; processes other than the trainer spool the request for it. The job gets the columnar history itself, decoded only for a cold start"""
+    if not TRAINER.is_trainer:
+        TRAINER.spool_job(uid,{"from_row":int(from_row),"income_monthly":income_monthly,"expenditures_monthly":expenditures_monthly});return
+    TRAIN_SCHEDULER.submit(uid,records=hist,new_records=hist[from_row:],artifact_dir=_user_artifact_dir(uid),base_artifact_dir=model_retrainer.artifact_dir,income_monthly=income_monthly,expenditures_monthly=expenditures_monthly,daily_spend_hist=DAILY_SPEND.get(uid,hist).history(fill_empty=True),train_lstm=GLOBAL_FORECASTER is None)
+def _train_spooled(uid:int,job:Dict[str,Any])->None:
+    hist=_load_user_history(uid)
+    if not hist:return
+    if job.get("force"):
+        res=_force_retrain(uid,hist,float(job.get("income_monthly") or 5000.0));log.info(f"[TRAIN] spooled forced retrain user={uid} success={res.get('success')}");return
+    _queue_training(uid,hist,min(int(job.get("from_row",0)),len(hist)),float(job.get("income_monthly") or 0.0),float(job.get("expenditures_monthly") or 0.0))
+def _graph_prepare(uid:int,payload:Dict[str,Any],if_none_match:Optional[str])->Dict[str,Any]:
+    """The I/O and cache-bound part of /get_graph_data (runs in the threadpool); ctx["response"] is set on a cache hit"""
+    lap=StageTimer()
     income_monthly=float(payload.get("income") or 0.0)
     expenditures_monthly=float(payload.get("expenditures") or 0.0)
     current_savings=float(payload.get("saved") or payload.get("current_savings") or 0.0)
     goal_amount=float(payload.get("saved") or 10000.0)
     days_horizon=int(payload.get("days") or 90)
-    print(f"[INFO] income={income_monthly} exp_m={expenditures_monthly} saved={current_savings} goal_amount={goal_amount} horizon={days_horizon}")
+    log.debug(f"income={income_monthly} exp_m={expenditures_monthly} saved={current_savings} goal_amount={goal_amount} horizon={days_horizon}")
     latest_df=build_purchases_df(payload)
     latest_records=latest_df.to_dict(orient="records")
-    old_history=_load_user_history(CURRENT_USER_ID)
-    purchases_records=_merge_history(CURRENT_USER_ID,latest_records)
+    old_history=_load_user_history(uid)
+    purchases_records=_merge_history(uid,latest_records)
     has_new_purchase=len(purchases_records)>len(old_history)
-    print(f"[INFO] purchases_history={len(purchases_records)} (was {len(old_history)}), new_purchase={has_new_purchase}")
+    daily_spend=DAILY_SPEND.get(uid,purchases_records);daily_spend_hist=daily_spend.history();lap("history")
+    log.debug(f"purchases_history={len(purchases_records)} (was {len(old_history)}), new_purchase={has_new_purchase}")
     if has_new_purchase and purchases_records:
-        newest_purchase=purchases_records[-1]
-        print(f"[TRAIN] GBM+LSTM on new purchase: {newest_purchase}")
-        gbm_success=model_retrainer.retrain_model(purchases_records,income_monthly)
-        if gbm_success and model_retrainer.model is not None:MODEL=model_retrainer.model
-        print(f"[TRAIN] GBM retrain success={bool(gbm_success)}")
-        df_hist=pd.DataFrame(purchases_records)
-        if"purchase_time"in df_hist.columns and"ts"not in df_hist.columns:df_hist["ts"]=pd.to_datetime(df_hist["purchase_time"],errors="coerce")
-        else:df_hist["ts"]=pd.to_datetime(df_hist.get("ts",pd.NaT),errors="coerce")
-        df_hist["amount"]=pd.to_numeric(df_hist.get("amount",0.0),errors="coerce")
-        df_hist=df_hist.dropna(subset=["ts"]).sort_values("ts")
-        daily_spend=df_hist.set_index("ts")["amount"].resample("D").sum()
-        last_ts=pd.to_datetime(df_hist["ts"].max()).normalize() if not df_hist.empty else pd.Timestamp.utcnow().normalize()
-        idx=pd.date_range(end=last_ts,periods=60,freq="D")
-        daily_spend=daily_spend.reindex(idx,fill_value=0.0)
-        daily_spend_hist=daily_spend.values.astype(float).tolist()
-        if len(daily_spend_hist)<3:
-            mbase=(expenditures_monthly/30.0) if expenditures_monthly>0 else None
-            alt=max(0.0,(income_monthly/30.0)*0.3)
-            seed=mbase if mbase is not None else (float(np.mean(daily_spend_hist)) if daily_spend_hist else alt)
-            daily_spend_hist=[seed]*(3-len(daily_spend_hist))+daily_spend_hist
-        forecaster=get_forecaster()
-        forecaster.last_training_data_hash=None
-        lstm_success=forecaster.train_model(daily_spend_hist)
-        print(f"[TRAIN] LSTM retrain success={bool(lstm_success)} len_hist_days={len(daily_spend_hist)}")
-    else:
-        daily_spend_hist=[]
-    model_error=None;scores=[];used_features=[]
+        log.info(f"[TRAIN] queued GBM+LSTM retrain on new purchase: {purchases_records[-1]}")
+        _queue_training(uid,purchases_records,len(old_history),income_monthly,expenditures_monthly);lap("retrain")
+    if MULTI_WORKER and GLOBAL_FORECASTER is None:get_forecaster(uid).reload_if_changed()
+    ctx=dict(uid=uid,income_monthly=income_monthly,expenditures_monthly=expenditures_monthly,current_savings=current_savings,goal_amount=goal_amount,days_horizon=days_horizon,purchases_processed=len(purchases_records),has_new_purchase=has_new_purchase,daily_spend_hist=daily_spend_hist)
+    # same payload, history and model versions -> same response: serve the stored bytes (or a 304)
+    etag=None
+    try:etag='"'+_graph_fingerprint(uid,payload,purchases_records,has_new_purchase)+'"'
+    except Exception as e:log.warning(f"graph response fingerprint failed: {e}")
+    ctx["etag"]=etag
+    cached=GRAPH_RESPONSES.get(uid) if etag else None;lap("cache")
+    if cached is not None and cached[0]==etag:
+        if etag_matches(if_none_match,etag):ctx["response"]=Response(status_code=304,headers=_graph_headers(etag,"hit"))
+        else:ctx["response"]=Response(content=cached[1],media_type="application/json",headers=_graph_headers(etag,"hit"))
+        return ctx
+    model_error=None;X=None;used_features=[];scorer=model_retrainer;gbm=None;latest_X=None
     try:
         _ensure_loaded_model()
-        feats=make_purchase_features(pd.DataFrame(purchases_records),income=income_monthly) if len(purchases_records) else pd.DataFrame()
-        if not feats.empty and MODEL is not None and getattr(MODEL,"is_fitted",False):
-            scores=MODEL.predict(feats).tolist()
-            used_features=get_feature_columns()
-            print(f"[SCORE] GBM predicted {len(scores)} scores; last={scores[-1] if scores else None}")
+        scorer=_user_scorer(uid);gbm=scorer.model if scorer is not model_retrainer else MODEL
+        if gbm is not None and getattr(gbm,"is_fitted",False):
+            X=PURCHASE_FEATURES.matrix(uid,purchases_records,income_monthly)
+            if len(X):used_features=get_feature_columns()
+            else:X=None
     except Exception as e:
-        model_error=f"ML pipeline failed: {e}";scores=[]
-        print(f"[ERR] {model_error}")
-    df_hist=pd.DataFrame(purchases_records) if purchases_records else pd.DataFrame()
-    if not df_hist.empty:
-        if"purchase_time"in df_hist.columns and"ts"not in df_hist.columns:df_hist["ts"]=pd.to_datetime(df_hist["purchase_time"],errors="coerce")
-        else:df_hist["ts"]=pd.to_datetime(df_hist.get("ts",pd.NaT),errors="coerce")
-        df_hist["amount"]=pd.to_numeric(df_hist.get("amount",0.0),errors="coerce")
-        df_hist=df_hist.dropna(subset=["ts"])
-        if not df_hist.empty:
-            df_hist=df_hist.sort_values("ts")
-            daily_spend=df_hist.set_index("ts")["amount"].resample("D").sum()
-            last_ts=pd.to_datetime(df_hist["ts"].max()).normalize() if not df_hist.empty else pd.Timestamp.utcnow().normalize()
-            idx=pd.date_range(end=last_ts,periods=60,freq="D")
-            daily_spend=daily_spend.reindex(idx,fill_value=0.0)
-            daily_spend_hist=daily_spend.values.astype(float).tolist()
-            if len(daily_spend_hist)<3:
-                mbase=(expenditures_monthly/30.0) if expenditures_monthly>0 else None
-                alt=max(0.0,(income_monthly/30.0)*0.3)
-                seed=mbase if mbase is not None else (float(np.mean(daily_spend_hist)) if daily_spend_hist else alt)
-                daily_spend_hist=[seed]*(3-len(daily_spend_hist))+daily_spend_hist
-        else:daily_spend_hist=[]
-    else:daily_spend_hist=[]
+        model_error=f"ML pipeline failed: {e}"
+        log.error(f"{model_error}")
+    if purchases_records and scorer.model and scorer.model.is_fitted:
+        try:latest_X=scorer.prepare_training_data([purchases_records[-1]],income_monthly)
+        except Exception as e:log.warning(f"Error getting latest score: {e}");latest_X=pd.DataFrame()
+    lap("features")
     daily_income=income_monthly/30.0 if income_monthly>0 else 100.0
     alpha=0.3
     if len(daily_spend_hist)>=1:
@@ -222,17 +311,25 @@ def get_graph_data(x_user_id:int=Header(...,alias="X-User-Id")):
     daily_savings_budget=max(daily_income-adj_avg,0.0)
     daily_savings_budget=max(daily_savings_budget,0.4*base_budget)
     recent_avg_spend=adj_avg
-    print(f"[INFO] daily_income={daily_income:.2f} recent_avg_spend={recent_avg_spend:.2f} daily_savings_budget={daily_savings_budget:.2f}")
+    log.debug(f"daily_income={daily_income:.2f} recent_avg_spend={recent_avg_spend:.2f} daily_savings_budget={daily_savings_budget:.2f}")
+    forecaster=GLOBAL_FORECASTER if GLOBAL_FORECASTER is not None else serving_forecaster(uid)
+    mix=history_category_mix(purchases_records) if GLOBAL_FORECASTER is not None else None
+    ctx.update(model_error=model_error,used_features=used_features,daily_income=daily_income,daily_savings_budget=daily_savings_budget,recent_avg_spend=recent_avg_spend)
+    ctx["job"]=(_model_ref(gbm,scorer),X,_model_ref(scorer.model,scorer),latest_X,forecaster,np.asarray(daily_spend_hist,dtype=float),days_horizon,recent_avg_spend,income_monthly,mix)
+    lap("prepare");return ctx
+def _graph_finish(ctx:Dict[str,Any],res:Dict[str,Any])->Dict[str,Any]:
+    lap=StageTimer();uid=ctx["uid"];income_monthly=ctx["income_monthly"];current_savings=ctx["current_savings"];goal_amount=ctx["goal_amount"];days_horizon=ctx["days_horizon"]
+    daily_income=ctx["daily_income"];daily_savings_budget=ctx["daily_savings_budget"];recent_avg_spend=ctx["recent_avg_spend"]
+    model_error=ctx["model_error"] or res["score_error"];scores=res["scores"] if model_error is None else [];used_features=ctx["used_features"] if scores else []
+    if model_error is not None and res["score_error"]:log.error(f"{model_error}")
+    elif scores:log.debug(f"[SCORE] GBM predicted {len(scores)} scores; last={scores[-1]}")
     try:
-        if len(daily_spend_hist)>=3 and np.std(daily_spend_hist)>=1e-6:
-            spend_forecast=forecast_daily_spend(daily_spend_hist,horizon=days_horizon)
-        else:
-            spend_forecast=np.full(days_horizon,recent_avg_spend,dtype=float)
-        adj=np.asarray(recent_avg_spend-np.asarray(spend_forecast,dtype=float),dtype=float)
+        if res["forecast_error"]:raise RuntimeError(res["forecast_error"])
+        adj=np.asarray(recent_avg_spend-np.asarray(res["forecast"],dtype=float),dtype=float)
         cap=min(daily_income,max(daily_savings_budget*0.75,0.0))
         daily_adjustments=np.clip(adj,-cap,cap)
     except Exception as e:
-        print(f"[WARN] LSTM forecast error: {e}");daily_adjustments=np.zeros(days_horizon,dtype=float)
+        log.warning(f"LSTM forecast error: {e}");daily_adjustments=np.zeros(days_horizon,dtype=float)
     projected_money,_=build_money_trajectory(current_savings=current_savings,daily_savings_budget=daily_savings_budget,days_horizon=days_horizon,daily_adjustments=daily_adjustments)
     ideal_money,_=project_savings_money(current_savings=current_savings,daily_savings_budget=daily_savings_budget,goal_amount=goal_amount,days_horizon=days_horizon)
     if len(ideal_money)==0:ideal_money=np.linspace(current_savings,goal_amount,days_horizon)
@@ -240,23 +337,45 @@ def get_graph_data(x_user_id:int=Header(...,alias="X-User-Id")):
     ideal_dollars=np.asarray(ideal_money,dtype=float)
     projected_dollars=np.asarray(projected_money,dtype=float)
     if ideal_dollars.size and float(ideal_dollars[-1])!=float(goal_amount) and float(ideal_dollars[-1])>0:
-        s=float(goal_amount)/float(ideal_dollars[-1]);ideal_dollars=ideal_dollars*s;projected_dollars=projected_dollars*s;print(f"[ADJUST] scaled ideal/projected by {s:.4f} to hit goal={goal_amount}")
-    money_score_raw=float(money_correlation_score(ideal_dollars,projected_dollars))
-    overall_score=_compute_overall_score_fixed(ideal_dollars,projected_dollars,current_savings,goal_amount)
+        s=float(goal_amount)/float(ideal_dollars[-1]);ideal_dollars=ideal_dollars*s;projected_dollars=projected_dollars*s;log.debug(f"[ADJUST] scaled ideal/projected by {s:.4f} to hit goal={goal_amount}")
+    lap("planner");money_score_raw=float(money_correlation_score(ideal_dollars,projected_dollars))
+    overall_score=_compute_overall_score_fixed(ideal_dollars,projected_dollars,current_savings,goal_amount);lap("scoring")
     days=list(range(int(days_horizon)))
     ideal=np.linspace(0.0,float(goal_amount),int(days_horizon))
     projected=projected_dollars-projected_dollars[0]
     daily_net=np.diff(projected,prepend=0.0)
     llm_adj=daily_adjustments if len(daily_adjustments)==days_horizon else np.zeros(days_horizon)
     trend=np.ones(days_horizon,dtype=float)
-    gbm_model_score=None
+    gbm_model_score=res["latest_score"]
+    if gbm_model_score is not None:log.debug(f"[SCORE] GBM latest_score={gbm_model_score}")
+    log.info(f"[OUT] projected_delta={float(projected[-1]) if len(projected)>0 else 0:.2f} money_score={money_score_raw:.4f} overall_score={overall_score}")
+    out={"metadata":{"current_savings":float(current_savings),"goal_amount":float(goal_amount),"income_monthly":float(income_monthly),"days_horizon":int(days_horizon),"projection_mode":"lstm+planner","money_score":float(money_score_raw),"score":int(overall_score),"model_error":model_error,"user_id":uid,"target_date":None,"has_goal":bool(goal_amount),"purchases_processed":int(ctx["purchases_processed"]),"model_updated":ctx["has_new_purchase"],"gbm_model_score":gbm_model_score,"daily_savings_budget":daily_savings_budget,"recent_avg_spend":recent_avg_spend},"data_points":{"days":days,"projected_savings":projected.tolist(),"ideal_plan":ideal.tolist(),"goal_line":[float(goal_amount)]*len(days)},"time_series":{"daily_net_savings":daily_net.tolist(),"daily_income":[daily_income]*len(days),"llm_adjustments":llm_adj.tolist(),"trend_factor":trend.tolist()},"purchase_scores":{"scores":scores,"used_features":used_features},"views":{"week":{"days":days[:7],"projected_savings":projected[:7].tolist() if len(projected)>=7 else projected.tolist(),"ideal_plan":ideal[:7].tolist() if len(ideal)>=7 else ideal.tolist(),"goal_line":[float(goal_amount)]*min(7,len(days))},"month":{"days":days[:30],"projected_savings":projected[:30].tolist() if len(projected)>=30 else projected.tolist(),"ideal_plan":ideal[:30].tolist() if len(ideal)>=30 else ideal.tolist(),"goal_line":[float(goal_amount)]*min(30,len(days))},"full_horizon":{"days":days,"projected_savings":projected.tolist(),"ideal_plan":ideal.tolist(),"goal_line":[float(goal_amount)]*len(days)}}}
+    lap("assemble");return out
+async def _run_graph_job(job:tuple)->Dict[str,Any]:
+    """graph_models on CPU_POOL; a dead worker breaks the whole pool, so the job gets one retry on the fresh executor CPU_POOL installs"""
+    try:return await CPU_POOL.run(graph_models,*job)
+    except BrokenProcessPool as e:log.warning(f"CPU pool broke, retrying the graph job once: {e}");return await CPU_POOL.run(graph_models,*job)
+@app.get("/get_graph_data")
+async def get_graph_data(x_user_id:int=Header(...,alias="X-User-Id"),if_none_match:Optional[str]=Header(None,alias="If-None-Match")):
+    uid=int(x_user_id)
+    log.debug(f"[REQ] /get_graph_data user={uid}")
     try:
-        if purchases_records and model_retrainer.model and model_retrainer.model.is_fitted:
-            gbm_model_score=model_retrainer.get_latest_score(purchases_records[-1],income_monthly);print(f"[SCORE] GBM latest_score={gbm_model_score}")
-    except Exception as e:
-        print(f"[WARN] GBM latest score error: {e}")
-    print(f"[OUT] projected_delta={float(projected[-1]) if len(projected)>0 else 0:.2f} money_score={money_score_raw:.4f} overall_score={overall_score}")
-    return{"metadata":{"current_savings":float(current_savings),"goal_amount":float(goal_amount),"income_monthly":float(income_monthly),"days_horizon":int(days_horizon),"projection_mode":"lstm+planner","money_score":float(money_score_raw),"score":int(overall_score),"model_error":model_error,"user_id":CURRENT_USER_ID,"target_date":None,"has_goal":bool(goal_amount),"purchases_processed":int(len(purchases_records)),"model_updated":has_new_purchase,"gbm_model_score":gbm_model_score,"daily_savings_budget":daily_savings_budget,"recent_avg_spend":recent_avg_spend},"data_points":{"days":days,"projected_savings":projected.tolist(),"ideal_plan":ideal.tolist(),"goal_line":[float(goal_amount)]*len(days)},"time_series":{"daily_net_savings":daily_net.tolist(),"daily_income":[daily_income]*len(days),"llm_adjustments":llm_adj.tolist(),"trend_factor":trend.tolist()},"purchase_scores":{"scores":scores,"used_features":used_features},"views":{"week":{"days":days[:7],"projected_savings":projected[:7].tolist() if len(projected)>=7 else projected.tolist(),"ideal_plan":ideal[:7].tolist() if len(ideal)>=7 else ideal.tolist(),"goal_line":[float(goal_amount)]*min(7,len(days))},"month":{"days":days[:30],"projected_savings":projected[:30].tolist() if len(projected)>=30 else projected.tolist(),"ideal_plan":ideal[:30].tolist() if len(ideal)>=30 else ideal.tolist(),"goal_line":[float(goal_amount)]*min(30,len(days))},"full_horizon":{"days":days,"projected_savings":projected.tolist(),"ideal_plan":ideal.tolist(),"goal_line":[float(goal_amount)]*len(days)}}}
+        with span("backend"):payload=await _dashboard(uid)
+    except Exception as e:raise HTTPException(status_code=502,detail=f"Failed to fetch all-data: {e}")
+    ctx=await run_in_threadpool(_graph_prepare,uid,payload,if_none_match)
+    if "response" in ctx:return ctx["response"]
+    t0=time.perf_counter()
+    try:res=await _run_graph_job(ctx["job"])
+    except PoolSaturated as e:raise HTTPException(status_code=429,detail=f"Server busy: {e}",headers={"Retry-After":"1"})
+    # graph_models reports model errors in its result: anything raised here is the pool or the transfer (dead worker, unpicklable job)
+    except Exception as e:log.error(f"graph job failed: {type(e).__name__}: {e}");raise HTTPException(status_code=503,detail=f"Scoring workers unavailable: {e}",headers={"Retry-After":"1"})
+    # predict/forecast are timed inside the job; the rest of the round trip is pool queueing and transfer
+    for stage,seconds in res["timings"].items():record(stage,seconds)
+    record("cpu_wait",max(0.0,time.perf_counter()-t0-sum(res["timings"].values())))
+    out=_graph_finish(ctx,res);etag=ctx["etag"] if out["metadata"]["model_error"] is None else None
+    with span("serialize"):resp=JSONResponse(out,headers=_graph_headers(etag,"miss"))
+    if etag:GRAPH_RESPONSES.put(uid,(etag,resp.body))
+    return resp
 def _compute_overall_score_fixed(ideal,projected,current_savings,goal_amount)->int:
     ideal=np.asarray(ideal,dtype=float);projected=np.asarray(projected,dtype=float)
     if ideal.size==0 or projected.size==0:return 0
@@ -304,39 +423,36 @@ def _purchase_key(p:Dict[str,Any])->tuple:
     return(str(p.get("ts")),float(p.get("amount") or 0.0),str(p.get("merchant") or ""),str(p.get("category") or ""))
 @app.delete("/purchases/cache")
 def clear_purchase_cache(x_user_id:int=Header(...,alias="X-User-Id")):
-    uid=int(x_user_id);PURCHASE_HISTORY.pop(uid,None)
+    uid=int(x_user_id);PURCHASE_HISTORY.pop(uid,None);GRAPH_RESPONSES.pop(uid);DAILY_SPEND.pop(uid);PURCHASE_FEATURES.pop(uid);PURCHASE_STORE.delete(uid)
     try:os.remove(_history_path(uid))
     except FileNotFoundError:pass
     return{"ok":True}
-def _normalize_purchase_dict(p:Dict[str,Any])->Dict[str,Any]:
-    return{"user_id":int(p.get("user_id") or p.get("userId") or 0),"ts":str(p.get("ts") or p.get("purchase_time") or ""),"merchant":str(p.get("merchant") or ""),"category":str(p.get("category") or ""),"amount":float(p.get("amount") or 0.0),"is_recurring":bool(p.get("is_recurring") or False),"description":str(p.get("description") or "")}
+_normalize_purchase_dict=normalize_purchase
 def _history_path(user_id:int)->str:return os.path.join(PURCHASE_CACHE_DIR,f"purchases_{user_id}.jsonl")
-def _load_user_history(user_id:int)->List[Dict[str,Any]]:
-    if user_id in PURCHASE_HISTORY:return PURCHASE_HISTORY[user_id]
-    path=_history_path(user_id);records:List[Dict[str,Any]]=[]
-    if os.path.exists(path):
-        with open(path,"r",encoding="utf-8") as f:
-            for line in f:
-                try:records.append(_normalize_purchase_dict(json.loads(line.strip())))
-                except Exception:continue
-    PURCHASE_HISTORY[user_id]=records;return records
-def _save_user_history(user_id:int,records:List[Dict[str,Any]])->None:
-    path=_history_path(user_id)
-    with open(path,"w",encoding="utf-8") as f:
-        for r in records:f.write(json.dumps(r,default=str)+"\n")
-    PURCHASE_HISTORY[user_id]=records
-def _merge_history(user_id:int,new_records:list[dict])->list[dict]:
+def _load_user_history(user_id:int)->PurchaseHistory:
+    hist=PURCHASE_HISTORY.get(user_id)
+    # other processes append to the same store: a cached history is good while the row counts agree
+    if hist is not None and(not MULTI_WORKER or len(hist)==PURCHASE_STORE.count(user_id)):return hist
+    if not PURCHASE_STORE.exists(user_id) and os.path.exists(_history_path(user_id)):PURCHASE_STORE.import_jsonl(user_id,_history_path(user_id))
+    hist=PURCHASE_STORE.load(user_id,mmap=False)
+    PURCHASE_HISTORY.put(user_id,hist);return hist
+def _append_user_history(user_id:int,hist:PurchaseHistory,record:Dict[str,Any])->PurchaseHistory:
+    PURCHASE_STORE.append(user_id,record,expect_rows=len(hist));full=hist.appended(record);PURCHASE_HISTORY.put(user_id,full);return full
+def _merge_history(user_id:int,new_records:list[dict])->PurchaseHistory:
+    try:return _merge_into(user_id,new_records)
+    except StaleHistory:PURCHASE_HISTORY.pop(user_id,None);return _merge_into(user_id,new_records)
+def _merge_into(user_id:int,new_records:list[dict])->PurchaseHistory:
     hist=_load_user_history(user_id)
     if not new_records:return hist
     latest=_normalize_purchase_dict(new_records[-1]);latest["ts"]=latest.get("ts") or latest.get("purchase_time")
-    if not hist:full=[latest];_save_user_history(user_id,full);return full
+    if not hist:return _append_user_history(user_id,hist,latest)
     last=hist[-1];last_ts=_safe_ts_str(last.get("ts") or last.get("purchase_time"));new_ts=_safe_ts_str(latest.get("ts"))
-    if new_ts and new_ts!=last_ts:full=hist+[latest];_save_user_history(user_id,full);return full
+    if new_ts and new_ts!=last_ts:return _append_user_history(user_id,hist,latest)
     identical=(float(last.get("amount") or 0.0)==float(latest.get("amount") or 0.0) and str(last.get("merchant") or "")==str(latest.get("merchant") or "") and str(last.get("category") or "")==str(latest.get("category") or "") and str(last.get("description") or "")==str(latest.get("description") or "") and last_ts==new_ts)
     if identical:return hist
-    full=hist+[latest];_save_user_history(user_id,full);return full
+    return _append_user_history(user_id,hist,latest)
 def _ensure_loaded_model():
     global MODEL
     if MODEL is None:
         MODEL=GBMRegressor()
-        MODEL.load(ARTIFACT_DIR)
+        MODEL.load(ARTIFACT_STORE.current_path(),booster=not MULTI_WORKER)
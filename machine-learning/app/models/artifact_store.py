@@ -0,0 +1,206 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from app.utils.telemetry import get_logger
+
+log = get_logger("artifact_store")
+
+CURRENT = "CURRENT"
+MANIFEST = "VERSION.json"
+# files that describe where a version was written rather than what it holds,
+# or are derived from files that are hashed (trees.npz: zip entries carry timestamps)
+UNHASHED = (MANIFEST, "meta.json", "trees.npz")
+
+
+class ArtifactStore:
+    """
+    Versioned model artifacts under one root directory.
+
+        root/versions/<content hash>/   one directory per published version
+        root/CURRENT                    id of the live version
+
+    `publish` writes into a private staging directory, names it by the hash
+    of its contents, renames it into place and then swaps CURRENT with an
+    atomic os.replace, so a reader sees either the old or the new version in
+    full. Only the newest `keep` versions (plus the live one) are retained.
+    A root without CURRENT is read as a pre-versioning flat directory.
+    """
+
+    def __init__(self, root: str, keep: int = 5):
+        self.root = root
+        self.keep = max(1, int(keep))
+        self.versions_dir = os.path.join(root, "versions")
+        self._lock = threading.Lock()
+
+    def current(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.root, CURRENT), "r", encoding="utf-8") as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return version or None
+
+    def path(self, version: str) -> str:
+        return os.path.join(self.versions_dir, version)
+
+    def current_path(self) -> str:
+        """Directory to load the live model from (the root itself before the first publish)"""
+        version = self.current()
+        return self.path(version) if version else self.root
+
+    def versions(self) -> List[Dict[str, Any]]:
+        """Published versions, oldest first"""
+        out = []
+        if not os.path.isdir(self.versions_dir):
+            return out
+        for name in os.listdir(self.versions_dir):
+            manifest = os.path.join(self.versions_dir, name, MANIFEST)
+            if name.startswith(".") or not os.path.exists(manifest):
+                continue
+            try:
+                with open(manifest, "r", encoding="utf-8") as f:
+                    out.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return sorted(out, key=lambda m: (m.get("created", 0.0), m.get("version", "")))
+
+    def publish(self, write: Callable[[str], Any], activate: bool = True) -> str:
+        """Call write(staging_dir), store the result as a version and (by default) make it current"""
+        os.makedirs(self.versions_dir, exist_ok=True)
+        staging = os.path.join(self.versions_dir, f".staging-{uuid.uuid4().hex}")
+        os.makedirs(staging)
+        try:
+            write(staging)
+            files = _file_hashes(staging)
+            digest = hashlib.sha256()
+            for name in sorted(files):
+                if name not in UNHASHED:
+                    digest.update(f"{name}\0{files[name]}\0".encode())
+            version = digest.hexdigest()[:16]
+            final = self.path(version)
+            if os.path.exists(os.path.join(final, MANIFEST)):
+                shutil.rmtree(staging, ignore_errors=True)
+            else:
+                _relocate_meta(staging, final)
+                with open(os.path.join(staging, MANIFEST), "w", encoding="utf-8") as f:
+                    json.dump({"version": version, "created": time.time(), "files": files}, f, indent=2)
+                shutil.rmtree(final, ignore_errors=True)
+                os.rename(staging, final)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        if activate:
+            self.set_current(version)
+        self.prune()
+        return version
+
+    def set_current(self, version: str) -> None:
+        if not os.path.exists(os.path.join(self.path(version), MANIFEST)):
+            raise KeyError(f"unknown model version {version}")
+        with self._lock:
+            tmp = os.path.join(self.root, f"{CURRENT}.tmp-{uuid.uuid4().hex}")
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(version + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, os.path.join(self.root, CURRENT))
+
+    def rollback(self, version: Optional[str] = None) -> str:
+        """Make `version` current, or the newest version older than the current one"""
+        if version is None:
+            ids = [m["version"] for m in self.versions()]
+            cur = self.current()
+            older = ids[: ids.index(cur)] if cur in ids else []
+            if not older:
+                raise KeyError("no earlier model version to roll back to")
+            version = older[-1]
+        self.set_current(version)
+        return version
+
+    def prune(self) -> List[str]:
+        """Drop all but the newest `keep` versions, never the current one"""
+        cur = self.current()
+        ids = [m["version"] for m in self.versions()]
+        doomed = [v for v in ids[: max(0, len(ids) - self.keep)] if v != cur]
+        for v in doomed:
+            shutil.rmtree(self.path(v), ignore_errors=True)
+        return doomed
+
+
+def _file_hashes(directory: str) -> Dict[str, str]:
+    out = {}
+    for base, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(base, name)
+            h = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+            out[os.path.relpath(path, directory).replace(os.sep, "/")] = h.hexdigest()
+    return out
+
+
+def _relocate_meta(staging: str, final: str) -> None:
+    """Point paths recorded in meta.json at the version directory instead of the staging one"""
+    meta_path = os.path.join(staging, "meta.json")
+    if not os.path.exists(meta_path):
+        return
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    for k, v in meta.items():
+        if isinstance(v, str) and v.startswith(staging):
+            meta[k] = final + v[len(staging):]
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+
+class ArtifactWatcher:
+    """
+    Polls a store's CURRENT pointer and calls on_change(version, path) when it moves.
+
+    Runs in a daemon thread, so loading the new model happens off the
+    request path; callers swap their model reference once it is ready.
+    """
+
+    def __init__(self, store: ArtifactStore, on_change: Callable[[Optional[str], str], None], interval_s: float = 5.0):
+        self.store = store
+        self.on_change = on_change
+        self.interval_s = float(interval_s)
+        self.seen = store.current()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "ArtifactWatcher":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="artifact-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval_s + 1.0)
+            self._thread = None
+
+    def check(self) -> bool:
+        """Fire on_change if CURRENT moved since the last check; returns whether it did"""
+        version = self.store.current()
+        if version == self.seen:
+            return False
+        self.seen = version
+        try:
+            self.on_change(version, self.store.current_path())
+        except Exception as e:
+            log.warning(f"hot reload of model version {version} failed: {e}")
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            self.check()
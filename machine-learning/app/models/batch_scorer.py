@@ -0,0 +1,123 @@
+from __future__ import annotations
+import json
+from typing import Any, AsyncIterable, Callable, Dict, Iterator, List, Tuple
+import numpy as np
+import pandas as pd
+
+from app.data.purchase_store import normalize_purchase
+from app.features.featureizer import FeatureBuffer, make_feature_matrix, parse_timestamps
+
+
+def _record(raw: Dict[str, Any], incomes: Dict[int, float], default_income: float) -> Dict[str, Any]:
+    rec = normalize_purchase(raw)
+    income = raw.get("income", raw.get("user_income"))
+    rec["income"] = float(income) if income is not None else incomes.get(rec["user_id"], default_income)
+    return rec
+
+
+def parse_json_body(body: Any, default_income: float) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Purchases from a JSON body: a list of purchases, or
+    {"purchases": [...], "incomes": {"<user_id>": monthly_income}}.
+    Returns (records, skipped).
+    """
+    incomes: Dict[int, float] = {}
+    if isinstance(body, dict):
+        incomes = {int(k): float(v) for k, v in (body.get("incomes") or {}).items()}
+        body = body.get("purchases") or []
+    if not isinstance(body, list):
+        raise ValueError("expected a list of purchases or an object with a 'purchases' list")
+    out, skipped = [], 0
+    for raw in body:
+        try:
+            out.append(_record(raw, incomes, default_income))
+        except Exception:
+            skipped += 1
+    return out, skipped
+
+
+async def parse_ndjson_stream(chunks: AsyncIterable[bytes], default_income: float) -> Tuple[List[Dict[str, Any]], int]:
+    """Purchases from a newline-delimited JSON body, parsed as it arrives; bad lines are skipped"""
+    out: List[Dict[str, Any]] = []
+    skipped = 0
+    tail = b""
+
+    def take(line: bytes) -> None:
+        nonlocal skipped
+        if not line.strip():
+            return
+        try:
+            out.append(_record(json.loads(line), {}, default_income))
+        except Exception:
+            skipped += 1
+
+    async for chunk in chunks:
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            take(line)
+    take(tail)
+    return out, skipped
+
+
+def purchases_frame(records: List[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    Records as one frame grouped by user (input order kept within a user),
+    with `pos` holding each row's index in the request.
+    """
+    df = pd.DataFrame(records, columns=["user_id", "ts", "merchant", "category", "amount", "is_recurring", "income"])
+    df["pos"] = np.arange(len(df))
+    df["ts"] = parse_timestamps(df["ts"])
+    return df.sort_values("user_id", kind="stable").reset_index(drop=True)
+
+
+def _chunks(user_ids: np.ndarray, chunk_rows: int) -> Iterator[Tuple[int, int]]:
+    """Row ranges of about chunk_rows that never split a user's purchases"""
+    starts = np.flatnonzero(np.r_[True, user_ids[1:] != user_ids[:-1]]) if len(user_ids) else np.array([], int)
+    bounds = np.r_[starts, len(user_ids)]
+    lo = 0
+    while lo < len(user_ids):
+        cut = int(np.searchsorted(bounds, lo + chunk_rows, side="right")) - 1
+        hi = int(bounds[cut]) if bounds[cut] > lo else int(bounds[np.searchsorted(bounds, lo, side="right")])
+        yield lo, hi
+        lo = hi
+
+
+def score_frame(
+    df: pd.DataFrame,
+    model_for: Callable[[int], Any],
+    chunk_rows: int = 100_000,
+    roll_window: int = 20,
+) -> Iterator[bytes]:
+    """
+    NDJSON lines {"index", "user_id", "score"} for a purchases_frame.
+
+    Each chunk of whole users is featurized in one pass (rolling means per
+    user) and scored with one predict per distinct model that model_for
+    returns; users whose model is None get a null score.
+    """
+    buf = FeatureBuffer()
+    users = df["user_id"].to_numpy()
+    for lo, hi in _chunks(users, int(chunk_rows)):
+        chunk = df.iloc[lo:hi]
+        X = make_feature_matrix(chunk, income=chunk["income"].to_numpy(dtype=float), roll_window=roll_window,
+                                out=buf, by="user_id")
+        chunk_users = users[lo:hi]
+        scores = np.full(len(chunk), np.nan)
+        distinct = np.unique(chunk_users)
+        models: Dict[int, Tuple[Any, List[int]]] = {}
+        for uid in distinct:
+            model = model_for(int(uid))
+            if model is not None:
+                models.setdefault(id(model), (model, []))[1].append(int(uid))
+        for model, uids in models.values():
+            if len(uids) == len(distinct):
+                scores[:] = model.predict(X)
+            else:
+                rows = np.flatnonzero(np.isin(chunk_users, uids))
+                scores[rows] = model.predict(np.ascontiguousarray(X[rows]))
+        pos = chunk["pos"].to_numpy()
+        yield "".join(
+            json.dumps({"index": int(p), "user_id": int(u), "score": (None if s != s else float(s))}) + "\n"
+            for p, u, s in zip(pos, chunk_users, scores)
+        ).encode()
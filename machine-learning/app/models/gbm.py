@@ -4,7 +4,10 @@ import joblib
 import numpy as np
 from typing import List, Optional
 
+from app.models.tree_engine import TreeEnsemble
+
 try:
+    import xgboost as xgb
     from xgboost import XGBRegressor
     _HAS_XGB = True
 except Exception:
@@ -16,12 +19,28 @@ try:
 except Exception:
     _HAS_LGB = False
 
+# save() writes the booster natively next to a JSON config; older
+# directories hold a single pickled bundle in model.joblib instead. xgboost
+# models also get their flattened TreeEnsemble, which serving processes can
+# memory-map instead of loading the booster (see load(booster=False)).
+MODEL_FILES = {"xgboost": "model.ubj", "lightgbm": "model.txt"}
+CONFIG_FILE = "model_config.json"
+TREES_FILE = "trees.npz"
+
 
 class GBMRegressor:
+    # class-level defaults keep models pickled before these attributes existed loadable
+    engine = "xgboost"
+    engine_max_rows = 64
+    _engine_pinned = False
+    _compiled = None
 
     def __init__(self, model_type: str = "xgboost", **kwargs):
         self.model_type = model_type.lower()
         self.kwargs = dict(kwargs)
+        # an engine given here or via set_engine is saved with the model;
+        # otherwise GBM_ENGINE of whichever process loads it applies
+        self._engine_pinned = "engine" in self.kwargs
         self.model = None
         self.is_fitted: bool = False
 
@@ -35,6 +54,15 @@ class GBMRegressor:
             "reg_alpha": 0.0,
             "reg_lambda": 1.0,
             "n_jobs": 0,
+            # incremental (warm-start) updates, see partial_fit
+            "incremental_rounds": 10,
+            "max_trees": 1200,
+            "max_incremental_updates": 50,
+            "drift_tolerance": 1.5,
+            # inference engine: "xgboost", "numpy" (TreeEnsemble) or "auto"
+            # (numpy for batches of at most engine_max_rows rows)
+            "engine": os.getenv("GBM_ENGINE", "xgboost"),
+            "engine_max_rows": 64,
         }
         for k, v in defaults.items():
             self.kwargs.setdefault(k, v)
@@ -48,9 +76,23 @@ class GBMRegressor:
         self.reg_alpha: float = float(self.kwargs["reg_alpha"])
         self.reg_lambda: float = float(self.kwargs["reg_lambda"])
         self.n_jobs: int = int(self.kwargs["n_jobs"])
+        self.incremental_rounds: int = int(self.kwargs["incremental_rounds"])
+        self.max_trees: int = int(self.kwargs["max_trees"])
+        self.max_incremental_updates: int = int(self.kwargs["max_incremental_updates"])
+        self.drift_tolerance: float = float(self.kwargs["drift_tolerance"])
+        self.engine: str = str(self.kwargs["engine"]).lower()
+        self.engine_max_rows: int = int(self.kwargs["engine_max_rows"])
+        self._compiled: Optional[TreeEnsemble] = None
 
         self.feature_order: List[str] = []
+        self.n_trees: int = 0
+        self.incremental_updates: int = 0
+        self.baseline_val_rmse: Optional[float] = None
 
+        self.model = self._new_estimator()
+
+    def _new_estimator(self):
+        """An unfitted sklearn-style estimator for model_type with this instance's params"""
         if self.model_type == "xgboost":
             if not _HAS_XGB:
                 raise RuntimeError("xgboost is not installed")
@@ -67,9 +109,9 @@ class GBMRegressor:
                 "objective": "reg:squarederror",
                 "n_jobs": self.n_jobs,
             }
-            self.model = XGBRegressor(**xgb_args)
+            return XGBRegressor(**xgb_args)
 
-        elif self.model_type == "lightgbm":
+        if self.model_type == "lightgbm":
             if not _HAS_LGB:
                 raise RuntimeError("lightgbm is not installed")
             lgb_args = {
@@ -84,9 +126,8 @@ class GBMRegressor:
                 "objective": "regression",
                 "n_jobs": self.kwargs.get("n_jobs", -1),
             }
-            self.model = lgb.LGBMRegressor(**lgb_args)
-        else:
-            raise ValueError(f"Unknown model_type: {self.model_type}")
+            return lgb.LGBMRegressor(**lgb_args)
+        raise ValueError(f"Unknown model_type: {self.model_type}")
 
     def fit(self, X, y, **fit_kwargs):
         if "eval_set" in fit_kwargs and isinstance(fit_kwargs["eval_set"], tuple):
@@ -100,37 +141,182 @@ class GBMRegressor:
             self.model.fit(X, y, **fit_kwargs)
 
         self.is_fitted = True
+        self._compiled = None
+        self.n_trees = self._count_trees()
+        self.incremental_updates = 0
+        self.baseline_val_rmse = None
         return self
 
+    def _count_trees(self) -> int:
+        try:
+            if self.model_type == "xgboost":
+                return int(self.model.get_booster().num_boosted_rounds())
+            return int(self.model.booster_.current_iteration())
+        except Exception:
+            return 0
+
+    def validation_rmse(self, X_val, y_val) -> Optional[float]:
+        if not self.is_fitted or X_val is None or len(X_val) == 0:
+            return None
+        err = np.asarray(self.predict(X_val), dtype=float) - np.asarray(y_val, dtype=float)
+        return float(np.sqrt(np.mean(err ** 2)))
+
+    def needs_full_refit(self, X_val=None, y_val=None) -> Optional[str]:
+        """Reason a warm-start update is not allowed (None if it is)"""
+        if not self.is_fitted:
+            return "not_fitted"
+        if self.n_trees + self.incremental_rounds > self.max_trees:
+            return "tree_cap"
+        if self.incremental_updates >= self.max_incremental_updates:
+            return "max_incremental_updates"
+        rmse = self.validation_rmse(X_val, y_val)
+        if rmse is not None and self.baseline_val_rmse is not None:
+            if rmse > self.drift_tolerance * max(self.baseline_val_rmse, 1e-6):
+                return "validation_drift"
+        return None
+
+    def partial_fit(self, X, y):
+        """
+        Continue boosting the current ensemble on (X, y) only, adding
+        `incremental_rounds` trees. Callers check needs_full_refit first.
+        """
+        if not self.is_fitted:
+            return self.fit(X, y)
+
+        if self.model_type == "xgboost":
+            # Not XGBRegressor.fit(xgb_model=...): with tree_method="hist" it
+            # re-quantizes on the new rows only, so the existing trees' margins
+            # are computed on the wrong bins. A plain DMatrix keeps them exact.
+            params = {k: v for k, v in self.model.get_xgb_params().items() if v is not None}
+            booster = xgb.train(
+                params,
+                xgb.DMatrix(X, label=y),
+                num_boost_round=self.incremental_rounds,
+                xgb_model=self.model.get_booster(),
+            )
+            self.model.load_model(bytearray(booster.save_raw("ubj")))
+        else:
+            self.model.set_params(n_estimators=self.incremental_rounds)
+            try:
+                self.model.fit(X, y, init_model=self.model.booster_)
+            finally:
+                self.model.set_params(n_estimators=self.n_estimators)
+
+        self._compiled = None
+        self.n_trees = self._count_trees()
+        self.incremental_updates += 1
+        return self
+
+    def incremental_state(self) -> dict:
+        return {
+            "n_trees": self.n_trees,
+            "incremental_updates": self.incremental_updates,
+            "baseline_val_rmse": self.baseline_val_rmse,
+        }
+
+    def restore_incremental_state(self, state: Optional[dict]) -> None:
+        state = state or {}
+        self.n_trees = int(state.get("n_trees") or self._count_trees())
+        self.incremental_updates = int(state.get("incremental_updates", 0))
+        self.baseline_val_rmse = state.get("baseline_val_rmse")
+
+    def to_dmatrix(self, X):
+        """xgboost DMatrix over a feature matrix, named like the training columns"""
+        names = self.feature_order or self.model.get_booster().feature_names
+        return xgb.DMatrix(X, feature_names=list(names) if names else None, nthread=self.n_jobs or -1)
+
+    def __getstate__(self):
+        # the compiled ensemble is rebuilt on demand rather than pickled (unless it is all there is)
+        state = dict(self.__dict__)
+        if self.model is not None:
+            state["_compiled"] = None
+        return state
+
+    def set_engine(self, engine: str) -> None:
+        self.engine = engine.lower()
+        self._engine_pinned = True
+        self._compiled = None
+
+    def compiled(self) -> Optional[TreeEnsemble]:
+        """The fitted booster as a TreeEnsemble (built on first use), or None if it cannot be compiled"""
+        if self._compiled is None and self.is_fitted and self.model_type == "xgboost":
+            try:
+                best = getattr(self.model, "best_iteration", None)
+                self._compiled = TreeEnsemble.from_booster(
+                    self.model.get_booster(), n_trees=best + 1 if best is not None else None
+                )
+            except ValueError as e:
+                print(f"Tree engine unavailable, using xgboost: {e}")
+                self.engine = "xgboost"
+        return self._compiled
+
+    def _use_engine(self, X) -> bool:
+        if self.engine == "numpy":
+            return True
+        return self.engine == "auto" and len(X) <= self.engine_max_rows
+
     def predict(self, X) -> np.ndarray:
+        """
+        X may be a DataFrame, a float32 matrix in feature order (predicted in
+        place by xgboost, with no DataFrame conversion) or a prebuilt DMatrix.
+        """
         if not self.is_fitted:
             raise RuntimeError("Model is not fitted.")
+        if self.engine != "xgboost" and not (_HAS_XGB and isinstance(X, xgb.DMatrix)) and self._use_engine(X):
+            ens = self.compiled()
+            if ens is not None:
+                if hasattr(X, "columns") and ens.feature_names:
+                    X = X[ens.feature_names]
+                return ens.predict(np.asarray(X, dtype=np.float32))
+        if _HAS_XGB and isinstance(X, xgb.DMatrix):
+            best = getattr(self.model, "best_iteration", None)
+            return self.model.get_booster().predict(X, iteration_range=(0, best + 1) if best is not None else (0, 0))
         return self.model.predict(X)
 
+    def params(self) -> dict:
+        return {
+            "n_estimators": self.n_estimators,
+            "learning_rate": self.learning_rate,
+            "max_depth": self.max_depth,
+            "subsample": self.subsample,
+            "colsample_bytree": self.colsample_bytree,
+            "reg_alpha": self.reg_alpha,
+            "reg_lambda": self.reg_lambda,
+            "n_jobs": self.n_jobs,
+        }
+
     def save(self, out_dir: str) -> dict:
+        """
+        The booster in its native format (xgboost UBJSON / LightGBM text)
+        plus a small JSON config; nothing is pickled.
+        """
         os.makedirs(out_dir, exist_ok=True)
-        model_path = os.path.join(out_dir, "model.joblib")
+        model_path = os.path.join(out_dir, MODEL_FILES[self.model_type])
+        config_path = os.path.join(out_dir, CONFIG_FILE)
         meta_path = os.path.join(out_dir, "meta.json")
 
-        joblib.dump(
-            {
-                "model_type": self.model_type,
-                "sk_model": self.model,
-                "feature_order": self.feature_order,
-                "random_state": self.random_state,
-                "params": {
-                    "n_estimators": self.n_estimators,
-                    "learning_rate": self.learning_rate,
-                    "max_depth": self.max_depth,
-                    "subsample": self.subsample,
-                    "colsample_bytree": self.colsample_bytree,
-                    "reg_alpha": self.reg_alpha,
-                    "reg_lambda": self.reg_lambda,
-                    "n_jobs": self.n_jobs,
-                },
-            },
-            model_path,
-        )
+        if self.model_type == "xgboost":
+            self.model.save_model(model_path)
+        else:
+            self.model.booster_.save_model(model_path)
+
+        config = {
+            "format": 1,
+            "model_type": self.model_type,
+            "model_file": os.path.basename(model_path),
+            "feature_order": self.feature_order,
+            "random_state": self.random_state,
+            "params": self.params(),
+            "incremental_state": self.incremental_state(),
+        }
+        if self._engine_pinned:
+            config["engine_pinned"] = self.engine
+        with open(config_path, "w", encoding="utf-8") as f:
+            json.dump(config, f, indent=2)
+        if self.model_type == "xgboost":
+            ens = self.compiled()
+            if ens is not None:
+                ens.save(os.path.join(out_dir, TREES_FILE))
 
         meta = {
             "path": out_dir,
@@ -139,15 +325,62 @@ class GBMRegressor:
             "feature_order": self.feature_order,
             "model_type": self.model_type,
             "random_state": self.random_state,
+            "incremental_state": self.incremental_state(),
         }
         with open(meta_path, "w", encoding="utf-8") as f:
             json.dump(meta, f, indent=2)
 
         return meta
 
-    def load(self, in_dir: str) -> None:
+    def load(self, in_dir: str, booster: bool = True) -> None:
+        """
+        Load a save() directory, or a pre-native one holding model.joblib.
+        booster=False serves predictions from the memory-mapped trees.npz
+        when there is one: no booster in memory, and every process mapping
+        the same version shares its pages. Such a model can predict but not
+        be trained further.
+        """
+        config_path = os.path.join(in_dir, CONFIG_FILE)
+        if not os.path.exists(config_path):
+            return self._load_joblib(in_dir)
+
+        with open(config_path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        model_path = os.path.join(in_dir, config["model_file"])
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Missing model at {model_path}")
+
+        self.model_type = config["model_type"]
+        for k, v in config.get("params", {}).items():
+            setattr(self, k, type(getattr(self, k))(v))
+        self.random_state = int(config.get("random_state", self.random_state))
+        self.feature_order = config.get("feature_order", [])
+        trees_path = os.path.join(in_dir, TREES_FILE)
+        if not booster and os.path.exists(trees_path):
+            self.model = None
+            self._compiled = TreeEnsemble.load(trees_path, mmap=True)
+            self.engine = "numpy"
+            self.is_fitted = True
+            self.restore_incremental_state(config.get("incremental_state"))
+            return
+        self.model = self._new_estimator()
+        if self.model_type == "xgboost":
+            self.model.load_model(model_path)
+        else:
+            _attach_lgb_booster(self.model, lgb.Booster(model_file=model_path))
+        self._restore_engine(config.get("engine_pinned"))
+        self._compiled = None
+        self.is_fitted = True
+        self.restore_incremental_state(config.get("incremental_state"))
+
+    def _restore_engine(self, saved: Optional[str]) -> None:
+        """A saved pin applies unless this instance was given its own engine"""
+        if saved and not self._engine_pinned:
+            self.engine = str(saved).lower()
+            self._engine_pinned = True
+
+    def _load_joblib(self, in_dir: str) -> None:
         model_path = os.path.join(in_dir, "model.joblib")
-        meta_path  = os.path.join(in_dir, "meta.json")
         if not os.path.exists(model_path):
             raise FileNotFoundError(f"Missing model at {model_path}")
 
@@ -156,8 +389,20 @@ class GBMRegressor:
         self.model_type = bundle["model_type"]
         self.feature_order = bundle.get("feature_order", [])
         self.random_state = bundle.get("random_state", self.random_state)
-
-        if os.path.exists(meta_path):
-            with open(meta_path, "r", encoding="utf-8") as f:
-                _meta = json.load(f)
+        self._restore_engine(bundle.get("engine_pinned"))
+        self._compiled = None
         self.is_fitted = True
+        self.restore_incremental_state(bundle.get("incremental_state"))
+
+
+def has_saved_model(in_dir: str) -> bool:
+    return os.path.exists(os.path.join(in_dir, CONFIG_FILE)) or os.path.exists(os.path.join(in_dir, "model.joblib"))
+
+
+def _attach_lgb_booster(model, booster) -> None:
+    """Make an unfitted LGBMRegressor wrap a booster read back from its text dump"""
+    model._Booster = booster
+    model._n_features = model._n_features_in = booster.num_feature()
+    model._best_iteration = booster.best_iteration
+    model._objective = booster.params.get("objective", model.objective)
+    model.fitted_ = True
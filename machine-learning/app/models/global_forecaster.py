@@ -0,0 +1,325 @@
+"""
+One daily-spend sequence model shared by every user.
+
+Trained offline over all stored purchase histories; each user's series is
+scaled by its own recent mean and the LSTM input is conditioned on income
+and category mix, so the same weights serve every user with one batched
+NumPy rollout and no per-request training.
+
+    python -m app.models.global_forecaster train [--root DIR] [--incomes incomes.json]
+    python -m app.models.global_forecaster info [--out DIR]
+"""
+from __future__ import annotations
+import argparse
+import glob
+import json
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.data.purchase_store import NAT_NS, PurchaseHistory, PurchaseStore, _read_jsonl, _ts_to_ns, normalize_purchase
+from app.features.daily_spend import DAY_NS, HISTORY_DAYS, daily_spend_from_arrays
+from app.features.featureizer import CANON_CATS, _to_canon_category
+from app.models.lstm_forecaster import lstm_rollout
+
+COND_FEATURES = ("log_daily_income", "has_income", "log_mean_spend") + tuple(f"mix_{c}" for c in CANON_CATS)
+MODEL_FILE = "global_forecaster.npz"
+WEIGHT_KEYS = ("w_ih", "w_hh", "b_ih", "b_hh", "lin_w", "lin_b")
+_CANON_INDEX = {c: i for i, c in enumerate(CANON_CATS)}
+
+
+def _scale(series) -> float:
+    """Per-user normalizer: mean daily spend over the serving window, floored at $1"""
+    recent = np.asarray(series, dtype=float)[-HISTORY_DAYS:]
+    return max(float(recent.mean()) if recent.size else 0.0, 1.0)
+
+
+def category_mix(categories: Sequence[str], merchants: Sequence[str], amounts: Sequence[float]) -> np.ndarray:
+    """Share of spend per canonical category (same category+merchant rule as the featurizer)"""
+    mix = np.zeros(len(CANON_CATS), dtype=float)
+    memo: Dict[tuple, int] = {}
+    for cat, merch, amt in zip(categories, merchants, amounts):
+        key = (cat, merch)
+        idx = memo.get(key)
+        if idx is None:
+            idx = memo[key] = _CANON_INDEX[_to_canon_category(f"{cat or ''} {merch or ''}")]
+        mix[idx] += max(float(amt), 0.0)
+    total = mix.sum()
+    return mix / total if total > 0 else mix
+
+
+def history_category_mix(hist: PurchaseHistory) -> np.ndarray:
+    """category_mix over a columnar history, canonicalizing each distinct pair once"""
+    if not len(hist):
+        return np.zeros(len(CANON_CATS), dtype=float)
+    rows = hist.rows
+    width = len(hist.strings) + 1
+    pair = rows["category_id"].astype(np.int64) * width + rows["merchant_id"]
+    uniq, inv = np.unique(pair, return_inverse=True)
+    canon = np.array([
+        _CANON_INDEX[_to_canon_category(f"{hist.strings[p // width]} {hist.strings[p % width]}")] for p in uniq
+    ])
+    mix = np.bincount(canon[inv], weights=np.maximum(rows["amount"], 0.0), minlength=len(CANON_CATS))
+    total = mix.sum()
+    return mix / total if total > 0 else mix
+
+
+def conditioning(income_monthly: Optional[float], mix: np.ndarray, scale: float, use_income: bool = True) -> np.ndarray:
+    income = float(income_monthly or 0.0)
+    has_income = use_income and income > 0
+    return np.concatenate([
+        [np.log1p(income / 30.0) if has_income else 0.0, 1.0 if has_income else 0.0, np.log1p(scale)],
+        np.asarray(mix, dtype=float),
+    ]).astype(np.float32)
+
+
+def _full_series(ts_ns: np.ndarray, amount: np.ndarray, max_len: int) -> np.ndarray:
+    valid = ts_ns != NAT_NS
+    if not valid.any():
+        return np.zeros(0)
+    days = ts_ns[valid] // DAY_NS
+    span = int(days.max() - days.min()) + 1
+    return daily_spend_from_arrays(ts_ns, amount, days=min(span, max_len)).values
+
+
+def load_training_users(
+    root: str,
+    incomes: Optional[Dict[int, float]] = None,
+    max_len: int = 180,
+    min_days: int = 14,
+) -> List[Dict[str, Any]]:
+    """Daily series + conditioning for every user in the store and any not-yet-migrated JSONL"""
+    incomes = incomes or {}
+    store = PurchaseStore(root)
+    users = []
+
+    def add(uid, ts_ns, amount, mix):
+        series = _full_series(ts_ns, amount, max_len)
+        if series.size < min_days:
+            return
+        users.append({"user_id": uid, "series": series, "mix": mix, "income": incomes.get(uid)})
+
+    seen = set()
+    for uid in store.user_ids():
+        hist = store.load(uid, mmap=False)
+        add(uid, hist.rows["ts_ns"], hist.rows["amount"], history_category_mix(hist))
+        seen.add(uid)
+    for path in sorted(glob.glob(os.path.join(root, "purchases_*.jsonl"))):
+        m = re.match(r"purchases_(\d+)\.jsonl$", os.path.basename(path))
+        if not m or int(m.group(1)) in seen:
+            continue
+        recs = []
+        for raw in _read_jsonl(path):
+            try:
+                recs.append(normalize_purchase(raw))
+            except Exception:
+                continue
+        ts_ns = np.array([_ts_to_ns(r["ts"]) for r in recs], dtype=np.int64)
+        amount = np.array([r["amount"] for r in recs], dtype=float)
+        mix = category_mix([r["category"] for r in recs], [r["merchant"] for r in recs], amount)
+        add(int(m.group(1)), ts_ns, amount, mix)
+    return users
+
+
+class GlobalForecaster:
+    """Serving side: NumPy weights + meta, batched forecasts for many users at once"""
+
+    def __init__(self, weights: Dict[str, np.ndarray], meta: Dict[str, Any]):
+        self.weights = weights
+        self.meta = meta
+        self.context = int(meta.get("context", HISTORY_DAYS))
+        self.use_income = bool(meta.get("income_seen", False))
+
+    @classmethod
+    def load(cls, path: str) -> "GlobalForecaster":
+        with np.load(path, allow_pickle=False) as z:
+            weights = {k: z[k] for k in WEIGHT_KEYS}
+            meta = json.loads(str(z["meta"]))
+        return cls(weights, meta)
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, meta=np.array(json.dumps(self.meta)), **self.weights)
+        os.replace(tmp, path)
+
+    def forecast_batch(
+        self,
+        histories: Sequence[Sequence[float]],
+        horizon: int = 30,
+        incomes: Optional[Sequence[Optional[float]]] = None,
+        category_mixes: Optional[Sequence[np.ndarray]] = None,
+    ) -> np.ndarray:
+        horizon = int(horizon)
+        n = len(histories)
+        out = np.zeros((n, horizon), dtype=float)
+        rows = [i for i, h in enumerate(histories) if len(h)]
+        if not rows or horizon <= 0:
+            return out
+        w = self.weights
+        ctx = np.zeros((len(rows), self.context), dtype=np.float32)
+        scales = np.empty(len(rows), dtype=float)
+        conds = np.empty((len(rows), len(COND_FEATURES)), dtype=np.float32)
+        no_mix = np.zeros(len(CANON_CATS))
+        for j, i in enumerate(rows):
+            h = np.asarray(histories[i], dtype=float)[-self.context:]
+            scales[j] = _scale(h)
+            ctx[j, self.context - h.size:] = h / scales[j]
+            mix = category_mixes[i] if category_mixes is not None else no_mix
+            conds[j] = conditioning(incomes[i] if incomes is not None else None, mix, scales[j], self.use_income)
+        # conditioning is constant over time: fold it into a per-row gate bias
+        bias = (w["b_ih"] + w["b_hh"])[None, :] + conds @ w["w_ih"][:, 1:].T
+        preds = lstm_rollout(ctx, horizon, w["w_ih"][:, 0], w["w_hh"], bias, w["lin_w"][0], w["lin_b"][0])
+        out[rows] = np.maximum(preds * scales[:, None], 0.0)
+        return out
+
+
+def load_global_forecaster(model_dir: str) -> Optional[GlobalForecaster]:
+    path = os.path.join(model_dir, MODEL_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        return GlobalForecaster.load(path)
+    except Exception as e:
+        print(f"Error loading global forecaster: {e}")
+        return None
+
+
+def train_global(
+    users: List[Dict[str, Any]],
+    hidden: int = 32,
+    epochs: int = 30,
+    batch_size: int = 64,
+    lr: float = 1e-2,
+    threads: Optional[int] = None,
+    seed: int = 0,
+) -> GlobalForecaster:
+    """Fit one LSTM over every user's scaled series in padded, packed mini-batches"""
+    import torch
+    import torch.nn as nn
+    from torch.nn.utils.rnn import pack_padded_sequence, pad_packed_sequence, pad_sequence
+
+    if not users:
+        raise ValueError("no user histories to train on")
+    if threads:
+        torch.set_num_threads(int(threads))
+    torch.manual_seed(seed)
+    rng = np.random.default_rng(seed)
+
+    income_seen = any(u.get("income") for u in users)
+    seqs, conds = [], []
+    for u in users:
+        scale = _scale(u["series"])
+        seqs.append(torch.from_numpy((u["series"] / scale).astype(np.float32)))
+        conds.append(conditioning(u.get("income"), u["mix"], scale, income_seen))
+    conds_t = torch.from_numpy(np.stack(conds))
+
+    lstm = nn.LSTM(1 + len(COND_FEATURES), hidden, batch_first=True)
+    lin = nn.Linear(hidden, 1)
+    opt = torch.optim.Adam(list(lstm.parameters()) + list(lin.parameters()), lr=lr)
+
+    t0 = time.time()
+    for epoch in range(epochs):
+        total, count = 0.0, 0.0
+        perm = rng.permutation(len(seqs))
+        for start in range(0, len(seqs), batch_size):
+            idx = perm[start:start + batch_size]
+            xs = [seqs[i][:-1] for i in idx]
+            ys = [seqs[i][1:] for i in idx]
+            lengths = torch.tensor([len(x) for x in xs])
+            x = pad_sequence(xs, batch_first=True).unsqueeze(-1)
+            steps = x.shape[1]
+            cond = conds_t[idx].unsqueeze(1).expand(-1, steps, -1)
+            packed = pack_padded_sequence(torch.cat([x, cond], dim=-1), lengths, batch_first=True, enforce_sorted=False)
+            out, _ = lstm(packed)
+            out, _ = pad_packed_sequence(out, batch_first=True, total_length=steps)
+            pred = lin(out).squeeze(-1)
+            y = pad_sequence(ys, batch_first=True)
+            mask = (torch.arange(steps)[None, :] < lengths[:, None]).float()
+            loss = ((pred - y) ** 2 * mask).sum() / mask.sum()
+            opt.zero_grad()
+            loss.backward()
+            opt.step()
+            total += float(loss.detach()) * float(mask.sum())
+            count += float(mask.sum())
+        if epoch % 5 == 0 or epoch == epochs - 1:
+            print(f"  Epoch {epoch}, Loss: {total / max(count, 1.0):.4f}")
+
+    weights = {
+        "w_ih": lstm.weight_ih_l0.detach().numpy().astype(np.float32),
+        "w_hh": lstm.weight_hh_l0.detach().numpy().astype(np.float32),
+        "b_ih": lstm.bias_ih_l0.detach().numpy().astype(np.float32),
+        "b_hh": lstm.bias_hh_l0.detach().numpy().astype(np.float32),
+        "lin_w": lin.weight.detach().numpy().astype(np.float32),
+        "lin_b": lin.bias.detach().numpy().astype(np.float32),
+    }
+    meta = {
+        "cond_features": list(COND_FEATURES),
+        "hidden": hidden,
+        "context": HISTORY_DAYS,
+        "income_seen": income_seen,
+        "n_users": len(users),
+        "epochs": epochs,
+        "train_s": round(time.time() - t0, 2),
+        "trained_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    return GlobalForecaster(weights, meta)
+
+
+def evaluate(model: GlobalForecaster, users: List[Dict[str, Any]], horizon: int = 14) -> Dict[str, float]:
+    """MAE on each user's last `horizon` days next to a flat recent-mean forecast"""
+    users = [u for u in users if len(u["series"]) > horizon + 7]
+    if not users:
+        return {}
+    hist = [u["series"][:-horizon] for u in users]
+    truth = np.stack([u["series"][-horizon:] for u in users])
+    pred = model.forecast_batch(hist, horizon, [u.get("income") for u in users], [u["mix"] for u in users])
+    flat = np.stack([np.full(horizon, np.mean(h[-HISTORY_DAYS:])) for h in hist])
+    return {
+        "users": len(users),
+        "mae": round(float(np.mean(np.abs(pred - truth))), 4),
+        "mae_recent_mean": round(float(np.mean(np.abs(flat - truth))), 4),
+    }
+
+
+def main() -> None:
+    default_root = os.getenv("PURCHASE_CACHE_DIR", os.getenv("MODEL_DIR", "./model_artifacts"))
+    ap = argparse.ArgumentParser(description="Global daily-spend forecaster")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    tr = sub.add_parser("train", help="fit on every stored purchase history")
+    tr.add_argument("--root", default=default_root, help="purchase store / JSONL directory")
+    tr.add_argument("--out", default=os.getenv("MODEL_DIR", "./model_artifacts"))
+    tr.add_argument("--incomes", default=None, help="JSON object of user_id -> monthly income")
+    tr.add_argument("--epochs", type=int, default=30)
+    tr.add_argument("--batch-size", type=int, default=64)
+    tr.add_argument("--hidden", type=int, default=32)
+    tr.add_argument("--lr", type=float, default=1e-2)
+    tr.add_argument("--max-len", type=int, default=180)
+    tr.add_argument("--threads", type=int, default=int(os.getenv("TORCH_THREADS", "0")) or None)
+    info = sub.add_parser("info", help="print the saved model's metadata")
+    info.add_argument("--out", default=os.getenv("MODEL_DIR", "./model_artifacts"))
+    args = ap.parse_args()
+
+    path = os.path.join(args.out, MODEL_FILE)
+    if args.cmd == "info":
+        model = load_global_forecaster(args.out)
+        print(json.dumps(model.meta if model else {"error": f"no model at {path}"}, indent=2))
+        return
+
+    incomes = None
+    if args.incomes:
+        with open(args.incomes, "r", encoding="utf-8") as f:
+            incomes = {int(k): float(v) for k, v in json.load(f).items()}
+    users = load_training_users(args.root, incomes, max_len=args.max_len)
+    print(f"Training global forecaster on {len(users)} users...")
+    model = train_global(users, hidden=args.hidden, epochs=args.epochs, batch_size=args.batch_size, lr=args.lr, threads=args.threads)
+    model.meta["in_sample_backtest"] = evaluate(model, users)
+    model.save(path)
+    print(json.dumps(model.meta, indent=2))
+
+
+if __name__ == "__main__":
+    main()
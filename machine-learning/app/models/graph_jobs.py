@@ -0,0 +1,104 @@
+from __future__ import annotations
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Union
+import numpy as np
+
+from app.models.gbm import CONFIG_FILE, GBMRegressor
+from app.models.global_forecaster import GlobalForecaster
+from app.utils.telemetry import get_logger
+from app.utils.workers import worker_count
+
+log = get_logger("graph_jobs")
+
+# The model stages of /get_graph_data as top-level functions, so a CPUPool can
+# run them on worker processes. A model is passed either as the object itself
+# (thread workers) or as its artifact directory, which each worker process
+# loads once and keeps: versioned directories never change under a path.
+_MODELS: "OrderedDict[tuple, GBMRegressor]" = OrderedDict()
+_MODELS_LOCK = threading.Lock()
+MAX_CACHED_MODELS = int(os.getenv("CPU_POOL_MAX_MODELS", "16"))
+# with several server processes, pool workers map the version's trees.npz rather than each loading a booster
+LOAD_BOOSTER = worker_count() <= 1
+
+
+def _model_key(path: str) -> tuple:
+    for name in (CONFIG_FILE, "model.joblib"):
+        try:
+            return path, os.path.getmtime(os.path.join(path, name))
+        except OSError:
+            continue
+    return path, None
+
+
+def resolve_model(ref: Union[GBMRegressor, str, None]) -> Optional[GBMRegressor]:
+    if ref is None or isinstance(ref, GBMRegressor):
+        return ref
+    key = _model_key(ref)
+    with _MODELS_LOCK:
+        gbm = _MODELS.get(key)
+        if gbm is not None:
+            _MODELS.move_to_end(key)
+            return gbm
+    gbm = GBMRegressor()
+    gbm.load(ref, booster=LOAD_BOOSTER)
+    with _MODELS_LOCK:
+        _MODELS[key] = gbm
+        while len(_MODELS) > MAX_CACHED_MODELS:
+            _MODELS.popitem(last=False)
+    return gbm
+
+
+def forecast_spend(forecaster, history, horizon: int, fallback: float,
+                   income: Optional[float] = None, category_mix: Optional[np.ndarray] = None) -> np.ndarray:
+    """Daily spend forecast; flat at `fallback` when the history is too short or constant"""
+    history = np.asarray(history, dtype=float)
+    if len(history) < 3 or np.std(history) < 1e-6:
+        return np.full(int(horizon), fallback, dtype=float)
+    if isinstance(forecaster, GlobalForecaster):
+        return forecaster.forecast_batch([history], horizon, incomes=[income], category_mixes=[category_mix])[0]
+    return forecaster.forecast(history, horizon)
+
+
+def graph_models(
+    model_ref,
+    X,
+    latest_ref,
+    latest_X,
+    forecaster,
+    history,
+    horizon: int,
+    fallback: float,
+    income: Optional[float] = None,
+    category_mix: Optional[np.ndarray] = None,
+) -> Dict[str, Any]:
+    """
+    Purchase scores, the latest purchase's score and the spend forecast in one
+    job (one pool slot and one round trip per request). Each stage reports its
+    own error instead of failing the others; out["timings"] has each stage's
+    seconds, measured wherever the job ran.
+    """
+    out: Dict[str, Any] = {"scores": [], "score_error": None, "latest_score": None,
+                           "forecast": None, "forecast_error": None, "timings": {}}
+    t0 = time.perf_counter()
+    try:
+        if X is not None:
+            out["scores"] = resolve_model(model_ref).predict(X).tolist()
+    except Exception as e:
+        out["score_error"] = f"ML pipeline failed: {e}"
+    if latest_X is not None:
+        try:
+            scores = resolve_model(latest_ref).predict(latest_X) if len(latest_X) else []
+            out["latest_score"] = float(scores[0]) if len(scores) > 0 else 750.0
+        except Exception as e:
+            log.warning(f"Error getting latest score: {e}")
+            out["latest_score"] = 750.0
+    t1 = time.perf_counter()
+    try:
+        out["forecast"] = forecast_spend(forecaster, history, horizon, fallback, income, category_mix)
+    except Exception as e:
+        out["forecast_error"] = str(e)
+    out["timings"] = {"predict": t1 - t0, "forecast": time.perf_counter() - t1}
+    return out
@@ -1,66 +1,174 @@
 from __future__ import annotations
 import numpy as np
 import hashlib
+import importlib.util
 import json
 import os
-import joblib
 
-try:
+# torch is only needed to train; serving runs on the NumPy weights below.
+_HAS_TORCH = importlib.util.find_spec("torch") is not None
+_TinyLSTM = None
+
+WEIGHT_KEYS = ("w_ih", "w_hh", "b_ih", "b_hh", "lin_w", "lin_b")
+
+
+def _torch():
+    """Import torch (and define _TinyLSTM) on first use"""
+    global _TinyLSTM
     import torch
     import torch.nn as nn
 
-    _HAS_TORCH = True
-except Exception:
-    _HAS_TORCH = False
+    if _TinyLSTM is None:
+        class TinyLSTM(nn.Module):
+            def __init__(self, input_dim=1, hidden=32):
+                super().__init__()
+                self.lstm = nn.LSTM(input_dim, hidden, batch_first=True)
+                self.lin = nn.Linear(hidden, 1)
+
+            def forward(self, x):
+                out, _ = self.lstm(x)
+                out = self.lin(out[:, -1, :])
+                return out
+
+        # keep legacy pickles (which reference module-level _TinyLSTM) loadable
+        TinyLSTM.__name__ = TinyLSTM.__qualname__ = "_TinyLSTM"
+        _TinyLSTM = TinyLSTM
+    return torch, nn
+
+
+def weights_from_module(model) -> dict:
+    """Flat float32 arrays from a trained _TinyLSTM"""
+    sd = model.state_dict()
+    return {
+        "w_ih": sd["lstm.weight_ih_l0"].detach().cpu().numpy().astype(np.float32),
+        "w_hh": sd["lstm.weight_hh_l0"].detach().cpu().numpy().astype(np.float32),
+        "b_ih": sd["lstm.bias_ih_l0"].detach().cpu().numpy().astype(np.float32),
+        "b_hh": sd["lstm.bias_hh_l0"].detach().cpu().numpy().astype(np.float32),
+        "lin_w": sd["lin.weight"].detach().cpu().numpy().astype(np.float32),
+        "lin_b": sd["lin.bias"].detach().cpu().numpy().astype(np.float32),
+    }
+
+
+def _sigmoid(x):
+    return 0.5 * (np.tanh(0.5 * x) + 1.0)
 
-if _HAS_TORCH:
-    class _TinyLSTM(nn.Module):
-        def __init__(self, input_dim=1, hidden=32):
-            super().__init__()
-            self.lstm = nn.LSTM(input_dim, hidden, batch_first=True)
-            self.lin = nn.Linear(hidden, 1)
 
-        def forward(self, x):
-            out, _ = self.lstm(x)
-            out = self.lin(out[:, -1, :])
-            return out
+def lstm_rollout(ctx, horizon, w_in, w_hh, bias, w_out, b_out):
+    """
+    Encode ctx (batch, steps) with a single-layer LSTM, then feed each
+    prediction back in for `horizon` days. bias may be per-row (batch, 4H)
+    to fold in constant extra inputs. Returns (batch, horizon) float64.
+    """
+    w_hh_t = np.ascontiguousarray(w_hh.T)
+    x = np.asarray(ctx, dtype=np.float32)
+    h = np.zeros((x.shape[0], w_hh_t.shape[0]), dtype=np.float32)
+    c = np.zeros_like(h)
+    preds = np.empty((x.shape[0], horizon), dtype=np.float32)
+
+    def step(xt, h, c):
+        gates = h @ w_hh_t + bias + xt[:, None] * w_in
+        i, f, g, o = np.split(gates, 4, axis=1)
+        c = _sigmoid(f) * c + _sigmoid(i) * np.tanh(g)
+        h = _sigmoid(o) * np.tanh(c)
+        return h, c
+
+    for t in range(x.shape[1]):
+        h, c = step(x[:, t], h, c)
+    nxt = h @ w_out + b_out
+    preds[:, 0] = nxt
+    for t in range(1, horizon):
+        h, c = step(nxt, h, c)
+        nxt = h @ w_out + b_out
+        preds[:, t] = nxt
+    return preds.astype(float)
 
 
 class LSTMForecaster:
-    def __init__(self):
+    def __init__(self, model_dir=None):
+        self.model_dir = model_dir or os.getenv("MODEL_DIR", "./model_artifacts")
+        self.weights_path = os.path.join(self.model_dir, "lstm_weights.npz")
+        self.legacy_path = os.path.join(self.model_dir, "lstm_model.pkl")
         self.model = None
+        self.weights = None
         self.is_trained = False
-        self.model_path = "model_artifacts/lstm_model.pkl"
         self.last_training_data_hash = None
+        self.window = 10
+        self._weights_mtime = None
         self.load_model()
 
+    def _saved_mtime(self):
+        try:
+            return os.stat(self.weights_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def reload_if_changed(self):
+        """Reload weights another process saved since this instance last loaded or set them"""
+        if self._saved_mtime() == self._weights_mtime:
+            return False
+        self.load_model()
+        return True
+
     def load_model(self):
-        """Load saved LSTM model if it exists"""
+        """Load saved LSTM weights (or convert a legacy pickled module) if present"""
+        self._weights_mtime = self._saved_mtime()
         try:
-            if os.path.exists(self.model_path):
-                saved_data = joblib.load(self.model_path)
-                if _HAS_TORCH and isinstance(saved_data, dict):
-                    self.model = saved_data.get('model')
-                    self.is_trained = saved_data.get('is_trained', False)
-                    self.last_training_data_hash = saved_data.get('data_hash')
+            if os.path.exists(self.weights_path):
+                with np.load(self.weights_path, allow_pickle=False) as z:
+                    self.weights = {k: z[k] for k in WEIGHT_KEYS}
+                    self.is_trained = bool(z["is_trained"])
+                    self.last_training_data_hash = str(z["data_hash"]) or None
+            elif os.path.exists(self.legacy_path) and _HAS_TORCH:
+                import joblib
+
+                _torch()
+                saved_data = joblib.load(self.legacy_path)
+                if isinstance(saved_data, dict) and saved_data.get("model") is not None:
+                    self.weights = weights_from_module(saved_data["model"])
+                    self.is_trained = saved_data.get("is_trained", False)
+                    self.last_training_data_hash = saved_data.get("data_hash")
+                    self.save_model()
         except Exception as e:
             print(f"Error loading LSTM model: {e}")
-            self.model = None
+            self.weights = None
             self.is_trained = False
 
     def save_model(self):
-        """Save LSTM model to disk"""
+        """Save LSTM weights to disk"""
+        if self.weights is None:
+            return
         try:
-            os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
-            save_data = {
-                'model': self.model,
-                'is_trained': self.is_trained,
-                'data_hash': self.last_training_data_hash
-            }
-            joblib.dump(save_data, self.model_path)
+            os.makedirs(self.model_dir, exist_ok=True)
+            tmp = self.weights_path + ".tmp.npz"
+            np.savez(
+                tmp,
+                is_trained=np.array(self.is_trained),
+                data_hash=np.array(self.last_training_data_hash or ""),
+                **self.weights,
+            )
+            os.replace(tmp, self.weights_path)
+            self._weights_mtime = self._saved_mtime()
         except Exception as e:
             print(f"Error saving LSTM model: {e}")
 
+    def __getstate__(self):
+        # serving needs only the NumPy weights; the torch module stays behind
+        state = dict(self.__dict__)
+        state["model"] = None
+        return state
+
+    def memory_bytes(self):
+        weights = sum(int(v.nbytes) for v in self.weights.values()) if self.weights else 0
+        return weights + 2048
+
+    def set_weights(self, weights, data_hash=None):
+        """Serve weights trained elsewhere (e.g. in a training worker)"""
+        self.weights = weights
+        self.model = None
+        self.last_training_data_hash = data_hash
+        self.is_trained = weights is not None
+        self._weights_mtime = self._saved_mtime()
+
     def get_data_hash(self, history):
         """Generate hash of training data to detect changes"""
         data_str = json.dumps(history, sort_keys=True)
@@ -82,6 +190,7 @@ class LSTMForecaster:
             return True
 
         print(f"Training LSTM on {len(h)} data points...")
+        torch, nn = _torch()
 
         x = torch.tensor(h[:-1], dtype=torch.float32).view(1, -1, 1)
         y = torch.tensor(h[1:], dtype=torch.float32).view(1, -1, 1)
@@ -101,6 +210,7 @@ class LSTMForecaster:
             if epoch % 50 == 0:
                 print(f"  Epoch {epoch}, Loss: {loss.item():.4f}")
 
+        self.weights = weights_from_module(self.model)
         self.is_trained = True
         self.last_training_data_hash = current_hash
         self.save_model()
@@ -109,24 +219,36 @@ class LSTMForecaster:
 
     def forecast(self, history, horizon=30):
         """Generate forecast using trained model or fallback"""
-        horizon = int(horizon)
-        h = np.array(history or [], dtype=float).reshape(-1)
+        return self.forecast_batch([history], horizon)[0]
 
-        if not _HAS_TORCH or not self.is_trained or self.model is None or h.size < 10:
-            return self._numpy_forecast(h, horizon)
+    def forecast_batch(self, histories, horizon=30):
+        """
+        Forecast several daily-spend histories in one batched rollout.
 
-        self.model.eval()
-        with torch.no_grad():
-            cur = torch.tensor(h[-10:], dtype=torch.float32).view(1, -1, 1)
-            out = []
-            for _ in range(horizon):
-                nxt = self.model(cur)
-                out.append(nxt.item())
-                cur = torch.cat([cur[:, 1:, :], nxt.view(1, 1, 1)], dim=1)
+        The last `window` days of each history are encoded once; each further
+        day feeds the previous prediction through the LSTM with its carried
+        (h, c) state. Runs on the NumPy weights, so serving never imports torch.
+        """
+        horizon = int(horizon)
+        hs = [np.array(h if h is not None else [], dtype=float).reshape(-1) for h in histories]
+        out = np.zeros((len(hs), horizon), dtype=float)
+        use_model = self.is_trained and self.weights is not None
+        rows = []
+        for i, h in enumerate(hs):
+            if use_model and h.size >= self.window:
+                rows.append(i)
+            else:
+                out[i] = self._numpy_forecast(h, horizon)
+        if rows and horizon > 0:
+            ctx = np.stack([hs[i][-self.window:] for i in rows])
+            out[rows] = self._rollout(ctx, horizon)
+        return np.maximum(out, 0.0)
 
-        out = np.array(out, dtype=float)
-        out = np.maximum(out, 0.0)
-        return out
+    def _rollout(self, ctx: np.ndarray, horizon: int) -> np.ndarray:
+        w = self.weights
+        return lstm_rollout(
+            ctx, horizon, w["w_ih"][:, 0], w["w_hh"], w["b_ih"] + w["b_hh"], w["lin_w"][0], w["lin_b"][0]
+        )
 
     def _numpy_forecast(self, history: np.ndarray, horizon: int) -> np.ndarray:
         """Fallback numpy-based forecast"""
@@ -145,22 +267,56 @@ class LSTMForecaster:
 
 # Global forecaster instance
 _forecaster = None
+_pool = None
+
 
+def user_model_dir(user_id):
+    return os.path.join(os.getenv("MODEL_DIR", "./model_artifacts"), "users", str(int(user_id)))
 
-def get_forecaster():
-    """Get or create the global forecaster instance"""
+
+def forecaster_pool():
+    """Per-user forecasters, loaded from each user's model dir and evicted LRU by size"""
+    global _pool
+    if _pool is None:
+        from app.models.registry import ModelRegistry
+
+        _pool = ModelRegistry(
+            loader=lambda uid: LSTMForecaster(model_dir=user_model_dir(uid)),
+            sizer=lambda f: f.memory_bytes(),
+            max_bytes=int(os.getenv("LSTM_POOL_MAX_BYTES", str(64 * 1024 * 1024))),
+        )
+    return _pool
+
+
+def get_forecaster(user_id=None):
+    """The user's forecaster, or the global instance when user_id is None"""
     global _forecaster
+    if user_id is not None:
+        return forecaster_pool().get(int(user_id))
     if _forecaster is None:
         _forecaster = LSTMForecaster()
     return _forecaster
 
 
-def forecast_daily_spend(history, horizon=30):
-    """Main entry point for forecasting"""
-    forecaster = get_forecaster()
+def forecast_daily_spend(history, horizon=30, train=True, user_id=None):
+    """Main entry point for forecasting; train=False serves the last trained model as-is"""
+    forecaster = get_forecaster(user_id)
 
     # Try to train if we have enough data
-    if len(history) >= 10:
+    if train and len(history) >= 10:
         forecaster.train_model(history)
 
-    return forecaster.forecast(history, horizon)
\ No newline at end of file
+    return serving_forecaster(user_id).forecast(history, horizon)
+
+
+def serving_forecaster(user_id=None):
+    """The forecaster that serves a user: their own, or the global one until theirs is trained"""
+    forecaster = get_forecaster(user_id)
+    if user_id is not None and not forecaster.is_trained and get_forecaster().is_trained:
+        forecaster = get_forecaster()
+    return forecaster
+
+
+def forecast_daily_spend_batch(histories, horizon=30):
+    """Forecast many users' histories with the current model in one batched call"""
+    return get_forecaster().forecast_batch(histories, horizon)
@@ -1,53 +1,105 @@
 import pandas as pd
 import numpy as np
-from typing import List, Dict
+from typing import List, Dict, Tuple
+import copy
 import joblib
 import os
-from app.features.featureizer import make_purchase_features
-from app.models.gbm import GBMRegressor
+import sys
+from app.features.featureizer import make_purchase_features, parse_timestamps
+from app.models.gbm import GBMRegressor, has_saved_model
+from app.data.record_columns import load_records, save_records
+from app.models.artifact_store import ArtifactStore
+from app.utils.workers import worker_count
 
 
 class ModelRetrainer:
-    def __init__(self):
-        self.model_path = "model_artifacts/model.joblib"
-        self.meta_path = "model_artifacts/meta.json"
-        self.training_data_path = "model_artifacts/training_data.pkl"
+    def __init__(self, artifact_dir: str = "model_artifacts", load: bool = True, serve_only: bool = False):
+        self.artifact_dir = artifact_dir
+        # serve_only: predict from the memory-mapped trees, skip the booster and training history
+        self.serve_only = serve_only
+        # model files are versioned in the store; training history stays at the root
+        self.store = ArtifactStore(artifact_dir, keep=int(os.getenv("ARTIFACT_KEEP", "5")))
+        self.version = self.store.current()
+        self.training_data_path = os.path.join(artifact_dir, "training_data.npz")
+        self.legacy_training_data_path = os.path.join(artifact_dir, "training_data.pkl")
         self.model = None
         self.training_history = []
-        self.load_model()
-        self.load_training_history()
+        # why the last retrain_model call returned False
+        self.last_error = None
+        # recent rows used to measure drift before a warm-start update
+        self.val_window = 200
+        # a warm-start update boosts on the new rows plus this many preceding
+        # ones; a tree grown on a single row is just a constant shift
+        self.replay_window = 100
+        if load:
+            self.load_model()
+            if not serve_only:
+                self.load_training_history()
+        else:
+            self.model = GBMRegressor()
+
+    @property
+    def model_dir(self) -> str:
+        """Directory holding the version this retrainer serves"""
+        return self.store.path(self.version) if self.version else self.artifact_dir
 
     def load_model(self):
+        # load off to the side: requests keep scoring with the current model
+        # (and version) until the new one is ready, then both switch together
         try:
-            if os.path.exists(self.model_path):
-                model_data = joblib.load(self.model_path)
-                if isinstance(model_data, dict) and 'sk_model' in model_data:
-                    # Load from the structured format
-                    self.model = GBMRegressor()
-                    self.model.model = model_data['sk_model']
-                    self.model.is_fitted = True
-                    self.model.model_type = model_data.get('model_type', 'xgboost')
-                else:
-                    # Legacy format or direct model
-                    self.model = model_data if hasattr(model_data, 'predict') else GBMRegressor()
-            else:
-                self.model = GBMRegressor()
+            version = self.store.current()
+            model_dir = self.store.current_path()
+            model = GBMRegressor()
+            if has_saved_model(model_dir):
+                model.load(model_dir, booster=not self.serve_only)
+            self.model, self.version = model, version
         except Exception as e:
             print(f"Error loading model: {e}")
-            self.model = GBMRegressor()
+            if self.model is None:
+                self.model = GBMRegressor()
+
+    def seed_from(self, other: "ModelRetrainer") -> None:
+        """Start from another retrainer's model and history (e.g. the shared model for a new user)"""
+        if other.model is not None and other.model.is_fitted:
+            self.model = copy.deepcopy(other.model)
+        self.training_history = list(other.training_history)
+
+    def memory_bytes(self) -> int:
+        """Rough in-memory footprint, used to bound the per-user model registry"""
+        total = 0
+        if self.model is not None and self.model.is_fitted and self.model.model is None:
+            # memory-mapped trees: file pages shared by every process, not owned by this one
+            total += 16 * 1024
+        elif self.model is not None and self.model.is_fitted:
+            try:
+                if self.model.model_type == "xgboost":
+                    total += len(self.model.model.get_booster().save_raw("ubj"))
+                else:
+                    total += len(self.model.model.booster_.model_to_string())
+            except Exception:
+                total += 512 * 1024
+        if self.training_history:
+            sample = self.training_history[-1]
+            row = sys.getsizeof(sample) + sum(sys.getsizeof(v) for v in sample.values())
+            total += row * len(self.training_history)
+        return total
 
     def load_training_history(self):
+        """Columnar .npz history, converting a legacy pickled list on first load"""
         try:
             if os.path.exists(self.training_data_path):
-                self.training_history = joblib.load(self.training_data_path)
+                self.training_history = load_records(self.training_data_path)
+            elif os.path.exists(self.legacy_training_data_path):
+                self.training_history = list(joblib.load(self.legacy_training_data_path))
+                self.save_training_history()
         except Exception as e:
             print(f"Error loading training history: {e}")
             self.training_history = []
 
     def save_training_history(self):
         try:
-            os.makedirs(os.path.dirname(self.training_data_path), exist_ok=True)
-            joblib.dump(self.training_history, self.training_data_path)
+            os.makedirs(os.path.dirname(self.training_data_path) or ".", exist_ok=True)
+            save_records(self.training_data_path, self.training_history)
         except Exception as e:
             print(f"Error saving training history: {e}")
 
@@ -78,6 +130,40 @@ class ModelRetrainer:
         features = make_purchase_features(df, income=user_income)
         return features
 
+    def prepare_training_batch(self, purchases: List[Dict]) -> Tuple[pd.DataFrame, np.ndarray]:
+        """
+        Feature matrix and targets for stored training rows in one featurizer pass.
+
+        Matches calling prepare_training_data([purchase], purchase['user_income'])
+        row by row: each row gets its own income, delta_vs_cat is computed
+        against the row alone, and rows without a parseable timestamp are dropped.
+        """
+        if not purchases:
+            return pd.DataFrame(), np.array([])
+
+        df = pd.DataFrame(purchases)
+
+        if 'ts' not in df.columns:
+            df['ts'] = df['purchase_time'] if 'purchase_time' in df.columns else pd.Timestamp.now()
+        elif 'purchase_time' in df.columns:
+            df['ts'] = df['ts'].where(df['ts'].notna(), df['purchase_time'])
+
+        df['ts'] = parse_timestamps(df['ts'])
+        df = df.dropna(subset=['ts'])
+
+        if df.empty:
+            return pd.DataFrame(), np.array([])
+
+        df['amount'] = pd.to_numeric(df['amount'], errors='coerce').fillna(0.0)
+        for col, default in (('is_recurring', False), ('description', ''), ('merchant', ''), ('category', '')):
+            df[col] = df[col].fillna(default) if col in df.columns else default
+
+        features = make_purchase_features(df, income=df['user_income'].to_numpy(dtype=float), roll_window=1)
+        # the row-wise path stacks Series rows, which upcasts every column to float64
+        features = features.astype(np.float64).reset_index(drop=True)
+        targets = df['target_score'].to_numpy(dtype=float)
+        return features, targets
+
     def calculate_target_score(self, purchase_data: Dict, user_income: float) -> float:
         """
         Calculate a more realistic target score based on purchase characteristics
@@ -125,61 +211,81 @@ class ModelRetrainer:
         # Clamp to reasonable range
         return max(300, min(1000, final_score))
 
-    def retrain_model(self, new_purchases: List[Dict], user_income: float) -> bool:
+    def retrain_model(self, new_purchases: List[Dict], user_income: float, incremental: bool = True) -> bool:
+        if self.serve_only:
+            raise RuntimeError("serve-only retrainer has no booster to train")
+        self.last_error = None
         try:
             if not new_purchases:
                 return True
 
             # Add new purchases to training history
+            added = []
             for purchase in new_purchases:
                 purchase_copy = dict(purchase)
                 purchase_copy['user_income'] = user_income
                 purchase_copy['target_score'] = self.calculate_target_score(purchase, user_income)
-                self.training_history.append(purchase_copy)
+                added.append(purchase_copy)
+            self.training_history.extend(added)
 
             # Keep only recent history (last 1000 purchases) to prevent memory issues
             if len(self.training_history) > 1000:
                 self.training_history = self.training_history[-1000:]
 
-            # Prepare features for all historical data
-            all_features = []
-            all_targets = []
-
-            for purchase in self.training_history:
-                features = self.prepare_training_data([purchase], purchase['user_income'])
-                if not features.empty:
-                    all_features.append(features.iloc[0])
-                    all_targets.append(purchase['target_score'])
+            if self.model is None:
+                self.model = GBMRegressor()
 
-            if not all_features:
-                return True
+            mode = "full"
+            if incremental and self.model.is_fitted:
+                mode = self._try_incremental_update(added)
 
-            X = pd.DataFrame(all_features)
-            y = np.array(all_targets)
+            if mode != "incremental":
+                # Prepare features for all historical data
+                X, y = self.prepare_training_batch(self.training_history)
 
-            # Retrain the model
-            if self.model is None:
-                self.model = GBMRegressor()
+                if X.empty:
+                    return True
 
-            self.model.fit(X, y)
+                self.model.fit(X, y)
+                X_val, y_val = self.prepare_training_batch(self.training_history[-self.val_window:])
+                self.model.baseline_val_rmse = self.model.validation_rmse(X_val, y_val)
 
-            # Save the retrained model
-            os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
-            self.model.save(os.path.dirname(self.model_path))
+            # Publish the retrained model as a new version
+            self.version = self.store.publish(self.model.save)
 
             # Save training history
             self.save_training_history()
 
             print(
-                f"Model retrained with {len(new_purchases)} new purchases. Total training samples: {len(self.training_history)}")
+                f"Model retrained ({mode}) with {len(new_purchases)} new purchases. "
+                f"Total training samples: {len(self.training_history)}, trees: {self.model.n_trees}")
             return True
 
         except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
             print(f"Error retraining model: {e}")
             import traceback
             traceback.print_exc()
             return False
 
+    def _try_incremental_update(self, added: List[Dict]) -> str:
+        """Boost the fitted model on just the added rows unless the rebuild policy says otherwise"""
+        n_prior = max(0, len(self.training_history) - max(len(added), self.replay_window))
+        X_val, y_val = self.prepare_training_batch(self.training_history[max(0, n_prior - self.val_window):n_prior])
+        reason = self.model.needs_full_refit(X_val, y_val)
+        if reason is not None:
+            return f"full: {reason}"
+
+        X_new, y_new = self.prepare_training_batch(self.training_history[n_prior:])
+        if X_new.empty:
+            return "full: no_new_rows"
+        try:
+            self.model.partial_fit(X_new, y_new)
+        except Exception as e:
+            print(f"Incremental update failed, doing a full refit: {e}")
+            return "full: incremental_failed"
+        return "incremental"
+
     def predict(self, features: pd.DataFrame) -> np.ndarray:
         if self.model is None or not self.model.is_fitted:
             # Return default scores if model not ready
@@ -205,4 +311,7 @@ class ModelRetrainer:
             return 750.0
 
 
-model_retrainer = ModelRetrainer()
\ No newline at end of file
+# the shared base model; main serves and rolls back the same MODEL_DIR store.
+# With several server processes each one only serves it from the memory-mapped
+# trees; whatever trains on it loads a full ModelRetrainer of its own
+model_retrainer = ModelRetrainer(os.getenv("MODEL_DIR", "./model_artifacts"), serve_only=worker_count() > 1)
\ No newline at end of file
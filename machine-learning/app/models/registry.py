@@ -0,0 +1,105 @@
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+
+class ModelRegistry:
+    """
+    Thread-safe, lazily loading LRU of per-key model objects bounded by bytes.
+
+    `loader(key)` builds a value on a miss (typically from that key's artifact
+    directory) and `sizer(value)` estimates its footprint. Concurrent misses
+    for the same key share one load. Evicted values are simply dropped:
+    everything in here must be reloadable from disk.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[Hashable], Any],
+        sizer: Callable[[Any], int],
+        max_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.loader = loader
+        self.sizer = sizer
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._loading: Dict[Hashable, threading.Event] = {}
+        self._bytes = 0
+        self._counters = {"hits": 0, "misses": 0, "loads": 0, "evictions": 0}
+
+    def get(self, key: Hashable) -> Any:
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return entry[0]
+                pending = self._loading.get(key)
+                if pending is None:
+                    self._counters["misses"] += 1
+                    pending = self._loading[key] = threading.Event()
+                    owner = True
+                else:
+                    owner = False
+            if not owner:
+                pending.wait()
+                continue
+            try:
+                value = self.loader(key)
+                with self._lock:
+                    self._counters["loads"] += 1
+                self.put(key, value)
+                return value
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+                pending.set()
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Cached value without loading or touching recency"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry is not None else None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        nbytes = max(0, int(self.sizer(value)))
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, nbytes)
+            self._bytes += nbytes
+            # never evict the entry just inserted, even if it alone exceeds the budget
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._bytes -= evicted_bytes
+                self._counters["evictions"] += 1
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self._bytes -= entry[1]
+            return entry[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def keys(self) -> List[Hashable]:
+        with self._lock:
+            return list(self._entries.keys())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                **self._counters,
+            }
@@ -0,0 +1,281 @@
+from __future__ import annotations
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from functools import partial
+from multiprocessing import get_context
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from app.data.purchase_store import PurchaseHistory
+from app.features.daily_spend import daily_spend_from_history, daily_spend_from_records
+from app.utils.telemetry import get_logger
+
+log = get_logger("train_scheduler")
+
+
+def run_training_job(
+    user_id: int,
+    records: Union[PurchaseHistory, List[Dict[str, Any]]],
+    income_monthly: float,
+    expenditures_monthly: float = 0.0,
+    new_records: Optional[List[Dict[str, Any]]] = None,
+    artifact_dir: Optional[str] = None,
+    base_artifact_dir: Optional[str] = None,
+    daily_spend_hist: Optional[List[float]] = None,
+    train_lstm: bool = True,
+) -> Dict[str, Any]:
+    """
+    Retrain GBM + LSTM for one user; runs inside a pool worker.
+
+    With artifact_dir the GBM is the user's own (a new user starts from the
+    shared model in base_artifact_dir); without it, the shared retrainer.
+    daily_spend_hist is the request's already-aggregated series, if any.
+    train_lstm=False skips the per-user LSTM (a global forecaster serves it).
+    records may be the user's columnar PurchaseHistory: it is decoded into
+    dicts only when the model has to be trained on all of it.
+    """
+    from app.models.model_retrainer import ModelRetrainer, model_retrainer
+    from app.models.lstm_forecaster import LSTMForecaster, get_forecaster
+
+    # The worker process outlives a single job, so always start from
+    # whatever the previous job (possibly in another worker) persisted.
+    if artifact_dir is not None:
+        retrainer = ModelRetrainer(artifact_dir)
+        if not retrainer.model.is_fitted and base_artifact_dir:
+            retrainer.seed_from(ModelRetrainer(base_artifact_dir))
+    elif model_retrainer.serve_only:
+        # one of several server processes: the shared retrainer only serves
+        retrainer = ModelRetrainer(model_retrainer.artifact_dir)
+    else:
+        retrainer = model_retrainer
+        retrainer.load_model()
+        retrainer.load_training_history()
+
+    # warm-start the GBM on just the purchases that triggered this job
+    use_new = new_records is not None and retrainer.model.is_fitted
+    if use_new:
+        gbm_success = retrainer.retrain_model(new_records, income_monthly)
+    else:
+        full = records.records() if isinstance(records, PurchaseHistory) else records
+        gbm_success = retrainer.retrain_model(full, income_monthly)
+
+    if daily_spend_hist is None:
+        daily = daily_spend_from_history(records) if isinstance(records, PurchaseHistory) else daily_spend_from_records(records)
+        daily_spend_hist = daily.history(fill_empty=True)
+    # the saved data hash makes this a no-op when the series hasn't changed
+    forecaster = LSTMForecaster(model_dir=artifact_dir) if artifact_dir is not None else get_forecaster()
+    lstm_success = forecaster.train_model(daily_spend_hist) if train_lstm else False
+
+    # the job "succeeds" only if every model it was asked to train trained;
+    # a history too short for the LSTM is not a failure
+    errors = []
+    if not gbm_success:
+        errors.append(f"GBM retrain failed: {retrainer.last_error or 'unknown error'}")
+    if train_lstm and not lstm_success and len(daily_spend_hist) >= 10:
+        errors.append(f"LSTM training failed on {len(daily_spend_hist)} days of history")
+
+    return {
+        "user_id": int(user_id),
+        "gbm_success": bool(gbm_success),
+        "lstm_success": bool(lstm_success),
+        "artifact_dir": artifact_dir,
+        "gbm_model": retrainer.model if gbm_success else None,
+        "training_history": retrainer.training_history if gbm_success else None,
+        "lstm_weights": forecaster.weights if lstm_success else None,
+        "lstm_hash": forecaster.last_training_data_hash,
+        "purchases_processed": len(records),
+        "len_hist_days": len(daily_spend_hist),
+        "error": "; ".join(errors) or None,
+    }
+
+
+class TrainingScheduler:
+    """
+    Background retraining queue.
+
+    `submit` records a "user X has new purchases" event and returns
+    immediately. Events for a user that is already queued are coalesced
+    (latest payload wins, `new_records` accumulate), and a user is never
+    trained by two workers at once. Jobs run in a process pool; `on_result`
+    is called in the parent with the job's return value so the caller can
+    swap in the new models.
+    """
+
+    def __init__(
+        self,
+        job_fn: Callable[..., Dict[str, Any]] = run_training_job,
+        on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+        max_workers: int = 1,
+        debounce_s: float = 0.5,
+        executor: str = "process",
+    ):
+        self.job_fn = job_fn
+        self.on_result = on_result
+        self.max_workers = max(1, int(max_workers))
+        self.debounce_s = max(0.0, float(debounce_s))
+        self.executor_kind = executor
+        self._cv = threading.Condition()
+        self._pending: "OrderedDict[int, tuple]" = OrderedDict()
+        self._in_flight: Dict[int, float] = {}
+        self._last_trained: Dict[int, str] = {}
+        self._last_error: Dict[int, str] = {}
+        self._counters = {"submitted": 0, "coalesced": 0, "completed": 0, "failed": 0}
+        self._executor = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+    def submit(self, user_id: int, **payload) -> None:
+        uid = int(user_id)
+        with self._cv:
+            self._counters["submitted"] += 1
+            if uid in self._pending:
+                self._counters["coalesced"] += 1
+                queued = self._pending[uid][1]
+                if queued.get("new_records") is not None and payload.get("new_records") is not None:
+                    payload["new_records"] = list(queued["new_records"]) + list(payload["new_records"])
+            self._pending[uid] = (time.monotonic(), payload)
+            self._ensure_started()
+            self._cv.notify_all()
+
+    def status(self, user_id: Optional[int] = None) -> Dict[str, Any]:
+        with self._cv:
+            out = {
+                "queue_depth": len(self._pending),
+                "queued_users": list(self._pending.keys()),
+                "in_flight": [
+                    {"user_id": uid, "running_s": round(time.monotonic() - started, 3)}
+                    for uid, started in self._in_flight.items()
+                ],
+                "last_trained": dict(self._last_trained),
+                "counters": dict(self._counters),
+                "max_workers": self.max_workers,
+                "executor": self.executor_kind,
+            }
+            if user_id is not None:
+                uid = int(user_id)
+                out["user"] = {
+                    "queued": uid in self._pending,
+                    "in_flight": uid in self._in_flight,
+                    "last_trained": self._last_trained.get(uid),
+                    "last_error": self._last_error.get(uid),
+                }
+            return out
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Block until nothing is queued or running (used by admin/dev endpoints)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cv:
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cv.wait(remaining)
+            return True
+
+    def shutdown(self) -> None:
+        with self._cv:
+            self._stopped = True
+            self._cv.notify_all()
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _ensure_started(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped = False
+            self._thread = threading.Thread(target=self._loop, name="training-scheduler", daemon=True)
+            self._thread.start()
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.executor_kind == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="trainer")
+            else:
+                # spawn: forking a process that already runs uvicorn/torch threads is unsafe
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=get_context("spawn"))
+        return self._executor
+
+    def _next_ready(self):
+        """Pop the oldest queued user whose debounce window elapsed; else return the wait time"""
+        if len(self._in_flight) >= self.max_workers:
+            return None, None
+        now = time.monotonic()
+        wait = None
+        for uid, (updated, payload) in self._pending.items():
+            if uid in self._in_flight:
+                continue
+            remaining = self.debounce_s - (now - updated)
+            if remaining <= 0:
+                del self._pending[uid]
+                return (uid, payload), None
+            wait = remaining if wait is None else min(wait, remaining)
+        return None, wait
+
+    def _loop(self) -> None:
+        while True:
+            with self._cv:
+                while True:
+                    if self._stopped:
+                        return
+                    job, wait = self._next_ready()
+                    if job is not None:
+                        break
+                    self._cv.wait(wait)
+                uid, payload = job
+                self._in_flight[uid] = time.monotonic()
+                executor = self._get_executor()
+            try:
+                fut = executor.submit(self.job_fn, uid, **payload)
+            except Exception as e:
+                self._finish(uid, None, e)
+                continue
+            fut.add_done_callback(partial(self._on_done, uid))
+
+    def _on_done(self, uid: int, fut) -> None:
+        try:
+            result, error = fut.result(), None
+        except Exception as e:
+            result, error = None, e
+        self._finish(uid, result, error)
+
+    def _finish(self, uid: int, result: Optional[Dict[str, Any]], error: Optional[BaseException]) -> None:
+        if error is None and self.on_result is not None:
+            try:
+                self.on_result(uid, result)
+            except Exception as e:
+                error = e
+        # the job ran, but a model it was asked to train did not: still apply
+        # what did train (above), but count and report it as a failure
+        reported = (result or {}).get("error") if error is None else None
+        with self._cv:
+            self._in_flight.pop(uid, None)
+            if reported is not None:
+                self._counters["failed"] += 1
+                self._last_error[uid] = reported
+                log.error(f"[TRAIN] job for user={uid} failed: {reported}")
+            elif error is None:
+                self._counters["completed"] += 1
+                self._last_trained[uid] = datetime.now(timezone.utc).isoformat()
+                self._last_error.pop(uid, None)
+            else:
+                self._counters["failed"] += 1
+                self._last_error[uid] = f"{type(error).__name__}: {error}"
+                log.error(f"[TRAIN] job for user={uid} failed: {error}")
+                traceback.print_exception(type(error), error, error.__traceback__)
+                if isinstance(error, BrokenProcessPool):
+                    self._executor = None
+            self._cv.notify_all()
+
+
+def scheduler_from_env(on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None) -> TrainingScheduler:
+    return TrainingScheduler(
+        on_result=on_result,
+        max_workers=int(os.getenv("TRAIN_WORKERS", "1")),
+        debounce_s=float(os.getenv("TRAIN_DEBOUNCE_S", "0.5")),
+        executor=os.getenv("TRAIN_EXECUTOR", "process"),
+    )
@@ -0,0 +1,209 @@
+from __future__ import annotations
+import json
+import mmap
+import os
+import zipfile
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+# Objectives whose prediction is the raw margin, and those that apply a sigmoid.
+_IDENTITY = {"reg:squarederror", "reg:absoluteerror", "reg:pseudohubererror", "reg:linear"}
+_LOGISTIC = {"reg:logistic", "binary:logistic"}
+ARRAY_KEYS = ("feature", "threshold", "left", "default_left", "value", "roots")
+
+
+def _float(v) -> float:
+    """xgboost writes base_score as "5E-1" or, since 2.x, as "[5E-1]\""""
+    return float(str(v).strip("[]"))
+
+
+class TreeEnsemble:
+    """
+    An xgboost gbtree model flattened into NumPy node arrays.
+
+    Every tree's nodes live in one set of arrays; `roots` holds each tree's
+    first node. Leaves point to themselves, so walking all trees `depth`
+    steps in lockstep lands every row on its leaf in each tree without
+    per-tree branching. Splits follow xgboost: left when x < threshold,
+    `default_left` when x is missing (NaN), compared in float32; leaf values
+    are accumulated in the same order and precision, so margins match
+    xgboost's bit for bit.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], base_margin: float, depth: int,
+                 objective: str, feature_names: Optional[List[str]] = None):
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.default_left = arrays["default_left"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+        self.base_margin = float(base_margin)
+        self.depth = int(depth)
+        self.objective = objective
+        self.feature_names = list(feature_names) if feature_names else None
+
+    @property
+    def n_trees(self) -> int:
+        return int(len(self.roots))
+
+    @property
+    def nbytes(self) -> int:
+        return int(sum(getattr(self, k).nbytes for k in ARRAY_KEYS))
+
+    @classmethod
+    def from_json(cls, model: Dict[str, Any], n_trees: Optional[int] = None) -> "TreeEnsemble":
+        """From xgboost's JSON model (Booster.save_raw("json") / save_model("*.json"))"""
+        learner = model["learner"]
+        booster = learner["gradient_booster"]
+        if booster.get("name") != "gbtree":
+            raise ValueError(f"only gbtree boosters can be compiled, not {booster.get('name')}")
+        objective = learner["objective"]["name"]
+        if objective not in _IDENTITY | _LOGISTIC:
+            raise ValueError(f"unsupported objective {objective}")
+        trees = booster["model"]["trees"]
+        if n_trees is not None:
+            trees = trees[: int(n_trees)]
+
+        parts: Dict[str, List[np.ndarray]] = {k: [] for k in ARRAY_KEYS if k != "roots"}
+        roots, depth, offset = [], 0, 0
+        for tree in trees:
+            if any(int(t) != 0 for t in tree.get("split_type", [])):
+                raise ValueError("categorical splits are not supported")
+            flat, tree_depth = _flatten_tree(tree, offset)
+            for k, v in flat.items():
+                parts[k].append(v)
+            roots.append(offset)
+            depth = max(depth, tree_depth)
+            offset += len(flat["left"])
+
+        dtypes = {
+            "feature": np.intp, "threshold": np.float32, "left": np.intp, "default_left": bool, "value": np.float32,
+        }
+        arrays = {k: np.concatenate(v).astype(dtypes[k]) if v else np.zeros(0, dtypes[k]) for k, v in parts.items()}
+        arrays["roots"] = np.asarray(roots, dtype=np.intp)
+        base_score = _float(learner["learner_model_param"]["base_score"])
+        base_margin = np.log(base_score / (1.0 - base_score)) if objective in _LOGISTIC else base_score
+        return cls(arrays, base_margin, depth, objective, learner.get("feature_names") or None)
+
+    @classmethod
+    def from_booster(cls, booster, n_trees: Optional[int] = None) -> "TreeEnsemble":
+        return cls.from_json(json.loads(bytes(booster.save_raw("json"))), n_trees)
+
+    @classmethod
+    def from_json_file(cls, path: str) -> "TreeEnsemble":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_json(json.load(f))
+
+    def save(self, path: str) -> None:
+        """Node arrays as an uncompressed .npz (loadable memory-mapped)"""
+        tmp = path + ".tmp.npz"
+        meta = {"base_margin": self.base_margin, "depth": self.depth, "objective": self.objective,
+                "feature_names": self.feature_names}
+        np.savez(tmp, meta=np.array(json.dumps(meta)), **{k: getattr(self, k) for k in ARRAY_KEYS})
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = False) -> "TreeEnsemble":
+        """With mmap=True the node arrays are read-only views of the file, shared through the page cache"""
+        with np.load(path, allow_pickle=False) as z:
+            meta = json.loads(str(z["meta"]))
+            arrays = _npz_memmaps(path, ARRAY_KEYS) if mmap else {k: z[k] for k in ARRAY_KEYS}
+        return cls(arrays, meta["base_margin"], meta["depth"], meta["objective"], meta.get("feature_names"))
+
+    def predict_margin(self, X, block_nodes: int = 1 << 18) -> np.ndarray:
+        """Raw margins for X (rows, features); rows are walked in blocks of ~block_nodes (row, tree) pairs"""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        n, n_features = X.shape
+        out = np.empty(n, dtype=np.float32)
+        if not self.n_trees:
+            out[:] = self.base_margin
+            return out
+        step = max(1, block_nodes // self.n_trees)
+        for lo in range(0, n, step):
+            xb = X[lo: lo + step]
+            if np.isposinf(xb).any():
+                # +inf must still take the right branch everywhere but stay put on a leaf
+                xb = np.minimum(xb, np.finfo(np.float32).max)
+            flat = xb.ravel()
+            has_nan = bool(np.isnan(flat).any())
+            row_base = (np.arange(len(xb), dtype=np.intp) * n_features)[:, None]
+            node = np.repeat(self.roots[None, :], len(xb), axis=0)
+            for _ in range(self.depth):
+                x = flat.take(row_base + self.feature.take(node))
+                go_left = x < self.threshold.take(node)
+                if has_nan:
+                    go_left |= np.isnan(x) & self.default_left.take(node)
+                node = self.left.take(node) + ~go_left
+            # xgboost adds each tree's leaf to the base margin in float32, in tree order
+            leaves = np.empty((len(xb), self.n_trees + 1), dtype=np.float32)
+            leaves[:, 0] = self.base_margin
+            leaves[:, 1:] = self.value.take(node)
+            out[lo: lo + step] = leaves.cumsum(axis=1, dtype=np.float32)[:, -1]
+        return out
+
+    def predict(self, X) -> np.ndarray:
+        margin = self.predict_margin(X)
+        if self.objective in _LOGISTIC:
+            return (1.0 / (1.0 + np.exp(-margin.astype(np.float64)))).astype(np.float32)
+        return margin
+
+
+def _npz_memmaps(path: str, keys) -> Dict[str, np.ndarray]:
+    """
+    Read-only arrays over one mmap of an uncompressed .npz. np.load ignores
+    mmap_mode for archives, so each member's .npy data is located inside the
+    zip (local header, then the .npy header) and viewed in place.
+    """
+    out: Dict[str, np.ndarray] = {}
+    fmt = np.lib.format
+    with zipfile.ZipFile(path) as zf, open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        for key in keys:
+            info = zf.getinfo(key + ".npy")
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{key} is compressed in {path}; cannot memory-map it")
+            local = mm[info.header_offset: info.header_offset + 30]
+            f.seek(info.header_offset + 30 + int.from_bytes(local[26:28], "little") + int.from_bytes(local[28:30], "little"))
+            read_header = fmt.read_array_header_1_0 if fmt.read_magic(f) == (1, 0) else fmt.read_array_header_2_0
+            shape, fortran, dtype = read_header(f)
+            arr = np.frombuffer(mm, dtype=dtype, count=int(np.prod(shape)), offset=f.tell())
+            out[key] = arr.reshape(shape, order="F" if fortran else "C")
+    return out
+
+
+def _flatten_tree(tree: Dict[str, Any], offset: int):
+    """
+    One xgboost tree renumbered breadth-first so a node's children are
+    adjacent (right = left + 1). Leaves loop to themselves: threshold +inf
+    and default_left keep every row on them. Returns (arrays, depth).
+    """
+    lc, rc = tree["left_children"], tree["right_children"]
+    split_idx, cond, dleft = tree["split_indices"], tree["split_conditions"], tree["default_left"]
+    order, depth_of = [0], {0: 0}
+    for nid in order:
+        if lc[nid] != -1:
+            order += [lc[nid], rc[nid]]
+            depth_of[lc[nid]] = depth_of[rc[nid]] = depth_of[nid] + 1
+    new_id = {nid: offset + i for i, nid in enumerate(order)}
+    n = len(order)
+    out = {
+        "feature": np.zeros(n, dtype=np.intp),
+        "threshold": np.full(n, np.inf, dtype=np.float32),
+        "left": np.zeros(n, dtype=np.intp),
+        "default_left": np.ones(n, dtype=bool),
+        "value": np.zeros(n, dtype=np.float32),
+    }
+    for i, nid in enumerate(order):
+        if lc[nid] == -1:
+            out["left"][i] = offset + i
+            # a leaf's split_conditions entry is its value
+            out["value"][i] = cond[nid]
+        else:
+            out["feature"][i] = split_idx[nid]
+            out["threshold"][i] = cond[nid]
+            out["left"][i] = new_id[lc[nid]]
+            out["default_left"][i] = bool(int(dleft[nid]))
+    return out, max(depth_of.values())
@@ -0,0 +1,122 @@
+from __future__ import annotations
+import hashlib
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+def _default_sizer(value: Any) -> int:
+    nbytes = getattr(value, "nbytes", None)
+    return int(nbytes) if nbytes is not None else sys.getsizeof(value)
+
+
+class ByteLRUCache:
+    """
+    Thread-safe LRU cache bounded by total estimated bytes, with optional TTL.
+
+    `sizer(value)` is evaluated once on put. Entries older than `ttl_s` are
+    treated as misses and dropped on access. Counters are exposed via `stats`.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl_s: Optional[float] = None,
+        sizer: Callable[[Any], int] = _default_sizer,
+    ):
+        self.max_bytes = int(max_bytes)
+        self.ttl_s = float(ttl_s) if ttl_s else None
+        self.sizer = sizer
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _count=False) is not None
+
+    def get(self, key: Hashable, default: Any = None, _count: bool = True) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_s is not None and time.monotonic() - entry[2] > self.ttl_s:
+                self._drop(key)
+                self._counters["expirations"] += 1
+                entry = None
+            if entry is None:
+                if _count:
+                    self._counters["misses"] += 1
+                return default
+            self._entries.move_to_end(key)
+            if _count:
+                self._counters["hits"] += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        nbytes = max(0, int(self.sizer(value)))
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if nbytes > self.max_bytes:
+                # would evict everything else and still not fit
+                self._counters["evictions"] += 1
+                return
+            self._entries[key] = (value, nbytes, time.monotonic())
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self._counters["evictions"] += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._drop(key)
+            return entry[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl_s,
+                **self._counters,
+                "hit_rate": round(self._counters["hits"] / lookups, 4) if lookups else None,
+            }
+
+    def _drop(self, key: Hashable) -> None:
+        _, nbytes, _ = self._entries.pop(key)
+        self._bytes -= nbytes
+
+
+def fingerprint(*parts: Any) -> str:
+    """Stable hex digest of JSON-able parts (anything else is hashed by str())"""
+    blob = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(blob.encode(), digest_size=16).hexdigest()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header value covers etag (weak comparison, as for GET)"""
+    if not if_none_match:
+        return False
+    bare = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == bare:
+            return True
+    return False
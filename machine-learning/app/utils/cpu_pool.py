@@ -0,0 +1,103 @@
+from __future__ import annotations
+import asyncio
+import os
+import threading
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from multiprocessing import get_context
+from typing import Any, Callable, Dict
+
+
+class PoolSaturated(Exception):
+    """Every worker is busy and the wait queue is full; callers should shed load (429)"""
+
+
+class CPUPool:
+    """
+    Bounded pool for the CPU-heavy stages of request handlers.
+
+    `await pool.run(fn, *args)` runs fn on a worker process (or thread) and
+    frees the event loop meanwhile. At most `max_workers` jobs run at once
+    and `max_queue` more may wait; past that `run` raises PoolSaturated at
+    once instead of queueing without limit. With executor="process", fn and
+    its arguments must be picklable (top-level functions, plain data).
+    """
+
+    def __init__(self, max_workers: int, max_queue: int = 0, executor: str = "process"):
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self.executor_kind = executor
+        self._lock = threading.Lock()
+        self._executor = None
+        self._active = 0
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+
+    @property
+    def shares_memory(self) -> bool:
+        """Whether jobs see this process's objects (thread workers) rather than pickled copies"""
+        return self.executor_kind == "thread"
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.shares_memory:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="cpu")
+            else:
+                # spawn: forking a process that already runs uvicorn/torch threads is unsafe
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=get_context("spawn"))
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        with self._lock:
+            if self._active >= self.max_workers + self.max_queue:
+                self._counters["rejected"] += 1
+                raise PoolSaturated(f"{self._active} CPU jobs in flight")
+            self._active += 1
+            self._counters["submitted"] += 1
+            executor = self._get_executor()
+        try:
+            future = executor.submit(partial(fn, *args, **kwargs))
+        except BaseException as e:
+            with self._lock:
+                self._active -= 1
+                self._counters["failed"] += 1
+                if isinstance(e, BrokenProcessPool) and self._executor is executor:
+                    self._executor = None
+            raise
+        # the slot is held until the job itself ends: a cancelled await (client
+        # gone) stops waiting, but a job already running keeps its worker busy
+        future.add_done_callback(partial(self._release, executor))
+        return await asyncio.wrap_future(future)
+
+    def _release(self, executor, future) -> None:
+        error = CancelledError() if future.cancelled() else future.exception()
+        with self._lock:
+            self._active -= 1
+            self._counters["failed" if error is not None else "completed"] += 1
+            if isinstance(error, BrokenProcessPool) and self._executor is executor:
+                self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "executor": self.executor_kind,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                **self._counters,
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def cpu_pool_from_env() -> CPUPool:
+    workers = int(os.getenv("CPU_POOL_WORKERS", str(os.cpu_count() or 2)))
+    return CPUPool(
+        max_workers=workers,
+        max_queue=int(os.getenv("CPU_POOL_QUEUE", str(2 * workers))),
+        executor=os.getenv("CPU_POOL_EXECUTOR", "process"),
+    )
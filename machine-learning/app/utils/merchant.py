@@ -99,9 +99,8 @@ def purchase_delta_to_score(preds: Sequence[float], purchases: pd.DataFrame, bas
     return np.array(scores, dtype="float32"), impacts
 
 # ---------- NEW: per-day MONEY adjustments (dollars/day) ----------
-def _estimate_coffee_weekly_savings(prior14: pd.DataFrame) -> float:
-    coffee_mask = prior14["merchant_n"].isin(COFFEE_MERCHANTS)
-    weekly_spend = float(prior14.loc[coffee_mask, "amount"].sum()) * (7.0 / max(14.0, 1.0))
+def _estimate_coffee_weekly_savings(coffee_spend_14d: float) -> float:
+    weekly_spend = float(coffee_spend_14d) * (7.0 / max(14.0, 1.0))
     if weekly_spend <= 0:
         weekly_spend = 25.0  # fallback
     # assume ~60% capture if replacing outside coffee with home-brew
@@ -131,14 +130,26 @@ def build_money_adjustments(purchases: Sequence, days_horizon: int) -> Tuple[np.
     df["description_n"] = df["description"].map(_norm)
     df["ts"] = pd.to_datetime(df["ts"])
 
-    for _, row in df.iterrows():
-        merchant = row["merchant_n"]
-        category = row["category_n"]
-        description = row["description_n"]
-        amount = float(row["amount"])
-        ts = row["ts"]
-
-        meta = classify_purchase_semantics(row["merchant"], row["category"], row.get("description", ""))
+    # prior14 (coffee spend in the 14 days before a purchase) via binary search
+    # over the coffee rows sorted by time, instead of filtering the frame per row
+    ts = df["ts"].to_numpy(dtype="datetime64[ns]")
+    amounts = df["amount"].astype("float64").to_numpy()
+    coffee_pos = np.flatnonzero(df["merchant_n"].isin(COFFEE_MERCHANTS).to_numpy())
+    by_time = coffee_pos[np.argsort(ts[coffee_pos], kind="stable")]
+    coffee_ts = ts[by_time]
+    window_lo = np.searchsorted(coffee_ts, ts - np.timedelta64(14, "D"), side="left")
+    window_hi = np.searchsorted(coffee_ts, ts, side="left")
+    semantics: Dict[Tuple, dict] = {}
+
+    for i, (raw_merchant, raw_category, raw_description, merchant, description) in enumerate(zip(
+        df["merchant"].tolist(), df["category"].tolist(), df["description"].tolist(),
+        df["merchant_n"].tolist(), df["description_n"].tolist(),
+    )):
+        amount = float(amounts[i])
+        key = (raw_merchant, raw_category, raw_description)
+        meta = semantics.get(key)
+        if meta is None:
+            meta = semantics[key] = classify_purchase_semantics(raw_merchant, raw_category, raw_description)
         relation = meta.get("relation", "other")
         necessity = float(meta.get("necessity", 0.3))
         payback_days = int(meta.get("payback_days", 0))
@@ -146,8 +157,9 @@ def build_money_adjustments(purchases: Sequence, days_horizon: int) -> Tuple[np.
 
         # Substitutes / durables → positive daily savings ramp (e.g., Keurig replaces Starbucks)
         if relation == "substitute" or (merchant in LONG_TERM_HINTS or any(k in description for k in DURABLE_KEYWORDS)):
-            prior14 = df[(df["ts"] < ts) & (df["ts"] >= ts - pd.Timedelta(days=14))]
-            weekly_savings = _estimate_coffee_weekly_savings(prior14)
+            # summed in frame order, as the per-row filter did
+            prior14 = np.sort(by_time[window_lo[i]:window_hi[i]])
+            weekly_savings = _estimate_coffee_weekly_savings(amounts[prior14].sum())
             target_daily_savings = weekly_savings / 7.0  # $/day at full effect
             # if LLM provided stronger signal (big durable), mildly scale with price & necessity
             target_daily_savings *= (0.8 + 0.4 * necessity) * (1.0 + min(amount, 400.0)/1000.0)
@@ -167,7 +179,7 @@ def build_money_adjustments(purchases: Sequence, days_horizon: int) -> Tuple[np.
 
                 notes.append({
                     "type": "substitute_gain",
-                    "merchant": row["merchant"],
+                    "merchant": raw_merchant,
                     "amount": amount,
                     "start_day": int(start),
                     "ramp_days": int(end - start),
@@ -180,11 +192,10 @@ def build_money_adjustments(purchases: Sequence, days_horizon: int) -> Tuple[np.
             start = min(delay_days, steps - 1)
             per_day_cost = monthly_comp / 30.0
             per_day_cost *= (0.7 + 0.6 * necessity)  # essentials hit harder
-            for t in range(start, steps):
-                daily_adj[t] -= per_day_cost
+            daily_adj[start:] -= per_day_cost
             notes.append({
                 "type": "complement_cost",
-                "merchant": row["merchant"],
+                "merchant": raw_merchant,
                 "monthly_comp": monthly_comp,
                 "start_day": int(start),
                 "per_day_cost": float(per_day_cost),
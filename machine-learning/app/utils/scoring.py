@@ -110,16 +110,27 @@ def llm_cashflow_adjustments_usd(
     if df.empty:
         return adj
     
-    np.random.seed(42)
-    base_variation = np.random.normal(0, 0.8, steps)
-    
-    for _, row in df.iterrows():
-        merchant = row["merchant"] if "merchant" in row.index else ""
-        category = row["category"] if "category" in row.index else ""
-        description = row["description"] if "description" in row.index else ""
-        amount = float(row["amount"]) if "amount" in row.index else 0.0
+    # Same draws, in the same order, as seeding the global RNG with 42 and
+    # drawing one normal per (purchase, day): RandomState.normal(size=k)
+    # yields exactly k successive scalar draws. A local RandomState keeps
+    # concurrent requests from reseeding each other.
+    rng = np.random.RandomState(42)
+    base_variation = rng.normal(0, 0.8, steps)
+    t_all = np.arange(steps)
+    weekly = 1.0 + 0.5 * np.sin(2 * np.pi * t_all / 7)
+    monthly = 1.0 + 0.6 * np.sin(2 * np.pi * t_all / 30)
+
+    column = lambda c, default: df[c].tolist() if c in df.columns else [default] * len(df)
+    semantics: Dict[Tuple, dict] = {}
 
-        meta = classify_purchase_semantics(merchant, category, description)
+    for merchant, category, description, amount in zip(
+        column("merchant", ""), column("category", ""), column("description", ""), column("amount", 0.0)
+    ):
+        amount = float(amount)
+        key = (merchant, category, description)
+        meta = semantics.get(key)
+        if meta is None:
+            meta = semantics[key] = classify_purchase_semantics(merchant, category, description)
         relation = meta.get("relation", "other")
         payback_days = int(meta.get("payback_days", 0))
         monthly_comp = float(meta.get("est_monthly_complement_cost", 0.0))
@@ -128,32 +139,18 @@ def llm_cashflow_adjustments_usd(
         if relation == "substitute":
             base_daily_saving = min(15.0, 0.25 * (amount / 30.0))
             start = min(max(payback_days, 0), steps - 1)
-            
-            actual_start = min(start + np.random.randint(-5, 6), steps - 1)
-            actual_start = max(0, actual_start)
-            
-            for t in range(actual_start, steps):
-                days_since_start = t - actual_start
-                base_ramp = 1.0 / (1.0 + np.exp(-0.1 * (days_since_start - 5)))
-                
-                weekly_factor = 1.0 + 0.5 * np.sin(2 * np.pi * t / 7)
-                
-                variation_factor = 1.0 + 0.3 * np.random.normal(0, 1)
-                
-                daily_saving = base_daily_saving * base_ramp * weekly_factor * variation_factor
-                adj[t] += daily_saving
+            start = max(0, min(start + rng.randint(-5, 6), steps - 1))
+
+            base_ramp = 1.0 / (1.0 + np.exp(-0.1 * (t_all[:steps - start] - 5)))
+            variation_factor = 1.0 + 0.3 * rng.normal(0, 1, steps - start)
+            adj[start:] += base_daily_saving * base_ramp * weekly[start:] * variation_factor
 
         elif relation == "complement" and monthly_comp > 0:
             base_per_day = (monthly_comp / 30.0) * (1.2 + 0.8 * necessity)
-            start = min(7 + np.random.randint(0, 8), steps - 1)
-            
-            for t in range(start, steps):
-                monthly_factor = 1.0 + 0.6 * np.sin(2 * np.pi * t / 30)
-                
-                variation_factor = 1.0 + 0.4 * np.random.normal(0, 1)
-                
-                per_day = base_per_day * monthly_factor * variation_factor
-                adj[t] -= per_day
+            start = min(7 + rng.randint(0, 8), steps - 1)
+
+            variation_factor = 1.0 + 0.4 * rng.normal(0, 1, steps - start)
+            adj[start:] -= base_per_day * monthly[start:] * variation_factor
 
     salary_effect = 2.0 * np.sin(2 * np.pi * np.arange(steps) / 30) * np.exp(-np.arange(steps) / 30)
     adj += salary_effect
@@ -0,0 +1,262 @@
+from __future__ import annotations
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Request telemetry without extra dependencies: a queue-backed logger (the
+# request thread only enqueues; one listener thread writes), Prometheus text
+# format counters/histograms for /metrics, and per-request stage spans that
+# feed both the histograms and an opt-in Server-Timing header.
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_TRACE: "ContextVar[Optional[Trace]]" = ContextVar("coach_trace", default=None)
+_LISTENER: Optional[logging.handlers.QueueListener] = None
+_LOG_LOCK = threading.Lock()
+
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace = _TRACE.get()
+        record.request_id = trace.request_id if trace is not None else "-"
+        return True
+
+
+def configure_logging(level: Optional[str] = None) -> None:
+    """Route the "coach" loggers through a queue to stdout; LOG_LEVEL sets the level (default INFO)"""
+    global _LISTENER
+    with _LOG_LOCK:
+        if _LISTENER is not None:
+            return
+        root = logging.getLogger("coach")
+        root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+        root.propagate = False
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+        q: "queue.SimpleQueue" = queue.SimpleQueue()
+        handler = logging.handlers.QueueHandler(q)
+        handler.addFilter(_RequestIdFilter())
+        root.addHandler(handler)
+        _LISTENER = logging.handlers.QueueListener(q, stream, respect_handler_level=True)
+        _LISTENER.start()
+        atexit.register(_LISTENER.stop)
+
+
+def get_logger(name: str) -> logging.Logger:
+    configure_logging()
+    return logging.getLogger(f"coach.{name}")
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.labelnames, key)} {value}" for key, value in items]
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, rendered in Prometheus text format"""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        i = next((i for i, b in enumerate(self.buckets) if value <= b), len(self.buckets))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def snapshot(self, **labels: str) -> Tuple[int, float]:
+        """(count, sum) for one label set"""
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            return (sum(series[0]), series[1]) if series else (0, 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in items:
+            running = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                running += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {running}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {running}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for m in metrics for line in m.render()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+REQUEST_SECONDS = REGISTRY.histogram("coach_request_seconds", "HTTP request latency", ("route", "method", "status"))
+STAGE_SECONDS = REGISTRY.histogram("coach_stage_seconds", "Time spent in one stage of a request", ("route", "stage"))
+
+
+class Trace:
+    """Stages of one request, in the order they finished"""
+
+    __slots__ = ("scope", "request_id", "started", "stages")
+
+    def __init__(self, scope: Optional[dict] = None, request_id: Optional[str] = None):
+        self.scope = scope
+        self.request_id = request_id or uuid.uuid4().hex[:16]
+        self.started = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get("route") if self.scope is not None else None
+        return getattr(route, "path", None) or "unmatched"
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages.append((stage, seconds))
+        STAGE_SECONDS.observe(seconds, route=self.route, stage=stage)
+
+    def server_timing(self) -> str:
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.2f}")
+        return ", ".join(parts)
+
+
+def current_trace() -> Optional[Trace]:
+    return _TRACE.get()
+
+
+def record(stage: str, seconds: float) -> None:
+    """Add a finished stage to the current request (or just the histogram outside one)"""
+    trace = _TRACE.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+    else:
+        STAGE_SECONDS.observe(seconds, route="-", stage=stage)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - t0)
+
+
+class StageTimer:
+    """Lap timer: timer("x") records the time since the previous lap (or creation) as stage x"""
+
+    __slots__ = ("_last",)
+
+    def __init__(self):
+        self._last = time.perf_counter()
+
+    def __call__(self, stage: str) -> float:
+        now = time.perf_counter()
+        seconds, self._last = now - self._last, now
+        record(stage, seconds)
+        return seconds
+
+
+class TelemetryMiddleware:
+    """
+    ASGI middleware: one Trace per HTTP request (visible to handlers and the
+    threads they start through the context), request latency by matched
+    route, an X-Request-Id header (the caller's, or a new one), and a
+    Server-Timing header listing the stages when server_timing is on or the
+    request sends "X-Server-Timing: 1".
+    """
+
+    def __init__(self, app, server_timing: bool = False, log: Optional[logging.Logger] = None):
+        self.app = app
+        self.server_timing = server_timing
+        self.log = log
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        rid = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or None
+        trace = Trace(scope, rid)
+        token = _TRACE.set(trace)
+        want_timing = self.server_timing or headers.get(b"x-server-timing") == b"1"
+        status = 500
+
+        async def send_with_headers(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                extra = [(b"x-request-id", trace.request_id.encode("latin-1"))]
+                if want_timing:
+                    extra.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                message = {**message, "headers": list(message.get("headers") or []) + extra}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            elapsed = time.perf_counter() - trace.started
+            REQUEST_SECONDS.observe(elapsed, route=trace.route, method=scope.get("method", ""), status=str(status))
+            if self.log is not None and trace.stages:
+                stages = " ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in trace.stages)
+                self.log.info(f"{scope.get('method')} {trace.route} {status} {elapsed * 1000:.1f}ms {stages}")
+            _TRACE.reset(token)
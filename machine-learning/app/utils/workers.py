@@ -0,0 +1,215 @@
+from __future__ import annotations
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+    _HAS_FCNTL = True
+except Exception:
+    _HAS_FCNTL = False
+
+from app.utils.telemetry import get_logger
+
+log = get_logger("workers")
+
+
+def worker_count() -> int:
+    """Server processes sharing MODEL_DIR: ML_WORKERS, else WEB_CONCURRENCY (set by uvicorn/gunicorn setups), else 1"""
+    return max(1, int(os.getenv("ML_WORKERS") or os.getenv("WEB_CONCURRENCY") or "1"))
+
+
+class TrainerLease:
+    """
+    Non-blocking exclusive lock on a file: whichever server process holds it
+    trains and writes artifacts. The OS drops the lock when its holder exits,
+    so another process takes over on its next try_acquire. Without fcntl
+    (non-POSIX) the lock always succeeds, i.e. one process is assumed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def try_acquire(self) -> bool:
+        if self._file is not None:
+            return True
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        f = open(self.path, "a+")
+        if _HAS_FCNTL:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                return False
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        self._file = f
+        return True
+
+    def holder(self) -> Optional[int]:
+        """pid written by the current (or last) holder"""
+        try:
+            with open(self.path, "r") as f:
+                return int(f.read().strip() or 0) or None
+        except (OSError, ValueError):
+            return None
+
+    def release(self) -> None:
+        f, self._file = self._file, None
+        if f is not None:
+            if _HAS_FCNTL:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+
+
+class TrainingSpool:
+    """
+    Training requests handed from serving processes to the trainer: one JSON
+    file per user under root. A request for a user who already has one
+    pending merges into it (latest fields win, `from_row` keeps the smaller
+    value), so a burst of purchases is trained once.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, user_id: int) -> str:
+        return os.path.join(self.root, f"{int(user_id)}.json")
+
+    def _locked(self):
+        os.makedirs(self.root, exist_ok=True)
+        f = open(os.path.join(self.root, "LOCK"), "a")
+        if _HAS_FCNTL:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def put(self, user_id: int, job: Dict[str, Any]) -> None:
+        path = self._path(user_id)
+        with self._locked():
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    queued = json.load(f)
+            except (OSError, ValueError):
+                queued = {}
+            merged = {**queued, **job}
+            if "from_row" in queued and "from_row" in job:
+                merged["from_row"] = min(int(queued["from_row"]), int(job["from_row"]))
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(merged, f)
+            os.replace(tmp, path)
+
+    def pending(self) -> int:
+        try:
+            return sum(1 for name in os.listdir(self.root) if name.endswith(".json"))
+        except FileNotFoundError:
+            return 0
+
+    def drain(self) -> List[Tuple[int, Dict[str, Any]]]:
+        """Take every pending request (each file is removed as it is read)"""
+        if not os.path.isdir(self.root):
+            return []
+        out: List[Tuple[int, Dict[str, Any]]] = []
+        with self._locked():
+            for name in sorted(os.listdir(self.root)):
+                stem = name[:-len(".json")]
+                if not name.endswith(".json") or not stem.isdigit():
+                    continue
+                path = os.path.join(self.root, name)
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        out.append((int(stem), json.load(f)))
+                except (OSError, ValueError) as e:
+                    log.warning(f"dropping unreadable training request {path}: {e}")
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return out
+
+
+class TrainerCoordinator:
+    """
+    Decides which of several server processes trains.
+
+    With a lease, the process holding it is the trainer: a daemon thread
+    keeps trying to take the lease (so a survivor takes over when the
+    trainer dies) and, while this process holds it, passes requests spooled
+    by the other processes to on_job(user_id, job). Without a lease (one
+    server process) this process is always the trainer.
+    """
+
+    def __init__(
+        self,
+        lease: Optional[TrainerLease],
+        spool: TrainingSpool,
+        on_job: Callable[[int, Dict[str, Any]], None],
+        interval_s: float = 1.0,
+    ):
+        self.lease = lease
+        self.spool = spool
+        self.on_job = on_job
+        self.interval_s = float(interval_s)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._counters = {"spooled": 0, "drained": 0, "failed": 0}
+
+    @property
+    def is_trainer(self) -> bool:
+        return self.lease is None or self.lease.held
+
+    def spool_job(self, user_id: int, job: Dict[str, Any]) -> None:
+        self.spool.put(user_id, job)
+        self._counters["spooled"] += 1
+
+    def start(self) -> "TrainerCoordinator":
+        self.check()
+        if self._thread is None and self.lease is not None:
+            self._thread = threading.Thread(target=self._run, name="trainer-coordinator", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval_s + 1.0)
+            self._thread = None
+        if self.lease is not None:
+            self.lease.release()
+
+    def check(self) -> int:
+        """Take the lease if it is free, then run spooled jobs if this is the trainer; returns jobs run"""
+        if self.lease is not None and not self.lease.held and self.lease.try_acquire():
+            log.info(f"[TRAIN] process {os.getpid()} is the trainer")
+        if not self.is_trainer:
+            return 0
+        jobs = self.spool.drain()
+        for uid, job in jobs:
+            self._counters["drained"] += 1
+            try:
+                self.on_job(uid, job)
+            except Exception as e:
+                self._counters["failed"] += 1
+                log.warning(f"spooled training request for user {uid} failed: {e}")
+        return len(jobs)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            self.check()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "is_trainer": self.is_trainer,
+            "trainer_pid": self.lease.holder() if self.lease is not None else os.getpid(),
+            "pending": self.spool.pending(),
+            **self._counters,
+        }
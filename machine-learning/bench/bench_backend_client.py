@@ -0,0 +1,94 @@
+"""
+Backend round trips and latency for N concurrent /dashboard reads of one user:
+bare requests.get (the old get_all_data) vs the pooled, coalescing clients.
+
+    python -m bench.bench_backend_client [--concurrency 32] [--rounds 5] [--latency-ms 50]
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from app.data.backend_client import _HAS_HTTPX, AsyncBackendClient, BackendClient
+from bench.stub_backend import StubBackend
+
+
+def _run_threads(fn, concurrency: int, rounds: int, pause_s: float):
+    lat = []
+    with ThreadPoolExecutor(concurrency) as pool:
+        for _ in range(rounds):
+            def one(_):
+                t0 = time.perf_counter()
+                fn()
+                return time.perf_counter() - t0
+            lat.extend(pool.map(one, range(concurrency)))
+            time.sleep(pause_s)
+    return lat
+
+
+def _summary(name: str, stub: StubBackend, lat, wall: float, n: int):
+    lat = sorted(lat)
+    return {
+        "client": name,
+        "requests": n,
+        "backend_round_trips": stub.hits,
+        "p50_ms": round(lat[len(lat) // 2] * 1000, 2),
+        "p99_ms": round(lat[min(len(lat) - 1, int(len(lat) * 0.99))] * 1000, 2),
+        "wall_s": round(wall, 3),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--rounds", type=int, default=5)
+    ap.add_argument("--latency-ms", type=float, default=50.0)
+    ap.add_argument("--cache-ttl-s", type=float, default=0.0, help="0 measures coalescing alone")
+    args = ap.parse_args()
+    n = args.concurrency * args.rounds
+    latency = args.latency_ms / 1000.0
+    # sleep past the TTL between rounds so each round is a fresh burst
+    pause = args.cache_ttl_s + 0.01
+
+    with StubBackend(latency_s=latency) as stub:
+        t0 = time.perf_counter()
+        lat = _run_threads(lambda: requests.get(f"{stub.url}/dashboard/1", timeout=5).json(), args.concurrency, args.rounds, pause)
+        print(json.dumps(_summary("requests.get", stub, lat, time.perf_counter() - t0, n)))
+
+    with StubBackend(latency_s=latency) as stub:
+        client = BackendClient(stub.url, pool_size=args.concurrency, cache_ttl_s=args.cache_ttl_s)
+        t0 = time.perf_counter()
+        lat = _run_threads(lambda: client.get_dashboard(1), args.concurrency, args.rounds, pause)
+        print(json.dumps(_summary("BackendClient", stub, lat, time.perf_counter() - t0, n)))
+        client.close()
+
+    if not _HAS_HTTPX:
+        return
+
+    async def run_async(url: str):
+        client = AsyncBackendClient(url, pool_size=args.concurrency, cache_ttl_s=args.cache_ttl_s)
+        lat = []
+
+        async def one():
+            t0 = time.perf_counter()
+            await client.get_dashboard(1)
+            lat.append(time.perf_counter() - t0)
+
+        for _ in range(args.rounds):
+            await asyncio.gather(*(one() for _ in range(args.concurrency)))
+            await asyncio.sleep(pause)
+        await client.aclose()
+        return lat
+
+    with StubBackend(latency_s=latency) as stub:
+        t0 = time.perf_counter()
+        lat = asyncio.run(run_async(stub.url))
+        print(json.dumps(_summary("AsyncBackendClient", stub, lat, time.perf_counter() - t0, n)))
+
+
+if __name__ == "__main__":
+    main()
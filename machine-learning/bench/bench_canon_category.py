@@ -0,0 +1,106 @@
+"""
+Category canonicalization: the old per-row Series.apply over a linear alias
+scan vs the compiled priority regex + memo over distinct strings.
+
+    python -m bench.bench_canon_category [--rows 1000000]
+"""
+from __future__ import annotations
+import argparse
+import json
+import time
+import numpy as np
+import pandas as pd
+
+from app.features import featureizer
+from app.features.featureizer import _ALIASES, canonicalize_categories
+from bench.synth import _CATEGORY_LABELS, merchant_pool
+
+
+def legacy_canon(raw: str) -> str:
+    """_to_canon_category before the compiled matcher"""
+    if not raw:
+        return "other"
+    s = raw.strip().lower()
+    if s in _ALIASES:
+        return _ALIASES[s]
+    for k, v in _ALIASES.items():
+        if k in s:
+            return v
+    if "rent" in s or "mortgage" in s:
+        return "rent"
+    if any(t in s for t in ["power", "gas", "water", "internet", "wifi", "electric", "utility"]):
+        return "utilities"
+    if any(t in s for t in [
+        "restaurant", "resturant", "cafe", "coffee", "eat", "food", "deli", "pizza", "bar", "grill", "dash", "eats"
+    ]):
+        return "restaurants"
+    if any(t in s for t in ["movie", "netflix", "spotify", "concert", "amc", "theatre"]):
+        return "entertainment"
+    if any(t in s for t in ["grocery", "mart", "market", "costco", "target", "walmart", "trader joe", "whole foods"]):
+        return "groceries"
+    return "other"
+
+
+def legacy_canonicalize(df: pd.DataFrame) -> pd.Series:
+    src = df["category"].fillna("") + " " + df["merchant"].fillna("")
+    return src.apply(legacy_canon)
+
+
+def adversarial_strings(rng: np.random.Generator, n: int):
+    """Strings holding several needles in random order and case, to pin precedence"""
+    needles = [r[0] for r in featureizer._KEYWORD_RULES] + ["", " ", "Zzz", "rentco", "Trader Joe's"]
+    out = []
+    for _ in range(n):
+        k = int(rng.integers(0, 4))
+        parts = [needles[i] for i in rng.integers(0, len(needles), k)]
+        s = " ".join(p.upper() if rng.random() < 0.3 else p for p in parts)
+        out.append(("  " if rng.random() < 0.2 else "") + s)
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--adversarial", type=int, default=50_000)
+    args = ap.parse_args()
+    rng = np.random.default_rng(0)
+
+    cats = _CATEGORY_LABELS + ["Rent/Mortgage", "Utilities", "Food & Drink", None]
+    merchants = merchant_pool() + [None, "", "  WALMART  ", "Joe's Grill & Bar"]
+    df = pd.DataFrame({
+        "category": pd.Series([cats[i] for i in rng.integers(0, len(cats), args.rows)], dtype=object),
+        "merchant": pd.Series([merchants[i] for i in rng.integers(0, len(merchants), args.rows)], dtype=object),
+    })
+
+    featureizer._canon_normalized.cache_clear()
+    t0 = time.perf_counter()
+    ref = legacy_canonicalize(df)
+    t_legacy = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    got = canonicalize_categories(df)["canon_category"]
+    t_new = time.perf_counter() - t0
+
+    if not np.array_equal(ref.to_numpy(dtype=object), got.to_numpy(dtype=object)):
+        raise SystemExit("canonical categories differ from the legacy implementation")
+
+    adv = adversarial_strings(rng, args.adversarial)
+    mismatches = [s for s in adv if legacy_canon(s) != featureizer._to_canon_category(s)]
+    if mismatches:
+        raise SystemExit(f"precedence differs on {len(mismatches)} strings, e.g. {mismatches[:3]!r}")
+
+    print(json.dumps({
+        "rows": args.rows,
+        "distinct_strings": int(got.size and pd.unique(df["category"].fillna("") + " " + df["merchant"].fillna("")).size),
+        "legacy_s": round(t_legacy, 3),
+        "compiled_memo_s": round(t_new, 3),
+        "speedup": round(t_legacy / t_new, 1),
+        "legacy_rows_per_s": round(args.rows / t_legacy),
+        "compiled_rows_per_s": round(args.rows / t_new),
+        "adversarial_checked": len(adv),
+        "identical": True,
+    }))
+
+
+if __name__ == "__main__":
+    main()
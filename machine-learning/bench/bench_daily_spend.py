@@ -0,0 +1,92 @@
+"""
+Per-request cost of the 60-day daily-spend series: the old pandas
+resample (run three times per /get_graph_data) vs one columnar pass vs the
+incremental update after a single appended purchase.
+
+    python -m bench.bench_daily_spend [--sizes 100 1000 10000] [--repeat 50]
+"""
+from __future__ import annotations
+import argparse
+import json
+import time
+import numpy as np
+import pandas as pd
+
+from app.data.purchase_store import PurchaseHistory, ROW_DTYPE
+from app.features.daily_spend import DailySpendCache, daily_spend_from_history
+from app.features.featureizer import parse_timestamps
+from bench.synth import synth_purchases
+
+
+def pandas_series(hist: PurchaseHistory) -> np.ndarray:
+    """The resample path previously inlined in main.py and train_scheduler.py"""
+    df_hist = hist.to_frame()
+    df_hist["ts"] = parse_timestamps(df_hist["ts"])
+    df_hist["amount"] = pd.to_numeric(df_hist["amount"], errors="coerce")
+    df_hist = df_hist.dropna(subset=["ts"]).sort_values("ts")
+    daily_spend = df_hist.set_index("ts")["amount"].resample("D").sum()
+    last_ts = pd.to_datetime(df_hist["ts"].max()).normalize()
+    idx = pd.date_range(end=last_ts, periods=60, freq="D")
+    return daily_spend.reindex(idx, fill_value=0.0).values.astype(float)
+
+
+def _build(records) -> PurchaseHistory:
+    hist = PurchaseHistory(np.zeros(0, dtype=ROW_DTYPE), [])
+    for r in records:
+        hist = hist.appended(r)
+    return hist
+
+
+def _time(fn, repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    ap.add_argument("--repeat", type=int, default=50)
+    args = ap.parse_args()
+
+    for n in args.sizes:
+        records = synth_purchases(n + 1, seed=n)
+        hist = _build(records[:n])
+        grown = hist.appended(records[n])
+
+        ref = pandas_series(grown)
+        full = daily_spend_from_history(grown).values
+        cache = DailySpendCache()
+        cache.get(1, hist)
+        inc = cache.get(1, grown).values
+        if cache.counters["incremental"] != 1:
+            raise SystemExit("incremental path not taken")
+        max_diff = float(max(np.max(np.abs(ref - full)), np.max(np.abs(ref - inc))))
+        if max_diff > 1e-6:
+            raise SystemExit(f"daily spend differs from the pandas reference at n={n}: {max_diff}")
+
+        t_pandas = _time(lambda: pandas_series(grown), args.repeat)
+        t_full = _time(lambda: daily_spend_from_history(grown), args.repeat)
+
+        def incremental():
+            c = DailySpendCache()
+            c.cache.put(1, daily_spend_from_history(hist))
+            t0 = time.perf_counter()
+            c.get(1, grown)
+            return time.perf_counter() - t0
+        t_inc = float(np.mean([incremental() for _ in range(args.repeat)]))
+
+        print(json.dumps({
+            "purchases": n,
+            "pandas_x3_ms": round(3 * t_pandas * 1000, 3),
+            "single_pass_ms": round(t_full * 1000, 3),
+            "incremental_ms": round(t_inc * 1000, 4),
+            "speedup_single_vs_x3": round(3 * t_pandas / t_full, 1),
+            "speedup_incremental_vs_x3": round(3 * t_pandas / t_inc, 1),
+            "max_abs_diff": max_diff,
+        }))
+
+
+if __name__ == "__main__":
+    main()
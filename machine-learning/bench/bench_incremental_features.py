@@ -0,0 +1,81 @@
+"""
+Purchase features after one appended purchase: the full make_purchase_features
+pass /get_graph_data used to run vs extending the incremental ring-buffer state.
+Also checks the incremental rows (live and reloaded from a snapshot) against
+the batch featurizer.
+
+    python -m bench.bench_incremental_features [--sizes 100 1000 10000] [--repeat 20]
+"""
+from __future__ import annotations
+import argparse
+import json
+import tempfile
+import time
+import numpy as np
+
+from app.data.purchase_store import PurchaseHistory, ROW_DTYPE
+from app.features.featureizer import make_purchase_features
+from app.features.incremental import IncrementalFeatureCache, IncrementalFeatures, consistency_check
+from bench.synth import synth_purchases
+
+
+def _build(records) -> PurchaseHistory:
+    hist = PurchaseHistory(np.zeros(0, dtype=ROW_DTYPE), [])
+    for r in records:
+        hist = hist.appended(r)
+    return hist
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--grow", type=int, default=50, help="purchases appended one by one before the check")
+    args = ap.parse_args()
+
+    for n in args.sizes:
+        records = synth_purchases(n + args.grow, seed=n)
+        base = _build(records[:n])
+        snap = tempfile.mkdtemp(prefix="bench_feats_")
+        cache = IncrementalFeatureCache(snapshot_dir=snap)
+        cache.get(1, base)
+        hist = base
+        for r in records[n:]:
+            hist = hist.appended(r)
+            cache.get(1, hist)
+        if cache.counters["incremental"] != args.grow or cache.counters["full"] != 1:
+            raise SystemExit(f"unexpected rebuilds: {cache.counters}")
+        live = consistency_check(hist, cache.get(1, hist))
+        reloaded = consistency_check(hist, IncrementalFeatures.load(f"{snap}/features_1"))
+        if not (live["ok"] and reloaded["ok"]):
+            raise SystemExit(f"incremental features differ from batch at n={n}: {live} {reloaded}")
+
+        frame = hist.to_frame()
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            make_purchase_features(frame, income=5000.0)
+        t_batch = (time.perf_counter() - t0) / args.repeat
+
+        state = IncrementalFeatures.from_history(base)
+        t_push = []
+        for r in records[n: n + args.repeat]:
+            t0 = time.perf_counter()
+            state.push(r)
+            t_push.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        state.frame(5000.0)
+        t_frame = time.perf_counter() - t0
+
+        print(json.dumps({
+            "purchases": n,
+            "batch_ms": round(t_batch * 1000, 3),
+            "incremental_row_ms": round(float(np.mean(t_push)) * 1000, 4),
+            "frame_ms": round(t_frame * 1000, 3),
+            "speedup_row": round(t_batch / float(np.mean(t_push)), 1),
+            "max_abs_diff": live["max_abs_diff"],
+            "snapshot_max_abs_diff": reloaded["max_abs_diff"],
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Cold-start load time and size of the model artifacts: the pickled joblib
+bundle + training_data.pkl that ModelRetrainer used to write vs the native
+booster (model.ubj + model_config.json) and the columnar training_data.npz.
+Also checks that both load to identical predictions and history.
+
+    python -m bench.bench_model_load [--trees 400 1200] [--history 1000]
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import tempfile
+import time
+import warnings
+import joblib
+import numpy as np
+import pandas as pd
+
+from app.data.record_columns import load_records, save_records
+from app.models.gbm import GBMRegressor
+from app.models.model_retrainer import ModelRetrainer
+from bench.synth import synth_purchases
+
+
+def _per_call_ms(fn, budget_s: float = 1.0) -> float:
+    fn()
+    n, t0 = 0, time.perf_counter()
+    while time.perf_counter() - t0 < budget_s or n < 3:
+        fn()
+        n += 1
+    return (time.perf_counter() - t0) / n * 1000
+
+
+def _save_legacy(gbm: GBMRegressor, out_dir: str) -> None:
+    """The pre-native GBMRegressor.save bundle"""
+    joblib.dump(
+        {
+            "model_type": gbm.model_type,
+            "sk_model": gbm.model,
+            "feature_order": gbm.feature_order,
+            "random_state": gbm.random_state,
+            "params": gbm.params(),
+            "incremental_state": gbm.incremental_state(),
+            "engine": gbm.engine,
+        },
+        os.path.join(out_dir, "model.joblib"),
+    )
+
+
+def _load(in_dir: str) -> GBMRegressor:
+    gbm = GBMRegressor()
+    gbm.load(in_dir)
+    return gbm
+
+
+def _size(*paths: str) -> int:
+    return sum(os.path.getsize(p) for p in paths)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--trees", type=int, nargs="+", default=[400, 1200])
+    ap.add_argument("--history", type=int, default=1000)
+    args = ap.parse_args()
+    # unpickling an xgboost model warns on every load
+    warnings.filterwarnings("ignore", category=UserWarning)
+
+    retrainer = ModelRetrainer(tempfile.mkdtemp(prefix="bench_load_"), load=False)
+    history = []
+    for p in synth_purchases(args.history, seed=3):
+        p = dict(p)
+        p["target_score"] = retrainer.calculate_target_score(p, p["user_income"])
+        history.append(p)
+    X, y = retrainer.prepare_training_batch(history)
+    X_score = X.astype(np.float32).to_numpy()
+
+    for n_trees in args.trees:
+        gbm = GBMRegressor(n_estimators=n_trees)
+        gbm.feature_order = list(X.columns)
+        gbm.fit(X, y)
+        legacy_dir, native_dir = tempfile.mkdtemp(prefix="legacy_"), tempfile.mkdtemp(prefix="native_")
+        _save_legacy(gbm, legacy_dir)
+        gbm.save(native_dir)
+
+        ref = gbm.predict(X_score)
+        if not (np.array_equal(ref, _load(legacy_dir).predict(X_score))
+                and np.array_equal(ref, _load(native_dir).predict(X_score))):
+            raise SystemExit("reloaded models predict differently")
+
+        t_save_legacy = _per_call_ms(lambda: _save_legacy(gbm, legacy_dir))
+        t_save_native = _per_call_ms(lambda: gbm.save(native_dir))
+        t_legacy = _per_call_ms(lambda: _load(legacy_dir))
+        t_native = _per_call_ms(lambda: _load(native_dir))
+        print(json.dumps({
+            "artifact": "model",
+            "trees": n_trees,
+            "joblib_bytes": _size(os.path.join(legacy_dir, "model.joblib")),
+            "native_bytes": _size(os.path.join(native_dir, "model.ubj"), os.path.join(native_dir, "model_config.json")),
+            "joblib_load_ms": round(t_legacy, 3),
+            "native_load_ms": round(t_native, 3),
+            "load_speedup": round(t_legacy / t_native, 2),
+            "joblib_save_ms": round(t_save_legacy, 3),
+            "native_save_ms": round(t_save_native, 3),
+            "identical": True,
+        }))
+
+    out_dir = tempfile.mkdtemp(prefix="history_")
+    pkl, npz = os.path.join(out_dir, "training_data.pkl"), os.path.join(out_dir, "training_data.npz")
+    joblib.dump(history, pkl)
+    save_records(npz, history)
+    if load_records(npz) != joblib.load(pkl):
+        raise SystemExit("columnar history differs from the pickled one")
+    t_pkl = _per_call_ms(lambda: joblib.load(pkl))
+    t_npz = _per_call_ms(lambda: load_records(npz))
+    print(json.dumps({
+        "artifact": "training_history",
+        "rows": len(history),
+        "pkl_bytes": _size(pkl),
+        "npz_bytes": _size(npz),
+        "pkl_load_ms": round(t_pkl, 3),
+        "npz_load_ms": round(t_npz, 3),
+        "pkl_save_ms": round(_per_call_ms(lambda: joblib.dump(history, pkl)), 3),
+        "npz_save_ms": round(_per_call_ms(lambda: save_records(npz, history)), 3),
+        "identical": True,
+    }))
+    # the sample artifacts shipped in model_artifacts still load
+    shipped = os.path.join(os.path.dirname(os.path.dirname(__file__)), "model_artifacts")
+    if os.path.exists(os.path.join(shipped, "model.joblib")):
+        print(json.dumps({"artifact": "model_artifacts/model.joblib", "loads": _load(shipped).is_fitted,
+                          "joblib_load_ms": round(_per_call_ms(lambda: _load(shipped)), 3)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Row-wise vs batched training-feature construction in ModelRetrainer.
+
+    python -m bench.bench_retrain_features [--sizes 1000 10000 100000] [--rowwise-max 2000]
+"""
+from __future__ import annotations
+import argparse
+import json
+import time
+import numpy as np
+import pandas as pd
+
+from app.models.model_retrainer import ModelRetrainer
+from bench.synth import synth_purchases
+
+
+def _with_targets(retrainer: ModelRetrainer, rows):
+    for r in rows:
+        r["target_score"] = retrainer.calculate_target_score(r, r["user_income"])
+    return rows
+
+
+def rowwise(retrainer: ModelRetrainer, rows):
+    feats, targets = [], []
+    for purchase in rows:
+        f = retrainer.prepare_training_data([purchase], purchase["user_income"])
+        if not f.empty:
+            feats.append(f.iloc[0])
+            targets.append(purchase["target_score"])
+    return pd.DataFrame(feats).reset_index(drop=True), np.array(targets)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    ap.add_argument("--rowwise-max", type=int, default=2000, help="skip the slow row-wise path above this size")
+    args = ap.parse_args()
+
+    retrainer = ModelRetrainer.__new__(ModelRetrainer)
+    results = []
+    for n in args.sizes:
+        rows = _with_targets(retrainer, synth_purchases(n, n_users=max(1, n // 200), seed=n))
+
+        t0 = time.perf_counter()
+        X_b, y_b = retrainer.prepare_training_batch(rows)
+        t_batch = time.perf_counter() - t0
+        res = {"rows": n, "batch_s": round(t_batch, 4), "batch_rows_per_s": round(n / t_batch, 1)}
+
+        if n <= args.rowwise_max:
+            t0 = time.perf_counter()
+            X_r, y_r = rowwise(retrainer, rows)
+            t_row = time.perf_counter() - t0
+            identical = X_r.columns.equals(X_b.columns) and np.array_equal(X_r.to_numpy(), X_b.to_numpy()) and np.array_equal(y_r, y_b)
+            res.update({"rowwise_s": round(t_row, 4), "rowwise_rows_per_s": round(n / t_row, 1),
+                        "speedup": round(t_row / t_batch, 1), "bit_identical": bool(identical)})
+            if not identical:
+                raise SystemExit(f"batched features differ from row-wise features at n={n}")
+        results.append(res)
+        print(json.dumps(res))
+
+
+if __name__ == "__main__":
+    main()
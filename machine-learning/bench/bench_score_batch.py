@@ -0,0 +1,71 @@
+"""
+Rescoring many users: one featurize + predict per user (what N calls to the
+single-user endpoints cost in CPU) vs /score_batch's grouped single pass.
+
+    python -m bench.bench_score_batch [--users 100 2000] [--per-user 30]
+"""
+from __future__ import annotations
+import argparse
+import json
+import time
+import numpy as np
+import pandas as pd
+
+from app.features.featureizer import make_purchase_features, parse_timestamps
+from app.models.batch_scorer import purchases_frame, score_frame
+from app.models.gbm import GBMRegressor
+from bench.synth import synth_purchases
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, nargs="+", default=[100, 2000])
+    ap.add_argument("--per-user", type=int, default=30)
+    args = ap.parse_args()
+
+    train = pd.DataFrame(synth_purchases(3000, seed=1))
+    train["ts"] = parse_timestamps(train["ts"])
+    gbm = GBMRegressor(n_estimators=400)
+    gbm.fit(make_purchase_features(train, income=5000.0), np.random.default_rng(0).normal(700, 40, len(train)))
+
+    for n_users in args.users:
+        records = []
+        for u in range(n_users):
+            for r in synth_purchases(args.per_user, seed=u):
+                r["user_id"] = u
+                r["income"] = r.pop("user_income")
+                records.append(r)
+
+        t0 = time.perf_counter()
+        ref = {}
+        by_user = pd.DataFrame(records)
+        by_user["pos"] = np.arange(len(by_user))
+        for _, sub in by_user.groupby("user_id"):
+            sub = sub.copy()
+            sub["ts"] = parse_timestamps(sub["ts"])
+            scores = gbm.predict(make_purchase_features(sub, income=sub["income"].to_numpy()))
+            ref.update(zip(sub["pos"].tolist(), scores.tolist()))
+        t_loop = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        lines = b"".join(score_frame(purchases_frame(records), lambda uid: gbm)).splitlines()
+        t_batch = time.perf_counter() - t0
+
+        got = {d["index"]: d["score"] for d in map(json.loads, lines)}
+        max_diff = max(abs(ref[i] - got[i]) for i in ref)
+        if len(got) != len(records) or max_diff > 1e-4:
+            raise SystemExit(f"batch scores differ from per-user scoring: {max_diff}")
+
+        print(json.dumps({
+            "users": n_users,
+            "rows": len(records),
+            "per_user_s": round(t_loop, 3),
+            "batch_s": round(t_batch, 3),
+            "speedup": round(t_loop / t_batch, 1),
+            "batch_rows_per_s": round(len(records) / t_batch),
+            "max_abs_diff": max_diff,
+        }))
+
+
+if __name__ == "__main__":
+    main()
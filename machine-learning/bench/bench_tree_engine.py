@@ -0,0 +1,91 @@
+"""
+GBM inference latency: GBMRegressor.predict through the xgboost sklearn
+wrapper vs the flattened NumPy TreeEnsemble, at batch sizes 1, 32 and 10k.
+Also checks that the two agree bit for bit, on a freshly trained model and on
+the xgboost_booster.json export in model_artifacts.
+
+    python -m bench.bench_tree_engine [--batches 1 32 10000]
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from app.features.featureizer import make_feature_matrix, parse_timestamps
+from app.models.gbm import GBMRegressor
+from app.models.tree_engine import TreeEnsemble
+from bench.synth import synth_purchases
+
+BOOSTER_JSON = os.path.join(os.path.dirname(os.path.dirname(__file__)), "model_artifacts", "xgboost_booster.json")
+
+
+def _per_call_ms(fn, X, budget_s: float = 1.0) -> float:
+    fn(X)
+    n, t0 = 0, time.perf_counter()
+    while time.perf_counter() - t0 < budget_s or n < 3:
+        fn(X)
+        n += 1
+    return (time.perf_counter() - t0) / n * 1000
+
+
+def check_artifact(rng: np.random.Generator) -> dict:
+    booster = xgb.Booster()
+    booster.load_model(BOOSTER_JSON)
+    ens = TreeEnsemble.from_json_file(BOOSTER_JSON)
+    n_features = booster.num_features()
+    X = (rng.normal(0, 1, (20000, n_features)) * rng.choice([1, 10, 100, 1000], n_features)).astype(np.float32)
+    X[rng.random(X.shape) < 0.05] = np.nan
+    ref = booster.inplace_predict(X)
+    got = ens.predict(X)
+
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_trees_"), "trees.npz")
+    ens.save(path)
+    mapped = TreeEnsemble.load(path, mmap=True).predict(X)
+    if not (np.array_equal(ref, got) and np.array_equal(ref, mapped)):
+        raise SystemExit(f"TreeEnsemble differs from xgboost on {BOOSTER_JSON}")
+    return {"artifact_trees": ens.n_trees, "artifact_nodes": int(len(ens.feature)), "artifact_identical": True}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--batches", type=int, nargs="+", default=[1, 32, 10000])
+    args = ap.parse_args()
+    rng = np.random.default_rng(0)
+    print(json.dumps(check_artifact(rng)))
+
+    train = pd.DataFrame(synth_purchases(5000, seed=1))
+    train["ts"] = parse_timestamps(train["ts"])
+    X_train = make_feature_matrix(train, income=5000.0)
+    gbm = GBMRegressor(n_estimators=400, engine="xgboost")
+    gbm.fit(X_train, rng.normal(700, 40, len(X_train)))
+
+    score = pd.DataFrame(synth_purchases(max(args.batches), seed=2))
+    score["ts"] = parse_timestamps(score["ts"])
+    X_all = make_feature_matrix(score, income=5000.0)
+
+    fast = GBMRegressor(n_estimators=400, engine="numpy")
+    fast.model, fast.is_fitted = gbm.model, True
+    if not np.array_equal(gbm.predict(X_all), fast.predict(X_all)):
+        raise SystemExit("TreeEnsemble differs from xgboost on the trained model")
+
+    for n in args.batches:
+        X = np.ascontiguousarray(X_all[:n])
+        t_xgb = _per_call_ms(gbm.predict, X)
+        t_np = _per_call_ms(fast.predict, X)
+        print(json.dumps({
+            "batch": n,
+            "trees": fast.compiled().n_trees,
+            "xgboost_ms": round(t_xgb, 4),
+            "tree_engine_ms": round(t_np, 4),
+            "speedup": round(t_xgb / t_np, 2),
+            "identical": True,
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Memory per server process when K processes serve the same N per-user
+models: each loading its own xgboost boosters (single-worker mode) vs
+memory-mapping each version's trees.npz (multi-worker mode, ML_WORKERS>1).
+Numbers come from /proc/self/smaps_rollup, measured after imports and again
+with every model loaded and used once, while all K processes are alive:
+private = memory only that process holds; pss = its share of everything.
+
+    python -m bench.bench_workers [--users 40] [--workers 4] [--trees 400]
+"""
+from __future__ import annotations
+import argparse
+import json
+import multiprocessing as mp
+import os
+import tempfile
+import warnings
+
+import numpy as np
+
+
+def _smaps() -> dict:
+    out = {}
+    with open("/proc/self/smaps_rollup", "r") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                out[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return {"rss": out["Rss"], "pss": out["Pss"], "private": out.get("Private_Clean", 0) + out.get("Private_Dirty", 0)}
+
+
+def _serve(root: str, n_users: int, serve_only: bool, X: np.ndarray, barrier, results) -> None:
+    # the shipped model_artifacts hold an old pickled model that warns on load
+    warnings.filterwarnings("ignore", category=UserWarning)
+    from app.models.model_retrainer import ModelRetrainer
+
+    before = _smaps()
+    retrainers = [ModelRetrainer(os.path.join(root, str(u)), serve_only=serve_only) for u in range(n_users)]
+    preds = [r.model.predict(X) for r in retrainers]
+    barrier.wait()
+    after = _smaps()
+    barrier.wait()
+    results.put({"before": before, "after": after, "checksum": float(np.sum([p.sum() for p in preds], dtype=np.float64))})
+
+
+def prepare(n_users: int, n_trees: int):
+    """N user dirs, each with a published version of the same fitted model, plus a scoring batch"""
+    from app.models.gbm import GBMRegressor
+    from app.models.model_retrainer import ModelRetrainer
+    from bench.synth import synth_purchases
+
+    root = tempfile.mkdtemp(prefix="bench_workers_")
+    base = ModelRetrainer(os.path.join(root, "base"), load=False)
+    history = []
+    for p in synth_purchases(1000, seed=5):
+        p = dict(p)
+        p["target_score"] = base.calculate_target_score(p, p["user_income"])
+        history.append(p)
+    X, y = base.prepare_training_batch(history)
+    gbm = GBMRegressor(n_estimators=n_trees)
+    gbm.feature_order = list(X.columns)
+    gbm.fit(X, y)
+    for u in range(n_users):
+        ModelRetrainer(os.path.join(root, str(u)), load=False).store.publish(gbm.save)
+    return root, X.astype(np.float32).to_numpy()[:20]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=40)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--trees", type=int, default=400)
+    args = ap.parse_args()
+    warnings.filterwarnings("ignore", category=UserWarning)
+
+    root, X = prepare(args.users, args.trees)
+    ctx = mp.get_context("spawn")
+    checksums = {}
+    for serve_only in (False, True):
+        barrier, results = ctx.Barrier(args.workers), ctx.Queue()
+        procs = [ctx.Process(target=_serve, args=(root, args.users, serve_only, X, barrier, results)) for _ in range(args.workers)]
+        for p in procs:
+            p.start()
+        rows = [results.get(timeout=600) for _ in procs]
+        for p in procs:
+            p.join()
+        checksums[serve_only] = {r["checksum"] for r in rows}
+        mb = lambda key, when: round(float(np.mean([r[when][key] for r in rows])) / 2**20, 2)
+        print(json.dumps({
+            "mode": "mmap_trees" if serve_only else "booster",
+            "users": args.users,
+            "workers": args.workers,
+            "trees": args.trees,
+            "models_private_mb_per_worker": round(mb("private", "after") - mb("private", "before"), 2),
+            "models_pss_mb_per_worker": round(mb("pss", "after") - mb("pss", "before"), 2),
+            "private_mb_per_worker": mb("private", "after"),
+            "pss_mb_per_worker": mb("pss", "after"),
+            "rss_mb_per_worker": mb("rss", "after"),
+        }))
+    if len(checksums[False] | checksums[True]) != 1:
+        raise SystemExit(f"modes predict differently: {checksums}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Load test for /get_graph_data: N concurrent users hammering a real uvicorn
+server whose backend is the local stub. Each run starts a fresh server on a
+temp MODEL_DIR with a trained base model and seeded purchase histories, and
+reports throughput, latency percentiles, status counts (429 = shed by the
+CPU pool) and the pool's counters.
+
+    python -m bench.load_test [--users 50] [--duration 20] [--executor process thread]
+                              [--cpu-workers N] [--cpu-queue M] [--graph-cache]
+
+By default each user's dashboard stays the same, so no retrains run during
+the measurement, and the graph response cache is off so every request does
+the full feature/predict/forecast work.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+
+from app.data.purchase_store import PurchaseStore
+from app.models.model_retrainer import ModelRetrainer
+from bench.stub_backend import StubBackend
+from bench.synth import synth_purchases
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def prepare_model_dir(n_users: int, history: int) -> str:
+    """Temp MODEL_DIR with a published base model and `history` purchases per user"""
+    model_dir = tempfile.mkdtemp(prefix="load_test_")
+    retrainer = ModelRetrainer(model_dir, load=False)
+    retrainer.retrain_model(synth_purchases(300, seed=1), 5000.0, incremental=False)
+    store = PurchaseStore(model_dir)
+    for uid in range(1, n_users + 1):
+        records = [dict(r, user_id=uid) for r in synth_purchases(history, seed=uid, start="2025-05-01")]
+        store.write(uid, records)
+    return model_dir
+
+
+def start_server(port: int, env: dict) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env={**os.environ, **env}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit("server did not come up")
+
+
+async def _wait_training_idle(client: httpx.AsyncClient, timeout_s: float = 300) -> None:
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        training = (await client.get("/model_status", headers={"X-User-Id": "1"})).json().get("training", {})
+        if not training.get("queue_depth") and not training.get("in_flight"):
+            return
+        await asyncio.sleep(0.5)
+
+
+async def run_load(base_url: str, n_users: int, duration_s: float) -> dict:
+    limits = httpx.Limits(max_connections=n_users, max_keepalive_connections=n_users)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        # first call per user merges the dashboard purchase and may queue a retrain
+        gate = asyncio.Semaphore(4)
+
+        async def warm(uid: int) -> None:
+            async with gate:
+                for _ in range(20):
+                    try:
+                        if (await client.get("/get_graph_data", headers={"X-User-Id": str(uid)})).status_code != 429:
+                            return
+                    except httpx.TransportError:
+                        pass
+                    await asyncio.sleep(0.2)
+
+        await asyncio.gather(*(warm(u) for u in range(1, n_users + 1)))
+        await _wait_training_idle(client)
+
+        latencies, statuses = [], Counter()
+        stop = time.perf_counter() + duration_s
+
+        async def user(uid: int) -> None:
+            headers = {"X-User-Id": str(uid)}
+            while time.perf_counter() < stop:
+                t0 = time.perf_counter()
+                try:
+                    resp = await client.get("/get_graph_data", headers=headers)
+                except httpx.TransportError as e:
+                    statuses[type(e).__name__] += 1
+                    continue
+                statuses[resp.status_code] += 1
+                if resp.status_code == 200:
+                    latencies.append(time.perf_counter() - t0)
+                elif resp.status_code == 429:
+                    await asyncio.sleep(float(resp.headers.get("retry-after", "1")) / 10)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(user(u) for u in range(1, n_users + 1)))
+        wall = time.perf_counter() - t0
+        stats = (await client.get("/cache_stats")).json()
+
+    latencies.sort()
+    pct = lambda q: round(latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000, 1) if latencies else None
+    return {
+        "ok_per_s": round(len(latencies) / wall, 1),
+        "p50_ms": pct(0.5),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "statuses": dict(statuses),
+        "cpu_pool": stats.get("cpu_pool"),
+        "graph_cache_hit_rate": stats.get("graph_responses", {}).get("hit_rate"),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--duration", type=float, default=20.0)
+    ap.add_argument("--history", type=int, default=200, help="seeded purchases per user")
+    ap.add_argument("--executor", nargs="+", default=["process", "thread"])
+    ap.add_argument("--cpu-workers", type=int, default=os.cpu_count() or 2)
+    ap.add_argument("--cpu-queue", type=int, default=None, help="default: 2 x workers")
+    ap.add_argument("--latency-ms", type=float, default=20.0, help="stub backend latency")
+    ap.add_argument("--graph-cache", action="store_true", help="leave the graph response cache on")
+    args = ap.parse_args()
+
+    model_dir = prepare_model_dir(args.users, args.history)
+    with StubBackend(latency_s=args.latency_ms / 1000.0, purchase_every=0) as stub:
+        for executor in args.executor:
+            port = _free_port()
+            env = {
+                "MODEL_DIR": model_dir,
+                "BACKEND_URL": stub.url,
+                "BACKEND_CACHE_TTL_S": "0",
+                "CPU_POOL_EXECUTOR": executor,
+                "CPU_POOL_WORKERS": str(args.cpu_workers),
+                "CPU_POOL_QUEUE": str(args.cpu_queue if args.cpu_queue is not None else 2 * args.cpu_workers),
+                "GRAPH_CACHE_MAX_BYTES": str(32 * 1024 * 1024 if args.graph_cache else 0),
+                "ARTIFACT_WATCH_S": "0",
+            }
+            proc = start_server(port, env)
+            try:
+                result = asyncio.run(run_load(f"http://127.0.0.1:{port}", args.users, args.duration))
+            finally:
+                proc.terminate()
+                proc.wait(timeout=30)
+            print(json.dumps({"executor": executor, "users": args.users, "cpu_workers": args.cpu_workers, **result}))
+
+
+if __name__ == "__main__":
+    main()
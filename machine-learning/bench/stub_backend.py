@@ -0,0 +1,119 @@
+"""
+Local stand-in for the Spring backend's GET /dashboard/{user_id}.
+
+    python -m bench.stub_backend [--port 8080] [--latency-ms 50] [--purchase-every 1]
+
+or in-process:
+
+    with StubBackend(latency_s=0.05) as stub:
+        BackendClient(stub.url).get_dashboard(1)
+        stub.hits  # backend round trips served
+"""
+from __future__ import annotations
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+
+def dashboard_payload(user_id: int, tick: int = 0) -> Dict:
+    return {
+        "income": 5000,
+        "score": 700,
+        "amount": 10 + tick % 40,
+        "saved": 1000,
+        "expenditures": 1500,
+        "merchant": "Starbucks",
+        "category": "restaurants",
+        "days": 90,
+        "purchase_time": f"2025-09-{10 + tick % 15:02d}T10:{tick % 60:02d}:00",
+        "userId": int(user_id),
+    }
+
+
+class StubBackend:
+    """
+    Threaded HTTP server with fixed per-request latency and optional failures.
+    The dashboard's purchase changes every `purchase_every` requests (0: never).
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_s: float = 0.0, fail_first: int = 0,
+                 fail_status: int = 503, purchase_every: int = 1):
+        self.latency_s = latency_s
+        self.purchase_every = purchase_every
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.hits = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                parts = self.path.strip("/").split("/")
+                if len(parts) != 2 or parts[0] != "dashboard" or not parts[1].isdigit():
+                    return self._send(404, {"error": "not found"})
+                with stub._lock:
+                    stub.hits += 1
+                    tick = stub.hits
+                    failing = tick <= stub.fail_first
+                if stub.latency_s:
+                    time.sleep(stub.latency_s)
+                if failing:
+                    return self._send(stub.fail_status, {"error": "unavailable"})
+                self._send(200, dashboard_payload(int(parts[1]), tick // stub.purchase_every if stub.purchase_every else 0))
+
+            def _send(self, status: int, body: Dict):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubBackend":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "StubBackend":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8080)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--purchase-every", type=int, default=1)
+    args = ap.parse_args()
+    stub = StubBackend(args.host, args.port, latency_s=args.latency_ms / 1000.0, purchase_every=args.purchase_every)
+    print(f"stub backend on {stub.url}")
+    stub.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
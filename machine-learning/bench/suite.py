@@ -0,0 +1,317 @@
+"""
+Benchmark suite for the scoring and projection pipeline: featurizing,
+retraining, GBM prediction, LSTM training and forecasting, the money
+trajectory fit and score, and one end-to-end /get_graph_data through
+TestClient against the local stub backend. Inputs come from bench.synth
+with fixed seeds, so runs on one machine are comparable.
+
+Prints one JSON line per case on stdout (median and best milliseconds per
+call over --repeat timed samples after a warm-up); anything the models or
+their training processes print goes to stderr. When a baseline file
+exists, each best time is compared against it after factoring out the
+host's speed (see _reference): a case slower than baseline x (1 + its
+tolerance), and still slower when re-measured, is flagged and the process
+exits 1.
+
+    python -m bench.suite [--only features gbm_predict ...] [--repeat 7]
+                          [--baseline bench/baseline.json] [--save-baseline] [--tolerance T]
+                          [--json results.json]
+
+Baselines are per machine: re-record with --save-baseline after moving hosts
+or after an intentional change in cost.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from bench.synth import synth_purchases
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+INCOME = 5000.0
+
+# name -> (setup() returning the zero-argument callable to time, allowed slowdown vs baseline)
+CASES: Dict[str, Tuple[Callable[[], Callable[[], object]], float]] = {}
+
+
+def case(name: str, tolerance: float = 0.25):
+    """Register a case; cases whose time swings more from run to run get a wider tolerance"""
+    def register(setup):
+        CASES[name] = (setup, tolerance)
+        return setup
+    return register
+
+
+def _trained_retrainer():
+    from app.models.model_retrainer import ModelRetrainer
+
+    retrainer = ModelRetrainer(tempfile.mkdtemp(prefix="bench_suite_"), load=False)
+    retrainer.retrain_model(synth_purchases(1000, seed=1), INCOME, incremental=False)
+    return retrainer
+
+
+@case("features")
+def _features():
+    from app.features.featureizer import make_purchase_features
+
+    df = pd.DataFrame(synth_purchases(5000, seed=2))
+    return lambda: make_purchase_features(df, INCOME)
+
+
+@case("retrain", tolerance=0.4)
+def _retrain():
+    from app.models.model_retrainer import ModelRetrainer
+
+    history = synth_purchases(1000, seed=3)
+    return lambda: ModelRetrainer(tempfile.mkdtemp(prefix="bench_suite_"), load=False).retrain_model(
+        history, INCOME, incremental=False)
+
+
+@case("gbm_predict")
+def _gbm_predict():
+    retrainer = _trained_retrainer()
+    history = []
+    for p in synth_purchases(1000, seed=4):
+        p = dict(p)
+        p["target_score"] = retrainer.calculate_target_score(p, INCOME)
+        history.append(p)
+    X, _ = retrainer.prepare_training_batch(history)
+    model = retrainer.model
+    return lambda: model.predict(X)
+
+
+def _spend_history(seed: int, n: int = 60) -> List[float]:
+    rng = np.random.default_rng(seed)
+    return np.abs(30 + 10 * np.sin(np.arange(n) / 3.0) + rng.normal(0, 3, n)).tolist()
+
+
+@case("lstm_train", tolerance=0.5)
+def _lstm_train():
+    import torch
+    from app.models.lstm_forecaster import LSTMForecaster
+
+    hist = _spend_history(5)
+
+    def run():
+        torch.manual_seed(0)
+        LSTMForecaster(model_dir=tempfile.mkdtemp(prefix="bench_suite_")).train_model(hist)
+    return run
+
+
+@case("lstm_forecast")
+def _lstm_forecast():
+    import torch
+    from app.models.lstm_forecaster import LSTMForecaster
+
+    hist = _spend_history(6)
+    forecaster = LSTMForecaster(model_dir=tempfile.mkdtemp(prefix="bench_suite_"))
+    torch.manual_seed(0)
+    forecaster.train_model(hist)
+    return lambda: forecaster.forecast(hist, horizon=90)
+
+
+@case("fit_money_trajectory")
+def _fit_money_trajectory():
+    from app.utils.scoring import fit_money_trajectory
+
+    purchases = synth_purchases(300, seed=7, start="2025-08-01", days=30)
+    return lambda: fit_money_trajectory(1000.0, INCOME, 90, purchases)
+
+
+@case("money_correlation_score")
+def _money_correlation_score():
+    from app.utils.scoring import money_correlation_score, money_goal_curve
+
+    ideal = money_goal_curve(1000.0, 10000.0, 365)
+    proj = ideal + np.random.default_rng(8).normal(0, 50, 365).astype("float32")
+    return lambda: money_correlation_score(ideal, proj)
+
+
+@case("graph_data", tolerance=0.4)
+def _graph_data():
+    """Full request: backend fetch, history merge, scoring, forecast and projection (response cache off)"""
+    from app.models.model_retrainer import model_retrainer
+    from bench.stub_backend import StubBackend
+
+    # the shared base model, published under main()'s temp MODEL_DIR before the app loads it
+    model_retrainer.retrain_model(synth_purchases(300, seed=1), INCOME, incremental=False)
+    stub = StubBackend(purchase_every=0).__enter__()
+    os.environ.update({
+        "BACKEND_URL": stub.url,
+        "BACKEND_CACHE_TTL_S": "0",
+        "GRAPH_CACHE_MAX_BYTES": "0",
+        "CPU_POOL_EXECUTOR": "thread",
+        "ARTIFACT_WATCH_S": "0",
+    })
+    from fastapi.testclient import TestClient
+    import app.main as main
+
+    client = TestClient(main.app).__enter__()
+    headers = {"X-User-Id": "1"}
+    client.get("/get_graph_data", headers=headers)
+    main.TRAIN_SCHEDULER.wait_idle(300)
+
+    def run():
+        resp = client.get("/get_graph_data", headers=headers)
+        if resp.status_code != 200:
+            raise RuntimeError(f"/get_graph_data returned {resp.status_code}")
+    return run
+
+
+def _reference() -> Callable[[], object]:
+    """
+    Fixed workload (~50 ms) timed alongside every case to factor out the
+    host's current speed: interpreter loops, NumPy sorting and BLAS, the mix
+    the cases themselves spend their time in.
+    """
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=400_000)
+    a = rng.normal(size=(300, 300))
+
+    def run():
+        np.sort(data)
+        for _ in range(8):
+            a @ a
+        total = 0.0
+        for i in range(200_000):
+            total += i * 0.5
+        return total
+    return run
+
+
+def measure(fn: Callable[[], object], reference: Callable[[], object], repeat: int,
+            min_sample_s: float = 0.05) -> Tuple[float, float, float, int]:
+    """
+    (median, best) seconds per call of fn over `repeat` samples after one
+    warm-up call, the reference's best time, and fn's loop count. Fast
+    cases loop inside each sample until it takes min_sample_s (as timeit's
+    autorange does). Reference samples alternate with the case's, so both
+    see the host at the same speed.
+    """
+    def loops(f: Callable[[], object]) -> int:
+        t0 = time.perf_counter()
+        f()
+        return max(1, int(min_sample_s / max(time.perf_counter() - t0, 1e-6)))
+
+    def sample(f: Callable[[], object], number: int) -> float:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            f()
+        return (time.perf_counter() - t0) / number
+
+    number, ref_number = loops(fn), loops(reference)
+    times, ref_times = [], []
+    for _ in range(repeat):
+        times.append(sample(fn, number))
+        ref_times.append(sample(reference, ref_number))
+    return statistics.median(times), min(times), min(ref_times), number
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: Optional[float] = None) -> List[str]:
+    """
+    Names of cases whose best time exceeds the baseline's by more than the
+    case's tolerance (or `tolerance`, when given, for every case). The best
+    of several samples moves far less with machine load than the median
+    does, so it is what gets compared, after dividing out the change in the
+    reference workload's time (a host running slower across the board is
+    not a regression).
+    """
+    slow = []
+    for name, r in results.items():
+        ref = baseline.get(name)
+        if not ref:
+            continue
+        r["baseline_ms"] = ref["best_ms"]
+        host = r["reference_ms"] / ref["reference_ms"] if ref.get("reference_ms") else 1.0
+        r["ratio"] = round(r["best_ms"] / ref["best_ms"] / host, 3) if ref["best_ms"] else None
+        r["tolerance"] = tolerance if tolerance is not None else CASES[name][1]
+        r["regressed"] = r["ratio"] is not None and r["ratio"] > 1.0 + r["tolerance"]
+        if r["regressed"]:
+            slow.append(name)
+    return slow
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--only", nargs="+", choices=sorted(CASES), default=None)
+    ap.add_argument("--repeat", type=int, default=7)
+    ap.add_argument("--baseline", default=DEFAULT_BASELINE)
+    ap.add_argument("--save-baseline", action="store_true", help="write this run's results as the baseline")
+    ap.add_argument("--tolerance", type=float, default=None,
+                    help="allowed slowdown vs baseline for every case (0.25 = 25%%); default: per case")
+    ap.add_argument("--json", default=None, help="also write the results to this file")
+    args = ap.parse_args()
+    # before anything imports app.*: module-level state (the base retrainer,
+    # the app's stores) is rooted at MODEL_DIR
+    os.environ["MODEL_DIR"] = tempfile.mkdtemp(prefix="bench_suite_")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # the models (and the training processes the app spawns) print progress
+    # to fd 1: point it at stderr and keep the real stdout for the JSON lines
+    sys.stdout.flush()
+    out = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    warnings.filterwarnings("ignore", category=UserWarning)
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+
+    reference = _reference()
+
+    def run_case(name: str) -> dict:
+        median, best, ref_best, number = measure(CASES[name][0](), reference, args.repeat)
+        return {"case": name, "median_ms": round(median * 1000, 3), "best_ms": round(best * 1000, 3),
+                "loops": number, "reference_ms": round(ref_best * 1000, 3)}
+
+    results = {name: run_case(name) for name in args.only or list(CASES)}
+
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("cases", {})
+    slow = compare(results, baseline, args.tolerance)
+    if slow:
+        # one slow pass is often just a busy host: only a case slow twice in a row is reported
+        retry = {name: run_case(name) for name in slow}
+        slow = compare(retry, baseline, args.tolerance)
+        results.update(retry)
+    for r in results.values():
+        print(json.dumps(r), file=out, flush=True)
+    if slow:
+        print(json.dumps({"regressions": slow}), file=out, flush=True)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"cases": results, "regressions": slow}, f, indent=2)
+
+    if args.save_baseline:
+        saved = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                saved = json.load(f).get("cases", {})
+        saved.update({name: {k: r[k] for k in ("median_ms", "best_ms", "reference_ms")} for name, r in results.items()})
+        tmp = f"{args.baseline}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+                "repeat": args.repeat,
+                "cases": saved,
+            }, f, indent=2, sort_keys=True)
+            f.write("\n")
+        os.replace(tmp, args.baseline)
+    elif slow:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+from __future__ import annotations
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+
+from app.features.featureizer import _ALIASES
+from app.utils.merchant import COFFEE_MERCHANTS, DURABLE_KEYWORDS, LONG_TERM_HINTS, SHORT_TERM_HINTS
+
+_CATEGORY_LABELS = ["groceries", "rent", "utilities", "restaurants", "entertainment", "other", "", "Food", "Shopping"]
+_AMOUNT_SCALE = {"rent": 1400.0, "utilities": 90.0, "groceries": 60.0, "restaurants": 18.0, "entertainment": 25.0}
+_TS_FORMATS = ["%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S"]
+
+
+def merchant_pool() -> List[str]:
+    """Merchant names the featurizer and merchant heuristics actually key on, plus unknowns"""
+    names = set(_ALIASES) | COFFEE_MERCHANTS | LONG_TERM_HINTS | SHORT_TERM_HINTS
+    names |= {"Olive Garden", "cruise", "Shell", "Uniqlo", "Local Pizza Bar", "Corner Market"}
+    return sorted(names)
+
+
+def synth_purchases(
+    n: int,
+    n_users: int = 1,
+    seed: int = 0,
+    start: str = "2025-06-01",
+    days: int = 120,
+    incomes: Optional[List[float]] = None,
+) -> List[Dict]:
+    """Records shaped like app.main._normalize_purchase_dict output, time-ordered per user"""
+    rng = np.random.default_rng(seed)
+    merchants = merchant_pool()
+    incomes = incomes or [3200.0, 5000.0, 7500.0]
+
+    m_idx = rng.integers(0, len(merchants), n)
+    c_idx = rng.integers(0, len(_CATEGORY_LABELS), n)
+    users = np.sort(rng.integers(0, n_users, n))
+    offsets = np.sort(rng.uniform(0, days * 86400.0, n))
+    fmt_idx = rng.integers(0, len(_TS_FORMATS), n)
+    recurring = rng.random(n) < 0.08
+    durable = rng.random(n) < 0.03
+    base = pd.Timestamp(start)
+    durable_words = sorted(DURABLE_KEYWORDS)
+
+    out: List[Dict] = []
+    for i in range(n):
+        merchant = merchants[m_idx[i]]
+        category = _CATEGORY_LABELS[c_idx[i]]
+        canon = _ALIASES.get(merchant.lower(), category.lower())
+        scale = _AMOUNT_SCALE.get(canon, 40.0)
+        ts = base + pd.Timedelta(seconds=float(offsets[i]))
+        out.append({
+            "user_id": int(users[i]),
+            "ts": ts.strftime(_TS_FORMATS[fmt_idx[i]]),
+            "merchant": merchant,
+            "category": category,
+            "amount": round(float(rng.lognormal(np.log(scale), 0.6)), 2),
+            "is_recurring": bool(recurring[i]),
+            "description": durable_words[i % len(durable_words)] if durable[i] else "",
+            "user_income": float(incomes[int(users[i]) % len(incomes)]),
+        })
+    return out